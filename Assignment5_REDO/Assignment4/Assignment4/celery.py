@@ -1,18 +1,74 @@
 # celery.py
 import os
 from celery import Celery
+from celery.signals import celeryd_init
+from kombu import Queue
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'your_project_name.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Assignment4.settings')
 
 app = Celery('SonareSoma')
 
 
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
+# User-facing notifications get a queue of their own, so they never wait behind
+# bulk reports. The periodic dispatchers beat fires every few minutes run on a
+# scheduling queue, and backups and pruning on a maintenance queue. Everything else is bulk.
+TRANSACTIONAL_TASKS = [
+    'SonareSoma.tasks.notify_client_about_new_goal',
+    'SonareSoma.tasks.notify_client_of_message',
+    'SonareSoma.tasks.notify_professional_of_message',
+    'SonareSoma.tasks.notify_professional_about_client_goal',
+    'SonareSoma.tasks.send_routine_completion_certificate',
+    'SonareSoma.tasks.validate_goal_input',
+]
+SCHEDULING_TASKS = [
+    'SonareSoma.tasks.send_daily_notifications_for_slot',
+    'SonareSoma.tasks.drain_outbound_email',
+]
+MAINTENANCE_TASKS = [
+    'SonareSoma.tasks.backup_database',
+    'SonareSoma.tasks.prune_outbound_email',
+    'SonareSoma.tasks.prune_notification_ledger',
+]
+
+app.conf.task_queues = [Queue('transactional'), Queue('bulk'), Queue('scheduling'), Queue('maintenance')]
+app.conf.task_default_queue = 'bulk'
+app.conf.task_routes = {
+    **{name: {'queue': 'transactional'} for name in TRANSACTIONAL_TASKS},
+    **{name: {'queue': 'scheduling'} for name in SCHEDULING_TASKS},
+    **{name: {'queue': 'maintenance'} for name in MAINTENANCE_TASKS},
+}
+
+# Run one worker per queue, e.g. `celery -A Assignment4 worker -Q transactional -n transactional@%h`.
+# A worker consuming a single queue takes its pool size and prefetch from here, unless
+# --concurrency is given. Long bulk and maintenance tasks prefetch one message at a
+# time so a busy process never holds messages another one could run.
+QUEUE_WORKER_SETTINGS = {
+    'transactional': {'concurrency': 4, 'prefetch_multiplier': 4},
+    'bulk': {'concurrency': 2, 'prefetch_multiplier': 1},
+    # One process can sit in a drain run for most of every minute; the other dispatches slots
+    'scheduling': {'concurrency': 2, 'prefetch_multiplier': 1},
+    'maintenance': {'concurrency': 1, 'prefetch_multiplier': 1},
+}
+
+
+@celeryd_init.connect
+def configure_queue_worker(sender=None, conf=None, options=None, **kwargs):
+    queues = options.get('queues') or []
+    if isinstance(queues, str):
+        queues = queues.split(',')
+    if len(queues) != 1 or queues[0] not in QUEUE_WORKER_SETTINGS:
+        return
+    worker_settings = QUEUE_WORKER_SETTINGS[queues[0]]
+    conf.worker_prefetch_multiplier = worker_settings['prefetch_multiplier']
+    if not options.get('concurrency'):
+        conf.worker_concurrency = worker_settings['concurrency']
+
 
 app.autodiscover_tasks()
 
 
 @app.task(bind=True)
 def debug_task(self):
-    print(f'Request: {self.request!r}')
\ No newline at end of file
+    print(f'Request: {self.request!r}')
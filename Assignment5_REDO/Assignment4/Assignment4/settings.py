@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
+from celery.schedules import crontab
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -124,3 +125,84 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
+
+# Shared by every web and worker process; the food catalog's version counter lives here
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://localhost:6379/1',
+    },
+}
+
+# Notification delivery: messages per batch (sent one at a time over one connection), and retries per batch
+SONARESOMA_FROM_EMAIL = 'your_email@example.com'
+SONARESOMA_EMAIL_BATCH_SIZE = 100
+SONARESOMA_EMAIL_MAX_RETRIES = 3
+
+# Broadcast tasks dispatch one Celery chunk task per this many recipient profiles
+SONARESOMA_FANOUT_CHUNK_SIZE = 1000
+
+# backup_database task: models to back up, output directory, rows per query/bulk_create, 'gzip' or 'zstd'
+SONARESOMA_BACKUP_MODELS = ['auth.User', 'SonareSoma']
+SONARESOMA_BACKUP_EXCLUDE = [  # Queue, ledger and rebuilt-on-restore tables
+    'SonareSoma.DailyNutritionTotals',
+    'SonareSoma.DigestSection',
+    'SonareSoma.NotificationLog',
+    'SonareSoma.OutboundEmail',
+    'SonareSoma.RateLimitBucket',
+]
+SONARESOMA_BACKUP_DIR = BASE_DIR / 'backups'
+SONARESOMA_BACKUP_CHUNK_SIZE = 2000
+SONARESOMA_BACKUP_COMPRESSION = 'gzip'
+
+# Outbound mail queue: shared token bucket (emails per second and burst size), attempts per
+# queued email, how long one drain_outbound_email run may keep sending, how long a drain holds
+# the emails it is sending, and how many days sent and given-up emails are kept
+SONARESOMA_EMAIL_RATE_PER_SECOND = 10
+SONARESOMA_EMAIL_BURST = 50
+SONARESOMA_EMAIL_MAX_ATTEMPTS = 5
+SONARESOMA_EMAIL_DRAIN_SECONDS = 55
+SONARESOMA_EMAIL_LEASE_SECONDS = 300
+SONARESOMA_EMAIL_RETENTION_DAYS = 7
+SONARESOMA_NOTIFICATION_LOG_RETENTION_DAYS = 62  # Sent-notification ledger; must outlast a monthly period
+
+# Per-task metrics (wall time, queries, rows fetched, emails) are logged by SonareSoma.metrics and,
+# when a port is set, served as JSON by each worker process on the first free port from it
+SONARESOMA_METRICS_PORT = None
+SONARESOMA_METRICS_PORT_RANGE = 16
+
+# Daily reminders go out per delivery slot: the day is split into this many equal slices
+# (96 = 15 minutes) and beat fires send_daily_notifications_for_slot once per slot
+SONARESOMA_DELIVERY_SLOTS = 96
+SONARESOMA_DIGEST_HOUR = 18  # Local hour send_daily_digests runs at
+SONARESOMA_API_PAGE_SIZE = 100  # Rows per API page unless ?page_size= asks for fewer or more
+SONARESOMA_API_MAX_PAGE_SIZE = 1000
+SONARESOMA_CATALOG_CACHE = 'default'  # Must be shared between processes, see CACHES
+SONARESOMA_CATALOG_CACHE_TIMEOUT = 24 * 60 * 60
+
+# The scheduling tasks expire after one period: the next run sends whatever a dropped one would have
+CELERY_BEAT_SCHEDULE = {
+    'daily-notifications-by-slot': {
+        'task': 'SonareSoma.tasks.send_daily_notifications_for_slot',
+        'schedule': 24 * 60 * 60 / SONARESOMA_DELIVERY_SLOTS,
+        'options': {'expires': 24 * 60 * 60 / SONARESOMA_DELIVERY_SLOTS},
+    },
+    # Users with digest_only set get everything held back that day in one email
+    'send-daily-digests': {
+        'task': 'SonareSoma.tasks.send_daily_digests',
+        'schedule': crontab(hour=SONARESOMA_DIGEST_HOUR, minute=0),
+    },
+    'drain-outbound-email': {
+        'task': 'SonareSoma.tasks.drain_outbound_email',
+        'schedule': 60.0,
+        'options': {'expires': 60.0},
+    },
+    'prune-outbound-email': {
+        'task': 'SonareSoma.tasks.prune_outbound_email',
+        'schedule': crontab(hour=3, minute=30),
+    },
+    'prune-notification-ledger': {
+        'task': 'SonareSoma.tasks.prune_notification_ledger',
+        'schedule': crontab(hour=3, minute=45),
+    },
+}
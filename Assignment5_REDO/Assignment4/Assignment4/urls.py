@@ -17,12 +17,15 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from SonareSoma.views import ProfessionalViewSet, GoalViewSet, ActivityViewSet
+from SonareSoma.views import ProfessionalViewSet, GoalViewSet, ActivityViewSet, UserProfileViewSet, NutritionViewSet, FoodViewSet
 
 router = DefaultRouter()
 router.register(r'professionals', ProfessionalViewSet)
 router.register(r'goals', GoalViewSet)
 router.register(r'activities', ActivityViewSet)
+router.register(r'userprofiles', UserProfileViewSet)
+router.register(r'nutrition', NutritionViewSet)
+router.register(r'foods', FoodViewSet)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
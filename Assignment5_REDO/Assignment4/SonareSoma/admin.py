@@ -11,6 +11,11 @@ from .models import (
     Client,
     UserProfile,
     MealFood,
+    NutritionMeal,
+    RoutineActivity,
+    DailyNutritionTotals,
+    GoalProgress,
+    ActivityCompletion,
 )
 from django.utils.translation import gettext as _
 from django.contrib.auth import get_user_model
@@ -45,8 +50,9 @@ class ProfessionalAdmin(admin.ModelAdmin):
 
 @admin.register(Goal)
 class GoalAdmin(admin.ModelAdmin):
-    list_display = ('goaltype', 'goalvalue', 'startdate', 'enddate', 'client', 'professional')
+    list_display = ('goaltype', 'goalvalue', 'latest_value', 'achieved_at', 'startdate', 'enddate', 'client', 'professional')
     raw_id_fields = ('client', 'professional')
+    readonly_fields = ('latest_value', 'latest_recorded_at', 'achieved_at')
 
 @admin.register(Activity)
 class ActivityAdmin(admin.ModelAdmin):
@@ -54,10 +60,15 @@ class ActivityAdmin(admin.ModelAdmin):
     list_filter = ('activitydate', 'activitytype')
     search_fields = ('activitytype',)
 
+class RoutineActivityInline(admin.TabularInline):
+    model = RoutineActivity
+    raw_id_fields = ('activity',)
+    extra = 1
+
 @admin.register(Routine)
 class RoutineAdmin(admin.ModelAdmin):
     list_display = ('__str__',)
-    filter_horizontal = ('activities',)
+    inlines = (RoutineActivityInline,)
 
 @admin.register(Food)
 class FoodAdmin(admin.ModelAdmin):
@@ -75,10 +86,15 @@ class MealAdmin(admin.ModelAdmin):
     list_filter = ('mealdate', 'mealtype')
     inlines = (MealFoodInline,)
     
+class NutritionMealInline(admin.TabularInline):
+    model = NutritionMeal
+    raw_id_fields = ('meal',)
+    extra = 1
+
 @admin.register(Nutrition)
 class NutritionAdmin(admin.ModelAdmin):
     list_display = ('__str__',)
-    filter_horizontal = ('meals',)
+    inlines = (NutritionMealInline,)
 
 
 @admin.register(Client)
@@ -93,3 +109,19 @@ class UserProfileAdmin(admin.ModelAdmin):
     raw_id_fields = ('PTUser', 'routine', 'nutrition', 'professional')  # Removed 'goal' as it doesn't exist
     search_fields = ('PTUser__username',)
     list_filter = ('gender', 'dateofbirth')
+
+@admin.register(DailyNutritionTotals)
+class DailyNutritionTotalsAdmin(admin.ModelAdmin):
+    list_display = ('user', 'date', 'calories', 'protein', 'carbohydrates', 'fat', 'sodium')
+    list_filter = ('date',)
+    raw_id_fields = ('user',)
+
+@admin.register(GoalProgress)
+class GoalProgressAdmin(admin.ModelAdmin):
+    list_display = ('goal', 'recorded_at', 'value')
+    raw_id_fields = ('goal',)
+
+@admin.register(ActivityCompletion)
+class ActivityCompletionAdmin(admin.ModelAdmin):
+    list_display = ('user', 'activity', 'completed_at')
+    raw_id_fields = ('user', 'activity')
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class SonaresomaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'SonareSoma'
+
+    def ready(self):
+        from . import signals  # noqa: F401  Registers the DailyNutritionTotals and tombstone handlers
+        from . import metrics  # noqa: F401  Registers the per-task instrumentation hooks
@@ -0,0 +1,396 @@
+import functools
+import gzip
+import hashlib
+import json
+import os
+from django.apps import apps
+from django.conf import settings
+from django.core import serializers
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import ChangedRecord, DeletedRecord
+from .repositories import NutritionRepository
+
+try:
+    import zstandard
+except ImportError:  # zstd compression is optional
+    zstandard = None
+
+MANIFEST_NAME = 'manifest.json'
+# Queue and ledger tables are transient, and the nutrition rollup is rebuilt from meal
+# data on restore. None of them is worth copying on every run.
+DEFAULT_EXCLUDE = [
+    'SonareSoma.DailyNutritionTotals',
+    'SonareSoma.DigestSection',
+    'SonareSoma.NotificationLog',
+    'SonareSoma.OutboundEmail',
+    'SonareSoma.RateLimitBucket',
+]
+TOMBSTONES_FILE = 'tombstones.ndjson'
+# Models that cannot carry an updated_at column; their saves leave ChangedRecord markers instead
+CHANGE_LOGGED_MODELS = ['auth.User']
+
+
+class BackupError(Exception):
+    pass
+
+
+def get_backup_models(labels=None):
+    """
+    Resolves 'app_label' / 'app_label.Model' labels to concrete models, plus the
+    auto-created many-to-many tables between them, ordered so that every model
+    comes after the models it references. Models listed in SONARESOMA_BACKUP_EXCLUDE
+    are left out.
+    """
+    labels = labels or getattr(settings, 'SONARESOMA_BACKUP_MODELS', ['auth.User', 'SonareSoma'])
+    excluded = set(getattr(settings, 'SONARESOMA_BACKUP_EXCLUDE', DEFAULT_EXCLUDE))
+    selected = {}
+    for label in labels:
+        if '.' in label:
+            model = apps.get_model(label)
+            selected.setdefault(model._meta.app_config, []).append(model)
+        else:
+            app_config = apps.get_app_config(label)
+            selected.setdefault(app_config, []).extend(app_config.get_models())
+    models = [
+        model for model in serializers.sort_dependencies(selected.items(), allow_cycles=True)
+        if model not in (ChangedRecord, DeletedRecord)  # Change markers and tombstones are not data
+        and model._meta.label not in excluded
+    ]
+
+    model_set = set(models)
+    through_models = [
+        field.remote_field.through
+        for model in models
+        for field in model._meta.local_many_to_many
+        if field.remote_field.through._meta.auto_created and field.related_model in model_set
+    ]
+    return models + through_models
+
+
+def is_change_tracked(model):
+    """
+    Change-tracked models carry an auto_now `updated_at` column, or are listed in
+    CHANGE_LOGGED_MODELS, and leave DeletedRecord tombstones. QuerySet.update() and
+    bulk_update() skip auto_now, so code changing tracked rows that way must set
+    updated_at itself or the change misses increments.
+    """
+    return model._meta.label in CHANGE_LOGGED_MODELS or any(field.name == 'updated_at' for field in model._meta.concrete_fields)
+
+
+def changed_rows(model, since):
+    """The rows of a change-tracked model saved at or after `since`."""
+    if model._meta.label in CHANGE_LOGGED_MODELS:
+        changed = ChangedRecord.objects.filter(model=model._meta.label, changed_at__gte=since).values('object_id')
+        return model._base_manager.filter(pk__in=changed)
+    return model._base_manager.filter(updated_at__gte=since)
+
+
+def open_compressed(path, mode, compression):
+    if compression == 'zstd':
+        if zstandard is None:
+            raise BackupError("zstd compression requires the 'zstandard' package")
+        raw = open(path, mode + 'b')
+        if mode == 'w':
+            stream = zstandard.ZstdCompressor().stream_writer(raw, closefd=True)
+        else:
+            stream = zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        return stream
+    return gzip.open(path, mode + 'b')
+
+
+def iter_rows(model, chunk_size, queryset=None):
+    """Yields the model's rows as dicts of column values, in primary-key order, one keyset page at a time."""
+    field_names = [field.attname for field in model._meta.concrete_fields]
+    queryset = (model._base_manager.all() if queryset is None else queryset).order_by('pk').values(*field_names)
+    pk_name = model._meta.pk.attname
+    last_pk = None
+    while True:
+        page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        rows = list(page[:chunk_size])
+        if not rows:
+            return
+        yield from rows
+        last_pk = rows[-1][pk_name]
+
+
+def write_ndjson(path, compression, rows):
+    """Writes dict rows as compressed NDJSON; returns (row count, SHA-256 of the NDJSON content)."""
+    checksum = hashlib.sha256()
+    count = 0
+    with open_compressed(path, 'w', compression) as stream:
+        for row in rows:
+            line = (json.dumps(row, cls=DjangoJSONEncoder) + '\n').encode()
+            checksum.update(line)
+            stream.write(line)
+            count += 1
+    return count, checksum.hexdigest()
+
+
+def find_latest_backup(backup_dir):
+    """Returns the newest backup directory with a manifest (i.e. one that completed), or None."""
+    if not os.path.isdir(backup_dir):
+        return None
+    completed = sorted(
+        name for name in os.listdir(backup_dir)
+        if os.path.isfile(os.path.join(backup_dir, name, MANIFEST_NAME))
+    )
+    return os.path.join(backup_dir, completed[-1]) if completed else None
+
+
+def create_backup(backup_dir=None, chunk_size=None, compression=None, labels=None, incremental=False):
+    """
+    Streams every backed-up model to its own compressed NDJSON file and writes a
+    manifest with per-model row counts and SHA-256 checksums of the NDJSON content.
+    Memory use is bounded by chunk_size rows regardless of table size.
+
+    An incremental backup only writes the rows of change-tracked models modified
+    since the last completed backup, plus the tombstones of rows deleted since then;
+    models configured without change tracking are still written in full. Without a
+    previous backup a full one is taken instead. Returns the path of the new backup
+    directory.
+    """
+    backup_dir = str(backup_dir or getattr(settings, 'SONARESOMA_BACKUP_DIR', 'backups'))
+    chunk_size = chunk_size or getattr(settings, 'SONARESOMA_BACKUP_CHUNK_SIZE', 2000)
+    compression = compression or getattr(settings, 'SONARESOMA_BACKUP_COMPRESSION', 'gzip')
+    extension = 'zst' if compression == 'zstd' else 'gz'
+
+    parent_path = find_latest_backup(backup_dir) if incremental else None
+    since = parse_datetime(read_manifest(parent_path)['started']) if parent_path else None
+
+    # Rows changed while the backup runs are picked up again by the next increment.
+    started = timezone.now()
+    path = os.path.join(backup_dir, f"db_backup_{started.strftime('%Y%m%d%H%M%S%f')}")
+    os.makedirs(path, exist_ok=False)
+
+    manifest = {
+        'started': started.isoformat(),
+        'kind': 'incremental' if parent_path else 'full',
+        'parent': os.path.basename(parent_path) if parent_path else None,
+        'compression': compression,
+        'models': [],
+    }
+    for model in get_backup_models(labels):
+        label = model._meta.label
+        queryset = None
+        if since and is_change_tracked(model):
+            queryset = changed_rows(model, since)
+        file_name = f"{label}.ndjson.{extension}"
+        rows, checksum = write_ndjson(os.path.join(path, file_name), compression, iter_rows(model, chunk_size, queryset))
+        manifest['models'].append({
+            'model': label, 'file': file_name, 'rows': rows, 'sha256': checksum,
+            'partial': queryset is not None,
+        })
+
+    if since:
+        # Restores apply tombstones before rows, so a row deleted after its rows were read
+        # here must wait for the next increment rather than be revived by them.
+        tombstones = (
+            DeletedRecord.objects.filter(deleted_at__gte=since, deleted_at__lt=started)
+            .order_by('pk').values_list('model', 'object_id')
+        )
+        file_name = f"{TOMBSTONES_FILE}.{extension}"
+        rows, checksum = write_ndjson(
+            os.path.join(path, file_name), compression,
+            ({'model': model, 'pk': object_id} for model, object_id in tombstones.iterator(chunk_size=chunk_size)),
+        )
+        manifest['tombstones'] = {'file': file_name, 'rows': rows, 'sha256': checksum}
+    else:
+        # A full backup covers every change and deletion before it started.
+        ChangedRecord.objects.filter(changed_at__lt=started).delete()
+        DeletedRecord.objects.filter(deleted_at__lt=started).delete()
+
+    with open(os.path.join(path, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return path
+
+
+def read_manifest(path):
+    with open(os.path.join(path, MANIFEST_NAME)) as f:
+        return json.load(f)
+
+
+def iter_backup_lines(path, compression, entry):
+    """Yields the raw NDJSON lines of one manifest entry, verifying the row count and checksum at the end."""
+    checksum = hashlib.sha256()
+    rows = 0
+    with open_compressed(os.path.join(path, entry['file']), 'r', compression) as raw:
+        stream = raw if compression != 'zstd' else _iter_lines(raw)
+        for line in stream:
+            checksum.update(line)
+            rows += 1
+            yield line
+    if rows != entry['rows'] or checksum.hexdigest() != entry['sha256']:
+        raise BackupError(f"{entry['file']} does not match the manifest ({rows} rows read, {entry['rows']} expected)")
+
+
+def read_rows(path, compression, entry):
+    return (json.loads(line) for line in iter_backup_lines(path, compression, entry))
+
+
+def _iter_lines(stream, block_size=1 << 16):
+    buffer = b''
+    while True:
+        block = stream.read(block_size)
+        if not block:
+            break
+        buffer += block
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            yield line + b'\n'
+    if buffer:
+        yield buffer
+
+
+def build_instance(model, row):
+    return model(**{
+        field.attname: field.to_python(row[field.attname]) if row[field.attname] is not None else None
+        for field in model._meta.concrete_fields
+        if field.attname in row
+    })
+
+
+def bulk_load(model, rows, batch_size):
+    """Inserts an iterable of row dicts with bulk_create, batch_size rows at a time."""
+    batch = []
+    loaded = 0
+    for row in rows:
+        batch.append(build_instance(model, row))
+        if len(batch) >= batch_size:
+            model._base_manager.bulk_create(batch)
+            loaded += len(batch)
+            batch = []
+    model._base_manager.bulk_create(batch)
+    return loaded + len(batch)
+
+
+def reset_sequences(models):
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+
+def iter_pks(model, batch_size):
+    """Yields the model's primary keys in order, one keyset page at a time."""
+    queryset = model._base_manager.order_by('pk').values_list('pk', flat=True)
+    last_pk = None
+    while True:
+        page = list((queryset if last_pk is None else queryset.filter(pk__gt=last_pk))[:batch_size])
+        if not page:
+            return
+        yield from page
+        last_pk = page[-1]
+
+
+def delete_missing(model, kept_pks, batch_size):
+    """
+    Deletes the rows whose primary keys are not in `kept_pks`, an iterable in
+    primary-key order: a merge of the two ordered streams, so memory stays at
+    batch_size keys whatever the table size.
+    """
+    kept = iter(kept_pks)
+    next_kept = next(kept, None)
+    stale = []
+    for pk in iter_pks(model, batch_size):
+        while next_kept is not None and next_kept < pk:
+            next_kept = next(kept, None)
+        if pk != next_kept:
+            stale.append(pk)
+        if len(stale) >= batch_size:
+            model._base_manager.filter(pk__in=stale).delete()
+            stale = []
+    if stale:
+        model._base_manager.filter(pk__in=stale).delete()
+
+
+def apply_increment(model, read_rows, batch_size, partial):
+    """
+    Upserts an increment's rows: rows that already exist are updated in place with
+    bulk_update (so related rows are not cascaded away), new ones are bulk-created.
+    For a full (non-partial) copy, rows missing from the increment are deleted in a
+    second pass over the file. read_rows() returns a fresh iterator of the rows,
+    which are in primary-key order.
+    """
+    pk = model._meta.pk
+    update_fields = [field.attname for field in model._meta.concrete_fields if not field.primary_key]
+    batch = []
+
+    def flush(batch):
+        if not batch:
+            return
+        pks = [instance.pk for instance in batch]
+        existing = set(model._base_manager.filter(pk__in=pks).values_list('pk', flat=True))
+        if update_fields:
+            model._base_manager.bulk_update([instance for instance in batch if instance.pk in existing], update_fields)
+        model._base_manager.bulk_create([instance for instance in batch if instance.pk not in existing])
+
+    for row in read_rows():
+        batch.append(build_instance(model, row))
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    flush(batch)
+    if not partial:
+        delete_missing(model, (pk.to_python(row[pk.attname]) for row in read_rows()), batch_size)
+
+
+def apply_tombstones(path, compression, entry, batch_size):
+    """Deletes the rows named by an increment's tombstones, batch_size at a time per model."""
+    deleted = {}
+    for line in iter_backup_lines(path, compression, entry):
+        tombstone = json.loads(line)
+        pks = deleted.setdefault(tombstone['model'], [])
+        pks.append(tombstone['pk'])
+        if len(pks) >= batch_size:
+            apps.get_model(tombstone['model'])._base_manager.filter(pk__in=pks).delete()
+            pks.clear()
+    for label, pks in deleted.items():
+        if pks:
+            apps.get_model(label)._base_manager.filter(pk__in=pks).delete()
+
+
+def get_backup_chain(path):
+    """Returns [full backup, increment, increment, ...] ending with the given backup."""
+    chain = [path]
+    manifest = read_manifest(path)
+    while manifest['parent']:
+        chain.insert(0, os.path.join(os.path.dirname(path), manifest['parent']))
+        manifest = read_manifest(chain[0])
+    return chain
+
+
+def restore_backup(path, batch_size=None):
+    """
+    Loads a backup written by create_backup() into an empty database in one
+    transaction: the base full backup is bulk-created in batches, then every
+    increment up to `path` is replayed in order, deletions first (so a link row
+    re-created under a new key does not clash with the old one), and the
+    DailyNutritionTotals rollup is rebuilt from the restored meals. Any checksum or
+    row-count mismatch rolls the whole restore back.
+    Returns {model label: rows restored or replayed}.
+    """
+    batch_size = batch_size or getattr(settings, 'SONARESOMA_BACKUP_CHUNK_SIZE', 2000)
+    restored = {}
+    models = set()
+    with transaction.atomic():
+        for backup_path in get_backup_chain(path):
+            manifest = read_manifest(backup_path)
+            compression = manifest['compression']
+            if 'tombstones' in manifest:
+                apply_tombstones(backup_path, compression, manifest['tombstones'], batch_size)
+            for entry in manifest['models']:
+                model = apps.get_model(entry['model'])
+                models.add(model)
+                if manifest['kind'] == 'full':
+                    restored[entry['model']] = bulk_load(model, read_rows(backup_path, compression, entry), batch_size)
+                else:
+                    apply_increment(model, functools.partial(read_rows, backup_path, compression, entry), batch_size, entry['partial'])
+                    restored[entry['model']] = restored.get(entry['model'], 0) + entry['rows']
+        reset_sequences(list(models))
+        NutritionRepository.rebuild_daily_totals(batch_size=batch_size)
+    return restored
@@ -0,0 +1,66 @@
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.http import parse_etags
+from rest_framework.response import Response
+
+# Every cached catalog response is keyed on this counter, so bumping it retires them
+# all at once. The cache must be shared by all web processes (e.g. Redis) for a bump
+# in one of them to reach the others.
+VERSION_KEY = 'sonaresoma:food-catalog:version'
+
+
+def get_cache():
+    return caches[getattr(settings, 'SONARESOMA_CATALOG_CACHE', 'default')]
+
+
+def get_catalog_version():
+    cache = get_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Start from the clock rather than 1, so a version lost to eviction is never reused
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(VERSION_KEY, 0)
+    return version
+
+
+def bump_catalog_version():
+    """Called after every committed Food save or delete; bulk updates must call it themselves."""
+    cache = get_cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def catalog_response(request, respond):
+    """
+    Serves a read of the food catalog from the cache, validated by a strong ETag over
+    the catalog version, the negotiated media type and the absolute URI. A matching
+    If-None-Match is answered with 304 before any database access; otherwise
+    respond() builds the response on a cache miss.
+    """
+    version = get_catalog_version()
+    # The absolute URI, because cached pages carry absolute next/previous links
+    digest = hashlib.sha256(f"{version}:{request.accepted_media_type}:{request.build_absolute_uri()}".encode()).hexdigest()
+    etag = f'"{digest[:32]}"'
+    # If-None-Match compares weakly: W/"x" matches "x"
+    client_etags = {tag.removeprefix('W/') for tag in parse_etags(request.headers.get('If-None-Match', ''))}
+    if etag in client_etags or '*' in client_etags:
+        response = Response(status=304)
+    else:
+        cache = get_cache()
+        key = f"sonaresoma:food-catalog:{version}:{digest}"
+        data = cache.get(key)
+        if data is not None:
+            response = Response(data)
+        else:
+            response = respond()
+            if response.status_code != 200:
+                return response
+            cache.set(key, response.data, getattr(settings, 'SONARESOMA_CATALOG_CACHE_TIMEOUT', 24 * 60 * 60))
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'  # Clients may keep it but must revalidate
+    response['Vary'] = 'Accept'
+    return response
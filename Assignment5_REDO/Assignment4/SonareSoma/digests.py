@@ -0,0 +1,57 @@
+from itertools import groupby
+from django.conf import settings
+from django.utils import timezone
+from .emails import render_email
+from .models import DigestSection
+from .notifications import BulkMailer
+
+
+def build_digest(user, sections):
+    """Combines a user's pending sections into one (subject, message), dropping each section's own greeting."""
+    greeting = f"Hi {user.user.username},\n\n"
+    sections = [{'subject': section.subject, 'body': section.body.removeprefix(greeting)} for section in sections]
+    return "Your Daily Digest", render_email('daily_digest', username=user.user.username, sections=sections)
+
+
+def flush_digests(day=None, batch_size=None, connection=None):
+    """
+    Sends one combined email per user for every DigestSection dated `day` or
+    earlier, in mail batches of batch_size users. Sections are deleted once their
+    digest is sent, so digests that could not be delivered are retried by the next run.
+    Returns the number of digests sent.
+    """
+    day = day or timezone.localdate()
+    batch_size = batch_size or getattr(settings, 'SONARESOMA_EMAIL_BATCH_SIZE', 100)
+    sections = (
+        DigestSection.objects.filter(digest_date__lte=day)
+        .select_related('user__user')
+        .order_by('user_id', 'created_at', 'id')
+        .iterator(chunk_size=2000)
+    )
+    with BulkMailer(batch_size=batch_size, connection=connection) as mailer:
+        batch, section_ids = [], []
+        for _, user_sections in groupby(sections, key=lambda section: section.user_id):
+            user_sections = list(user_sections)
+            user = user_sections[0].user
+            subject, message = build_digest(user, user_sections)
+            batch.append((subject, message, [user.user.email]))
+            section_ids.append([section.pk for section in user_sections])
+            if len(batch) >= batch_size:
+                send_digest_batch(mailer, batch, section_ids)
+                batch, section_ids = [], []
+        send_digest_batch(mailer, batch, section_ids)
+    return mailer.sent
+
+
+def send_digest_batch(mailer, batch, section_ids):
+    """
+    Sends (subject, message, recipient_list) digests as one mail batch and deletes the
+    sections of the digests that went out; section_ids holds one list per digest.
+    """
+    sent_before = mailer.sent
+    for subject, message, recipient_list in batch:
+        mailer.add(subject, message, recipient_list)
+    mailer.flush()
+    # The mailer delivers a batch in order, so what it gave up on is always the tail
+    delivered = mailer.sent - sent_before
+    DigestSection.objects.filter(pk__in=[pk for ids in section_ids[:delivered] for pk in ids]).delete()
@@ -0,0 +1,24 @@
+import os
+from django.template import Context, Engine
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), 'templates', 'emails')
+
+# A dedicated engine for plain-text notification bodies: no HTML autoescaping, and
+# the cached loader compiles each template once per worker process.
+engine = Engine(
+    dirs=[TEMPLATE_DIR],
+    autoescape=False,
+    loaders=[('django.template.loaders.cached.Loader', ['django.template.loaders.filesystem.Loader'])],
+)
+
+
+def get_email_template(name):
+    return engine.get_template(f"{name}.txt")
+
+
+def render_email(name, **context):
+    """
+    Renders templates/emails/<name>.txt without number localization; templates
+    format dates and times explicitly. The file's trailing newline is dropped.
+    """
+    return get_email_template(name).render(Context(context, autoescape=False, use_l10n=False)).rstrip('\n')
@@ -0,0 +1,44 @@
+import datetime
+import time
+from types import SimpleNamespace
+from django.core.management.base import BaseCommand
+from SonareSoma.emails import render_email
+
+
+class Command(BaseCommand):
+    help = "Times notification template rendering for synthetic recipients; no database access."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipients', type=int, default=10000, help="Daily routine reminders to render.")
+        parser.add_argument('--clients', type=int, default=500, help="Clients in one professional weekly summary.")
+        parser.add_argument('--goals-per-client', type=int, default=3)
+
+    def handle(self, *args, **options):
+        recipients = options['recipients']
+        activities = [
+            SimpleNamespace(activitytype=activity_type, starttime=datetime.time(7 + hour))
+            for hour, activity_type in enumerate(['Running', 'Yoga', 'Strength'])
+        ]
+        render_email('daily_routine_reminder', username='warmup', activities=activities)
+
+        started = time.perf_counter()
+        for i in range(recipients):
+            render_email('daily_routine_reminder', username=f"user{i}", activities=activities)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"daily_routine_reminder: {recipients} bodies in {elapsed * 1000:.1f} ms "
+            f"({elapsed * 10000 / max(recipients, 1) * 1000:.1f} ms per 10k recipients)"
+        )
+
+        today = datetime.date.today()
+        goals = [
+            SimpleNamespace(goaltype=f"Goal {i}", goalvalue=float(i), startdate=today, enddate=today + datetime.timedelta(days=30))
+            for i in range(options['goals_per_client'])
+        ]
+        clients = [(f"client{i}", goals) for i in range(options['clients'])]
+        started = time.perf_counter()
+        message = render_email('weekly_professional_summary', username='professional', clients=clients)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"weekly_professional_summary: {len(clients)} clients, {len(message)} characters in {elapsed * 1000:.1f} ms"
+        )
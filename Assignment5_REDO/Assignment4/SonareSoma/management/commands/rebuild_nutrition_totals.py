@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from SonareSoma.repositories import NutritionRepository
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the DailyNutritionTotals rollup from raw Meal/MealFood/Food data."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows inserted per bulk_create call.")
+
+    def handle(self, *args, **options):
+        created = NutritionRepository.rebuild_daily_totals(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {created} daily nutrition totals"))
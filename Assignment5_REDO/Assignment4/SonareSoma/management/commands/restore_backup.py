@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from SonareSoma.backup import BackupError, restore_backup
+
+
+class Command(BaseCommand):
+    help = "Restores a backup directory written by the backup_database task into an empty database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Backup directory containing manifest.json.")
+        parser.add_argument('--batch-size', type=int, default=None, help="Rows inserted per bulk_create call.")
+
+    def handle(self, *args, **options):
+        try:
+            restored = restore_backup(options['path'], batch_size=options['batch_size'])
+        except BackupError as e:
+            raise CommandError(str(e))
+        for label, rows in restored.items():
+            self.stdout.write(f"{label}: {rows} rows")
+        self.stdout.write(self.style.SUCCESS(f"Restored {sum(restored.values())} rows from {options['path']}"))
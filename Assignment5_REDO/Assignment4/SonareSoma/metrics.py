@@ -0,0 +1,252 @@
+import json
+import logging
+import os
+import threading
+import math
+import time
+from collections import deque
+from contextlib import ExitStack
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+from celery.signals import before_task_publish, task_postrun, task_prerun
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+TASK_PREFIX = 'SonareSoma.'
+COUNTERS = ('wall_time', 'queries', 'query_time', 'rows', 'emails_sent', 'emails_queued')
+LATENCY_SAMPLES = 1000  # Most recent queue latencies kept per queue for the percentiles
+
+_local = threading.local()
+
+
+class TaskMeasurement:
+    """Cost of one task run. Nested runs (eager sub-tasks) are also counted in the runs around them."""
+
+    def __init__(self, task_name, task_id):
+        self.task_name = task_name
+        self.task_id = task_id
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.query_time = 0.0
+        self.rows = 0
+        self.emails_sent = 0
+        self.emails_queued = 0
+        self.exit_stack = None
+
+    def as_dict(self):
+        return {
+            'task': self.task_name,
+            'task_id': self.task_id,
+            'wall_time': round(time.perf_counter() - self.started, 6),
+            'queries': self.queries,
+            'query_time': round(self.query_time, 6),
+            'rows': self.rows,
+            'emails_sent': self.emails_sent,
+            'emails_queued': self.emails_queued,
+        }
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[max(math.ceil(fraction * len(sorted_values)) - 1, 0)]
+
+
+class MetricsRegistry:
+    """
+    Per-task totals for this process, ranked by total wall time in snapshot(), and
+    per-queue latency (publish to start of execution) percentiles in queue_snapshot().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tasks = {}
+        self._latencies = {}
+
+    def record(self, run, failed=False):
+        with self._lock:
+            totals = self._tasks.get(run['task'])
+            if totals is None:
+                totals = self._tasks[run['task']] = {'runs': 0, 'failures': 0, 'max_wall_time': 0.0, **dict.fromkeys(COUNTERS, 0)}
+            totals['runs'] += 1
+            totals['failures'] += failed
+            totals['max_wall_time'] = max(totals['max_wall_time'], run['wall_time'])
+            for counter in COUNTERS:
+                totals[counter] += run[counter]
+            totals['last_run'] = run
+
+    def snapshot(self):
+        with self._lock:
+            tasks = [dict(totals, task=name) for name, totals in self._tasks.items()]
+        return sorted(tasks, key=lambda totals: totals['wall_time'], reverse=True)
+
+    def record_latency(self, queue, seconds):
+        with self._lock:
+            self._latencies.setdefault(queue, deque(maxlen=LATENCY_SAMPLES)).append(seconds)
+
+    def queue_snapshot(self):
+        with self._lock:
+            latencies = {queue: sorted(samples) for queue, samples in self._latencies.items()}
+        return {
+            queue: {
+                'samples': len(samples),
+                'p50': percentile(samples, 0.5),
+                'p99': percentile(samples, 0.99),
+                'max': samples[-1],
+            }
+            for queue, samples in latencies.items()
+        }
+
+    def reset(self):
+        with self._lock:
+            self._tasks.clear()
+            self._latencies.clear()
+
+
+registry = MetricsRegistry()
+
+
+def active_measurements():
+    if not hasattr(_local, 'measurements'):
+        _local.measurements = []
+    return _local.measurements
+
+
+def record_emails(sent=0, queued=0):
+    """Called by BulkMailer for every delivered or queued batch."""
+    for measurement in active_measurements():
+        measurement.emails_sent += sent
+        measurement.emails_queued += queued
+
+
+class RowCountingCursor:
+    """Wraps a DB-API cursor and counts the rows fetched through it."""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def count(self, rows):
+        for measurement in active_measurements():
+            measurement.rows += rows
+
+    def fetchone(self):
+        row = self.cursor.fetchone()
+        if row is not None:
+            self.count(1)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self.cursor.fetchmany(*args, **kwargs)
+        self.count(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self.cursor.fetchall()
+        self.count(len(rows))
+        return rows
+
+    def __iter__(self):
+        for row in self.cursor:
+            self.count(1)
+            yield row
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+
+def count_query(execute, sql, params, many, context):
+    cursor = context['cursor']
+    if not isinstance(cursor.cursor, RowCountingCursor):
+        cursor.cursor = RowCountingCursor(cursor.cursor)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        for measurement in active_measurements():
+            measurement.queries += 1
+            measurement.query_time += elapsed
+
+
+@before_task_publish.connect
+def stamp_publish_time(headers=None, **kwargs):
+    headers.setdefault('published_at', time.time())
+
+
+def record_queue_latency(request):
+    published_at = (request.headers or {}).get('published_at')
+    if published_at is None:  # Eager or direct calls were never queued
+        return
+    queue = (request.delivery_info or {}).get('routing_key') or 'default'
+    registry.record_latency(queue, max(time.time() - published_at, 0.0))
+
+
+@task_prerun.connect
+def start_measurement(task_id=None, task=None, **kwargs):
+    record_queue_latency(task.request)
+    if not task.name.startswith(TASK_PREFIX):
+        return
+    start_metrics_server()
+    measurements = active_measurements()
+    measurement = TaskMeasurement(task.name, task_id)
+    if not measurements:
+        # One query hook per thread, for the outermost task only
+        measurement.exit_stack = ExitStack()
+        for connection in connections.all():
+            measurement.exit_stack.enter_context(connection.execute_wrapper(count_query))
+    measurements.append(measurement)
+
+
+@task_postrun.connect
+def finish_measurement(task_id=None, task=None, state=None, **kwargs):
+    measurements = active_measurements()
+    if not task.name.startswith(TASK_PREFIX) or not measurements or measurements[-1].task_id != task_id:
+        return
+    measurement = measurements.pop()
+    if measurement.exit_stack:
+        measurement.exit_stack.close()
+    run = measurement.as_dict()
+    run['state'] = state
+    registry.record(run, failed=state != 'SUCCESS')
+    logger.info(json.dumps(run), extra={'task_metrics': run})
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def metrics_app(environ, start_response):
+    body = json.dumps({'pid': os.getpid(), 'tasks': registry.snapshot(), 'queues': registry.queue_snapshot()}).encode()
+    start_response('200 OK', [('Content-Type', 'application/json'), ('Content-Length', str(len(body)))])
+    return [body]
+
+
+_server_lock = threading.Lock()
+_server_pid = None
+
+
+def start_metrics_server():
+    """
+    Serves this process's registry as JSON on the first free port from
+    SONARESOMA_METRICS_PORT on, once per process; disabled when the setting is unset.
+    Each prefork child takes its own port, so scrape the whole range.
+    """
+    global _server_pid
+    port = getattr(settings, 'SONARESOMA_METRICS_PORT', None)
+    if not port or _server_pid == os.getpid():
+        return None
+    with _server_lock:
+        if _server_pid == os.getpid():
+            return None
+        _server_pid = os.getpid()
+        host = getattr(settings, 'SONARESOMA_METRICS_HOST', '127.0.0.1')
+        for candidate in range(port, port + getattr(settings, 'SONARESOMA_METRICS_PORT_RANGE', 16)):
+            try:
+                server = make_server(host, candidate, metrics_app, handler_class=QuietRequestHandler)
+            except OSError:
+                continue
+            threading.Thread(target=server.serve_forever, name='task-metrics', daemon=True).start()
+            logger.info(f"Serving task metrics on http://{host}:{candidate}/")
+            return server
+        logger.warning(f"No free port for task metrics in {port}-{candidate}")
+    return None
@@ -0,0 +1,30 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SonareSoma', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyNutritionTotals',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Date')),
+                ('calories', models.FloatField(default=0, verbose_name='Calories')),
+                ('protein', models.FloatField(default=0, verbose_name='Protein')),
+                ('carbohydrates', models.FloatField(default=0, verbose_name='Carbohydrates')),
+                ('fat', models.FloatField(default=0, verbose_name='Fat')),
+                ('sodium', models.FloatField(default=0, verbose_name='Sodium')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_nutrition_totals', to='SonareSoma.userprofile', verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Daily Nutrition Totals',
+                'verbose_name_plural': 'Daily Nutrition Totals',
+                'unique_together': {('user', 'date')},
+            },
+        ),
+    ]
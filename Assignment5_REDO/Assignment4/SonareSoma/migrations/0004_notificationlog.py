@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SonareSoma', '0003_change_tracking'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipient', models.CharField(max_length=254, verbose_name='Recipient')),
+                ('kind', models.CharField(max_length=100, verbose_name='Kind')),
+                ('period_key', models.CharField(max_length=64, verbose_name='Period Key')),
+                ('sent_at', models.DateTimeField(auto_now_add=True, verbose_name='Sent At')),
+            ],
+            options={
+                'verbose_name': 'Notification Log',
+                'verbose_name_plural': 'Notification Logs',
+                'unique_together': {('recipient', 'kind', 'period_key')},
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Mod
+
+import SonareSoma.models
+
+
+def assign_delivery_slots(apps, schema_editor):
+    # Existing profiles all received the same one-off default; spread them by id instead.
+    UserProfile = apps.get_model('SonareSoma', 'UserProfile')
+    UserProfile.objects.update(delivery_slot=Mod('id', getattr(settings, 'SONARESOMA_DELIVERY_SLOTS', 96)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SonareSoma', '0005_outbound_email_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='delivery_slot',
+            field=models.PositiveSmallIntegerField(db_index=True, default=SonareSoma.models.random_delivery_slot, verbose_name='Delivery Slot'),
+        ),
+        migrations.RunPython(assign_delivery_slots, migrations.RunPython.noop),
+    ]
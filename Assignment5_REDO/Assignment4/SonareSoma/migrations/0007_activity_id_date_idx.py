@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SonareSoma', '0006_userprofile_delivery_slot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['id', 'activitydate'], name='activity_id_date_idx'),
+        ),
+    ]
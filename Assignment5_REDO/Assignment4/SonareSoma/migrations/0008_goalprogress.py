@@ -0,0 +1,42 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SonareSoma', '0007_activity_id_date_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='goal',
+            name='latest_value',
+            field=models.FloatField(blank=True, null=True, verbose_name='Latest Value'),
+        ),
+        migrations.AddField(
+            model_name='goal',
+            name='latest_recorded_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Latest Recorded At'),
+        ),
+        migrations.AddField(
+            model_name='goal',
+            name='achieved_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Achieved At'),
+        ),
+        migrations.CreateModel(
+            name='GoalProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recorded_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Recorded At')),
+                ('value', models.FloatField(verbose_name='Value')),
+                ('goal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='progress', to='SonareSoma.goal', verbose_name='Goal')),
+            ],
+            options={
+                'verbose_name': 'Goal Progress',
+                'verbose_name_plural': 'Goal Progress',
+                'indexes': [models.Index(fields=['goal', 'recorded_at'], name='goalprogress_goal_time_idx')],
+            },
+        ),
+    ]
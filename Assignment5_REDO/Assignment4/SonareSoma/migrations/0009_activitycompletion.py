@@ -0,0 +1,32 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SonareSoma', '0008_goalprogress'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='activity',
+            name='activitydate',
+            field=models.DateField(db_index=True, verbose_name='Activity Date'),
+        ),
+        migrations.CreateModel(
+            name='ActivityCompletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('completed_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Completed At')),
+                ('activity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='completions', to='SonareSoma.activity', verbose_name='Activity')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity_completions', to='SonareSoma.userprofile', verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Activity Completion',
+                'verbose_name_plural': 'Activity Completions',
+                'unique_together': {('user', 'activity')},
+            },
+        ),
+    ]
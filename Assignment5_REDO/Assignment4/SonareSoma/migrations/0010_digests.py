@@ -0,0 +1,34 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SonareSoma', '0009_activitycompletion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='digest_only',
+            field=models.BooleanField(default=False, verbose_name='Digest Only'),
+        ),
+        migrations.CreateModel(
+            name='DigestSection',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest_date', models.DateField(verbose_name='Digest Date')),
+                ('kind', models.CharField(blank=True, max_length=100, verbose_name='Kind')),
+                ('subject', models.CharField(max_length=255, verbose_name='Subject')),
+                ('body', models.TextField(verbose_name='Body')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='digest_sections', to='SonareSoma.userprofile', verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Digest Section',
+                'verbose_name_plural': 'Digest Sections',
+                'indexes': [models.Index(fields=['digest_date', 'user'], name='digestsection_date_user_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SonareSoma', '0011_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationlog',
+            name='claim_token',
+            field=models.CharField(blank=True, db_index=True, max_length=32, verbose_name='Claim Token'),
+        ),
+    ]
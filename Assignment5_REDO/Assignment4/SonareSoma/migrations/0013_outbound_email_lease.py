@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SonareSoma', '0012_notificationlog_claim_token'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboundemail',
+            name='locked_until',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Locked Until'),
+        ),
+        migrations.AddField(
+            model_name='outboundemail',
+            name='kind',
+            field=models.CharField(blank=True, max_length=100, verbose_name='Kind'),
+        ),
+        migrations.AddField(
+            model_name='outboundemail',
+            name='period_key',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Period Key'),
+        ),
+        migrations.AddField(
+            model_name='outboundemail',
+            name='claim_token',
+            field=models.CharField(blank=True, max_length=32, verbose_name='Claim Token'),
+        ),
+    ]
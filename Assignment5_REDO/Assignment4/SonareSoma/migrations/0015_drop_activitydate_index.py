@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SonareSoma', '0014_change_tracking_goals'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='activity',
+            name='activitydate',
+            field=models.DateField(verbose_name='Activity Date'),
+        ),
+    ]
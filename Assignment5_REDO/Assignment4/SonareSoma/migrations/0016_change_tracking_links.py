@@ -0,0 +1,109 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SonareSoma', '0015_drop_activitydate_index'),
+    ]
+
+    operations = [
+        # The auto-created link tables become explicit through models on the same
+        # tables, so only the model state changes here; updated_at is added below.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='RoutineActivity',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('routine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='SonareSoma.routine', verbose_name='Routine')),
+                        ('activity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='SonareSoma.activity', verbose_name='Activity')),
+                    ],
+                    options={
+                        'verbose_name': 'Routine Activity',
+                        'verbose_name_plural': 'Routine Activities',
+                        'db_table': 'SonareSoma_routine_activities',
+                        'unique_together': {('routine', 'activity')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='routine',
+                    name='activities',
+                    field=models.ManyToManyField(related_name='routines', through='SonareSoma.RoutineActivity', to='SonareSoma.activity', verbose_name='Activities'),
+                ),
+                migrations.CreateModel(
+                    name='NutritionMeal',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('nutrition', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='SonareSoma.nutrition', verbose_name='Nutrition')),
+                        ('meal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='SonareSoma.meal', verbose_name='Meal')),
+                    ],
+                    options={
+                        'verbose_name': 'Nutrition Plan Meal',
+                        'verbose_name_plural': 'Nutrition Plan Meals',
+                        'db_table': 'SonareSoma_nutrition_meals',
+                        'unique_together': {('nutrition', 'meal')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='nutrition',
+                    name='meals',
+                    field=models.ManyToManyField(related_name='nutrition_plans', through='SonareSoma.NutritionMeal', to='SonareSoma.meal', verbose_name='Meals'),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='routineactivity',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Updated At'),
+        ),
+        migrations.AddField(
+            model_name='nutritionmeal',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Updated At'),
+        ),
+        migrations.AddField(
+            model_name='client',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Updated At'),
+        ),
+        migrations.AddField(
+            model_name='food',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Updated At'),
+        ),
+        migrations.AddField(
+            model_name='nutrition',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Updated At'),
+        ),
+        migrations.AddField(
+            model_name='professional',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Updated At'),
+        ),
+        migrations.AddField(
+            model_name='routine',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Updated At'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Updated At'),
+        ),
+        migrations.CreateModel(
+            name='ChangedRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=255, verbose_name='Model')),
+                ('object_id', models.BigIntegerField(verbose_name='Object ID')),
+                ('changed_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Changed At')),
+            ],
+            options={
+                'verbose_name': 'Changed Record',
+                'verbose_name_plural': 'Changed Records',
+            },
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SonareSoma', '0016_change_tracking_links'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notificationlog',
+            name='sent_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Sent At'),
+        ),
+    ]
@@ -1,7 +1,11 @@
+import random
+from django.conf import settings
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.core.exceptions import ValidationError
+from django.core.mail import EmailMessage
 
 PTUser = get_user_model()  # Use Django's built-in User model
 
@@ -12,6 +16,7 @@ class Professional(models.Model):
     PTUser = models.OneToOneField(PTUser, on_delete=models.CASCADE, related_name='professional_profile')
     profession = models.CharField(max_length=255, blank=True, null=True, verbose_name=_('Profession'))
     specialty = models.CharField(max_length=255, blank=True, null=True, verbose_name=_('Specialty'))
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name=_('Updated At'))  # Used by incremental backups
 
     def __str__(self):
         return self.user.username
@@ -31,6 +36,11 @@ class Goal(models.Model):
     enddate = models.DateField()
     client = models.ForeignKey('UserProfile', on_delete=models.CASCADE, related_name="goals")
     professional = models.ForeignKey(Professional, on_delete=models.CASCADE, related_name="assigned_goals")
+    # Denormalized from GoalProgress on every insert, so readers never scan the history
+    latest_value = models.FloatField(blank=True, null=True, verbose_name=_('Latest Value'))
+    latest_recorded_at = models.DateTimeField(blank=True, null=True, verbose_name=_('Latest Recorded At'))
+    achieved_at = models.DateTimeField(blank=True, null=True, db_index=True, verbose_name=_('Achieved At'))
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name=_('Updated At'))  # Used by incremental backups
 
     def __str__(self):
         return f"{self.goaltype} for {self.client.user.username} by {self.professional.user.username}"
@@ -38,16 +48,43 @@ class Goal(models.Model):
     class Meta:
         verbose_name = _('Goal')
         verbose_name_plural = _('Goals')
+        indexes = [
+            # Keyset pagination order of /api/goals/
+            models.Index(fields=['startdate', 'id'], name='goal_startdate_id_idx'),
+        ]
+
+
+class GoalProgress(models.Model):
+    """
+    One progress measurement against a goal, as progress toward goalvalue: the goal
+    is achieved once a recorded value reaches it. Inserting a row updates the goal's
+    latest_value and achieved_at (see signals.py).
+    """
+    goal = models.ForeignKey(Goal, on_delete=models.CASCADE, related_name='progress', verbose_name=_('Goal'))
+    recorded_at = models.DateTimeField(default=timezone.now, verbose_name=_('Recorded At'))
+    value = models.FloatField(verbose_name=_('Value'))
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name=_('Updated At'))  # Used by incremental backups
+
+    def __str__(self):
+        return f"Progress {self.value} on goal {self.goal_id} at {self.recorded_at}"
+
+    class Meta:
+        verbose_name = _('Goal Progress')
+        verbose_name_plural = _('Goal Progress')
+        indexes = [
+            models.Index(fields=['goal', 'recorded_at'], name='goalprogress_goal_time_idx'),
+        ]
 
 
 class Activity(models.Model):
     """
     Represents a single activity event.
     """
-    activitydate = models.DateField(verbose_name=_('Activity Date'))
+    activitydate = models.DateField(verbose_name=_('Activity Date'))  # Indexed by activity_date_id_idx
     starttime = models.TimeField(verbose_name=_('Start Time'))
     endtime = models.TimeField(verbose_name=_('End Time'))
     activitytype = models.CharField(max_length=255, verbose_name=_('Activity Type'))
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name=_('Updated At'))  # Used by incremental backups
 
     def __str__(self):
         return f"Activity {self.id} - {self.activitytype} on {self.activitydate}"
@@ -55,13 +92,20 @@ class Activity(models.Model):
     class Meta:
         verbose_name = _('Activity')
         verbose_name_plural = _('Activities')
+        indexes = [
+            # Covers the per-routine Max(activitydate) lookup without reading the activity rows
+            models.Index(fields=['id', 'activitydate'], name='activity_id_date_idx'),
+            # Keyset pagination order of /api/activities/, and date lookups
+            models.Index(fields=['activitydate', 'id'], name='activity_date_id_idx'),
+        ]
 
 
 class Routine(models.Model):
     """
     Represents an exercise routine.
     """
-    activities = models.ManyToManyField(Activity, related_name='routines', verbose_name=_('Activities'))
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name=_('Updated At'))  # Used by incremental backups
+    activities = models.ManyToManyField(Activity, through='RoutineActivity', related_name='routines', verbose_name=_('Activities'))
 
     def __str__(self):
         return f"Routine {self.id}"
@@ -71,6 +115,43 @@ class Routine(models.Model):
         verbose_name_plural = _('Routines')
 
 
+class RoutineActivity(models.Model):
+    """
+    Through model connecting Routine and Activity, so the links carry updated_at.
+    """
+    routine = models.ForeignKey(Routine, on_delete=models.CASCADE, verbose_name=_('Routine'))
+    activity = models.ForeignKey(Activity, on_delete=models.CASCADE, verbose_name=_('Activity'))
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name=_('Updated At'))  # Used by incremental backups
+
+    def __str__(self):
+        return f"Activity {self.activity_id} in Routine {self.routine_id}"
+
+    class Meta:
+        db_table = 'SonareSoma_routine_activities'  # The table of the former auto-created through model
+        verbose_name = _('Routine Activity')
+        verbose_name_plural = _('Routine Activities')
+        unique_together = ('routine', 'activity')
+
+
+class ActivityCompletion(models.Model):
+    """
+    Records that a user completed one of their routine's scheduled activities.
+    Scheduled activities without a completion row count as missed.
+    """
+    user = models.ForeignKey('UserProfile', on_delete=models.CASCADE, related_name='activity_completions', verbose_name=_('User'))
+    activity = models.ForeignKey(Activity, on_delete=models.CASCADE, related_name='completions', verbose_name=_('Activity'))
+    completed_at = models.DateTimeField(default=timezone.now, verbose_name=_('Completed At'))
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name=_('Updated At'))  # Used by incremental backups
+
+    def __str__(self):
+        return f"Activity {self.activity_id} completed by profile {self.user_id}"
+
+    class Meta:
+        verbose_name = _('Activity Completion')
+        verbose_name_plural = _('Activity Completions')
+        unique_together = ('user', 'activity')
+
+
 class Food(models.Model):
     """
     Represents a type of food.
@@ -84,6 +165,7 @@ class Food(models.Model):
     carbohydrates = models.FloatField(verbose_name=_('Carbohydrates'))
     fat = models.FloatField(verbose_name=_('Fat'))
     sodium = models.FloatField(verbose_name=_('Sodium'))
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name=_('Updated At'))  # Used by incremental backups
 
     def __str__(self):
         return self.name
@@ -107,6 +189,7 @@ class Meal(models.Model):
     mealdate = models.DateField(verbose_name=_('Meal Date'))
     mealtime = models.TimeField(verbose_name=_('Meal Time'))
     mealtype = models.CharField(max_length=255, choices=MEAL_TYPES, verbose_name=_('Meal Type'))
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name=_('Updated At'))  # Used by incremental backups
     foods = models.ManyToManyField(Food, through='MealFood', related_name='meals', verbose_name=_('Foods'))
 
     def __str__(self):
@@ -124,6 +207,7 @@ class MealFood(models.Model):
     meal = models.ForeignKey(Meal, on_delete=models.CASCADE, verbose_name=_('Meal'))
     food = models.ForeignKey(Food, on_delete=models.CASCADE, verbose_name=_('Food'))
     quantity = models.PositiveIntegerField(default=1, verbose_name=_('Quantity'))
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name=_('Updated At'))  # Used by incremental backups
 
     def __str__(self):
         return f"{self.quantity} x {self.food.name} in Meal {self.meal.id}"
@@ -138,7 +222,8 @@ class Nutrition(models.Model):
     """
     Represents nutritional information or plans. A high-level grouping model.
     """
-    meals = models.ManyToManyField(Meal, related_name='nutrition_plans', verbose_name=_('Meals'))
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name=_('Updated At'))  # Used by incremental backups
+    meals = models.ManyToManyField(Meal, through='NutritionMeal', related_name='nutrition_plans', verbose_name=_('Meals'))
 
     def __str__(self):
         return f"Nutrition Plan {self.id}"
@@ -148,12 +233,31 @@ class Nutrition(models.Model):
         verbose_name_plural = _('Nutrition Plans')
 
 
+class NutritionMeal(models.Model):
+    """
+    Through model connecting Nutrition and Meal, so the links carry updated_at.
+    """
+    nutrition = models.ForeignKey(Nutrition, on_delete=models.CASCADE, verbose_name=_('Nutrition'))
+    meal = models.ForeignKey(Meal, on_delete=models.CASCADE, verbose_name=_('Meal'))
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name=_('Updated At'))  # Used by incremental backups
+
+    def __str__(self):
+        return f"Meal {self.meal_id} in Nutrition Plan {self.nutrition_id}"
+
+    class Meta:
+        db_table = 'SonareSoma_nutrition_meals'  # The table of the former auto-created through model
+        verbose_name = _('Nutrition Plan Meal')
+        verbose_name_plural = _('Nutrition Plan Meals')
+        unique_together = ('nutrition', 'meal')
+
+
 class Client(models.Model):
     """
     Represents a client relationship with a professional.
     """
     user = models.OneToOneField(PTUser, on_delete=models.CASCADE, related_name='client_profile', verbose_name=_('User'))
     professional = models.ForeignKey(Professional, on_delete=models.CASCADE, related_name='clients', verbose_name=_('Professional'))
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name=_('Updated At'))  # Used by incremental backups
 
     def __str__(self):
         return f"Client {self.user.username} of {self.professional.user.username}"
@@ -164,6 +268,11 @@ class Client(models.Model):
 
 
 # User Profile (Extending the built-in User)
+def random_delivery_slot():
+    """Assigns a new profile a fixed delivery slot, spreading profiles evenly over the day."""
+    return random.randrange(getattr(settings, 'SONARESOMA_DELIVERY_SLOTS', 96))
+
+
 class UserProfile(models.Model):
     """
     Extends the built-in User model with additional fields.
@@ -176,6 +285,9 @@ class UserProfile(models.Model):
     routine = models.ForeignKey(Routine, on_delete=models.SET_NULL, blank=True, null=True, related_name='user_profiles', verbose_name=_('Routine'))
     nutrition = models.ForeignKey(Nutrition, on_delete=models.SET_NULL, blank=True, null=True, related_name='user_profiles', verbose_name=_('Nutrition'))
     professional = models.ForeignKey(Professional, on_delete=models.SET_NULL, blank=True, null=True, related_name='managed_profiles', verbose_name=_('Professional'))  # Changed related name
+    delivery_slot = models.PositiveSmallIntegerField(default=random_delivery_slot, db_index=True, verbose_name=_('Delivery Slot'))  # Slice of the day daily reminders go out in
+    digest_only = models.BooleanField(default=False, verbose_name=_('Digest Only'))  # Receive one daily digest instead of separate emails
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name=_('Updated At'))  # Used by incremental backups
 
     def __str__(self):
         return self.user.username
@@ -185,5 +297,157 @@ class UserProfile(models.Model):
         verbose_name_plural = _('User Profiles')
 
 
+class DailyNutritionTotals(models.Model):
+    """
+    Materialized per-user, per-day macro totals, weighted by MealFood.quantity.
+    Kept up to date by the signal handlers in signals.py and rebuilt in bulk with
+    the rebuild_nutrition_totals management command.
+    """
+    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='daily_nutrition_totals', verbose_name=_('User'))
+    date = models.DateField(verbose_name=_('Date'))
+    calories = models.FloatField(default=0, verbose_name=_('Calories'))
+    protein = models.FloatField(default=0, verbose_name=_('Protein'))
+    carbohydrates = models.FloatField(default=0, verbose_name=_('Carbohydrates'))
+    fat = models.FloatField(default=0, verbose_name=_('Fat'))
+    sodium = models.FloatField(default=0, verbose_name=_('Sodium'))
+
+    def __str__(self):
+        return f"Nutrition totals for profile {self.user_id} on {self.date}"
+
+    class Meta:
+        verbose_name = _('Daily Nutrition Totals')
+        verbose_name_plural = _('Daily Nutrition Totals')
+        unique_together = ('user', 'date')
+
+
+class ChangedRecord(models.Model):
+    """
+    Change marker for a saved row of a model that cannot carry an updated_at
+    column (auth.User), so incremental backups can pick up just those rows.
+    """
+    model = models.CharField(max_length=255, verbose_name=_('Model'))
+    object_id = models.BigIntegerField(verbose_name=_('Object ID'))
+    changed_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name=_('Changed At'))
+
+    def __str__(self):
+        return f"{self.model} {self.object_id} changed at {self.changed_at}"
+
+    class Meta:
+        verbose_name = _('Changed Record')
+        verbose_name_plural = _('Changed Records')
+
+
+class DeletedRecord(models.Model):
+    """
+    Tombstone for a deleted row of a change-tracked model, so incremental
+    backups can replay deletions.
+    """
+    model = models.CharField(max_length=255, verbose_name=_('Model'))
+    object_id = models.BigIntegerField(verbose_name=_('Object ID'))
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name=_('Deleted At'))
+
+    def __str__(self):
+        return f"{self.model} {self.object_id} deleted at {self.deleted_at}"
+
+    class Meta:
+        verbose_name = _('Deleted Record')
+        verbose_name_plural = _('Deleted Records')
+
+
+class NotificationLog(models.Model):
+    """
+    Ledger of notifications already sent, one row per recipient, notification kind
+    and period (e.g. '2025-05-12', '2025-W20', '2025-05'), so re-run tasks skip them.
+    """
+    recipient = models.CharField(max_length=254, verbose_name=_('Recipient'))
+    kind = models.CharField(max_length=100, verbose_name=_('Kind'))
+    period_key = models.CharField(max_length=64, verbose_name=_('Period Key'))
+    sent_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name=_('Sent At'))  # Pruned by age
+    claim_token = models.CharField(max_length=32, blank=True, db_index=True, verbose_name=_('Claim Token'))  # Run that inserted the row
+
+    def __str__(self):
+        return f"{self.kind} for {self.recipient} ({self.period_key})"
+
+    class Meta:
+        verbose_name = _('Notification Log')
+        verbose_name_plural = _('Notification Logs')
+        unique_together = ('recipient', 'kind', 'period_key')
+
 
+class OutboundEmail(models.Model):
+    """
+    An email waiting in the outbound queue. Bulk tasks enqueue these and the
+    drain_outbound_email task sends them at the rate the mail relay allows.
+    """
+    subject = models.CharField(max_length=255, verbose_name=_('Subject'))
+    body = models.TextField(verbose_name=_('Body'))
+    from_email = models.CharField(max_length=254, verbose_name=_('From Email'))
+    recipients = models.TextField(verbose_name=_('Recipients'))  # Comma-separated addresses
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('Created At'))
+    sent_at = models.DateTimeField(blank=True, null=True, db_index=True, verbose_name=_('Sent At'))
+    attempts = models.PositiveIntegerField(default=0, verbose_name=_('Attempts'))
+    locked_until = models.DateTimeField(blank=True, null=True, verbose_name=_('Locked Until'))  # Lease of the drain sending it
+    # The NotificationLog claim behind the email, released if it can never be sent
+    kind = models.CharField(max_length=100, blank=True, verbose_name=_('Kind'))
+    period_key = models.CharField(max_length=64, blank=True, verbose_name=_('Period Key'))
+    claim_token = models.CharField(max_length=32, blank=True, verbose_name=_('Claim Token'))
+
+    def __str__(self):
+        return f"{self.subject} to {self.recipients}"
+
+    @classmethod
+    def from_message(cls, email, kind=''):
+        ledger_key = getattr(email, 'ledger_key', (None, None))
+        return cls(
+            subject=email.subject, body=email.body, from_email=email.from_email, recipients=",".join(email.to),
+            kind=kind or '', period_key=ledger_key[1] or '', claim_token=getattr(email, 'claim_token', ''),
+        )
+
+    @property
+    def ledger_recipient(self):
+        return ",".join(sorted(self.recipients.split(",")))
+
+    def to_message(self, connection=None):
+        return EmailMessage(self.subject, self.body, self.from_email, self.recipients.split(","), connection=connection)
+
+    class Meta:
+        verbose_name = _('Outbound Email')
+        verbose_name_plural = _('Outbound Emails')
+
+
+class RateLimitBucket(models.Model):
+    """Shared token-bucket state, so every worker draws from the same send budget."""
+    name = models.CharField(max_length=100, unique=True, verbose_name=_('Name'))
+    tokens = models.FloatField(verbose_name=_('Tokens'))
+    updated_at = models.DateTimeField(verbose_name=_('Updated At'))
 
+    def __str__(self):
+        return f"{self.name}: {self.tokens:.1f} tokens"
+
+    class Meta:
+        verbose_name = _('Rate Limit Bucket')
+        verbose_name_plural = _('Rate Limit Buckets')
+
+
+class DigestSection(models.Model):
+    """
+    One notification held back for a digest-only user. Bulk tasks write these
+    instead of sending; the send_daily_digests task combines each user's pending
+    sections into one email and deletes them once it is sent.
+    """
+    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='digest_sections', verbose_name=_('User'))
+    digest_date = models.DateField(verbose_name=_('Digest Date'))
+    kind = models.CharField(max_length=100, blank=True, verbose_name=_('Kind'))
+    subject = models.CharField(max_length=255, verbose_name=_('Subject'))
+    body = models.TextField(verbose_name=_('Body'))
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('Created At'))
+
+    def __str__(self):
+        return f"{self.subject} for profile {self.user_id} on {self.digest_date}"
+
+    class Meta:
+        verbose_name = _('Digest Section')
+        verbose_name_plural = _('Digest Sections')
+        indexes = [
+            models.Index(fields=['digest_date', 'user'], name='digestsection_date_user_idx'),
+        ]
@@ -0,0 +1,280 @@
+import logging
+import operator
+import uuid
+from functools import reduce
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .metrics import record_emails
+from .models import DigestSection, NotificationLog, OutboundEmail, UserProfile
+
+logger = logging.getLogger(__name__)
+
+
+def get_from_email():
+    return getattr(settings, 'SONARESOMA_FROM_EMAIL', 'your_email@example.com')
+
+
+def daily_period(date):
+    return date.isoformat()
+
+
+def weekly_period(date):
+    year, week, _ = date.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def monthly_period(date):
+    return date.strftime('%Y-%m')
+
+
+def claim_ledger_keys(kind, keys):
+    """
+    Records (recipient, period_key) keys of `kind` in the NotificationLog ledger and
+    returns (claim token, the keys this call inserted). The insert comes first and
+    conflicts are ignored, so of two concurrent runs only one ever gets a key; keys
+    already in the ledger are not returned.
+    """
+    token = uuid.uuid4().hex
+    NotificationLog.objects.bulk_create(
+        [NotificationLog(recipient=recipient, kind=kind, period_key=period_key, claim_token=token) for recipient, period_key in keys],
+        ignore_conflicts=True,
+    )
+    claimed = set(NotificationLog.objects.filter(kind=kind, claim_token=token).values_list('recipient', 'period_key'))
+    return token, claimed
+
+
+def prune_notification_log(now=None, batch_size=1000):
+    """
+    Deletes ledger rows older than SONARESOMA_NOTIFICATION_LOG_RETENTION_DAYS, which
+    must outlast the longest period (a month) and any late re-run within it.
+    Deletes in primary-key batches and returns the number of rows removed.
+    """
+    cutoff = (now or timezone.now()) - timezone.timedelta(days=getattr(settings, 'SONARESOMA_NOTIFICATION_LOG_RETENTION_DAYS', 62))
+    expired = NotificationLog.objects.filter(sent_at__lt=cutoff)
+    deleted = 0
+    while True:
+        ids = list(expired.order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += NotificationLog.objects.filter(id__in=ids).delete()[0]
+
+
+def get_delivery_slots():
+    return getattr(settings, 'SONARESOMA_DELIVERY_SLOTS', 96)
+
+
+def current_delivery_slot(now=None):
+    """The delivery slot `now` falls in; the day is split into get_delivery_slots() equal slices."""
+    now = timezone.localtime(now)
+    return (now.hour * 60 + now.minute) * get_delivery_slots() // (24 * 60)
+
+
+def claim_due_delivery_slots(now=None):
+    """
+    Claims, in the NotificationLog ledger, every slot of today up to the current one
+    that has not been dispatched yet, and returns them in order. A dispatcher that
+    runs late therefore catches up on the slots it missed instead of skipping them,
+    and concurrent dispatchers never both get a slot. Slots left over from a day
+    that ended before its last dispatcher ran are not caught up.
+    """
+    now = timezone.localtime(now)
+    period_key = daily_period(now.date())
+    _, claimed = claim_ledger_keys('delivery_slot', [(str(slot), period_key) for slot in range(current_delivery_slot(now) + 1)])
+    return sorted(int(slot) for slot, _ in claimed)
+
+
+def next_digest_date(now=None):
+    """The date of the first send_daily_digests run (at SONARESOMA_DIGEST_HOUR) after `now`."""
+    now = timezone.localtime(now)
+    if now.hour >= getattr(settings, 'SONARESOMA_DIGEST_HOUR', 18):
+        return now.date() + timezone.timedelta(days=1)
+    return now.date()
+
+
+class BulkMailer:
+    """
+    Delivers notification emails in batches over a single reused connection.
+
+    Messages are queued with add() and sent every `batch_size` messages, one at a
+    time over the open connection. When a send fails the rest of the batch is
+    retried on a fresh connection up to `max_retries` times before it is logged,
+    counted as failed and kept in `undelivered`. A message that was delivered is
+    never sent again, whether it was in the same batch or an earlier one.
+
+    With a `kind` and `period_key` every message is first claimed in the
+    NotificationLog ledger, one insert and one lookup per batch, and only the
+    messages this mailer claimed are sent. A retried, re-fired or concurrently
+    running task only sends what is still missing for that period.
+
+    With `enqueue=True` batches are written to the OutboundEmail queue instead,
+    to be sent by the rate-limited drain_outbound_email task (see outbox.py).
+
+    With `digest=True` messages to users who opted in to digest-only delivery are
+    stored as DigestSection rows, one lookup per batch, and sent combined by the
+    send_daily_digests task (see digests.py).
+
+    Usage:
+        with BulkMailer(kind='daily_routine_reminder', period_key=daily_period(today)) as mailer:
+            for user in users:
+                mailer.add(subject, message, [user.email])
+        with BulkMailer() as mailer:
+            mailer.broadcast(subject, shared_body, recipients)
+    """
+
+    def __init__(self, batch_size=None, max_retries=None, connection=None, kind=None, period_key=None, enqueue=False, digest=False):
+        self.batch_size = batch_size or getattr(settings, 'SONARESOMA_EMAIL_BATCH_SIZE', 100)
+        self.max_retries = max_retries if max_retries is not None else getattr(settings, 'SONARESOMA_EMAIL_MAX_RETRIES', 3)
+        self.connection = connection or get_connection()
+        self.pending = []
+        self.sent = 0
+        self.failed = 0
+        self.skipped = 0
+        self.broken = False
+        self.kind = kind
+        self.period_key = period_key
+        self.enqueue = enqueue
+        self.queued = 0
+        self.digest = digest
+        self.digested = 0
+        self.undelivered = []
+
+    def __enter__(self):
+        if not self.enqueue:
+            self.connection.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.flush()
+        finally:
+            self.connection.close()
+        return False
+
+    def add(self, subject, message, recipient_list, from_email=None, period_key=None):
+        """Queues one email. period_key overrides the mailer's period for this message only."""
+        self.add_message(EmailMessage(subject, message, from_email or get_from_email(), recipient_list, connection=self.connection), period_key)
+
+    def add_message(self, email, period_key=None):
+        email.ledger_key = (",".join(sorted(email.recipients())), period_key or self.period_key)
+        self.pending.append(email)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def broadcast(self, subject, body, recipients, greeting="Hi {username},\n\n"):
+        """
+        Sends content that is identical for every recipient. The body is rendered once
+        by the caller; only the greeting is formatted per (username, email) recipient,
+        so recipients can be streamed straight from a values_list() iterator.
+        """
+        from_email = get_from_email()
+        for username, email in recipients:
+            self.add_message(EmailMessage(subject, greeting.format(username=username) + body, from_email, [email], connection=self.connection))
+
+    def claim(self, batch):
+        """
+        Drops messages the ledger already has for this kind and period and records the
+        rest with claim_ledger_keys(): one insert and one lookup query for the whole batch.
+        """
+        if not self.kind:
+            return batch
+        unique = {email.ledger_key: email for email in batch}
+        token, claimed_keys = claim_ledger_keys(self.kind, unique)
+        claimed = [email for key, email in unique.items() if key in claimed_keys]
+        for email in claimed:
+            email.claim_token = token
+        self.skipped += len(batch) - len(claimed)
+        return claimed
+
+    def divert_to_digest(self, batch):
+        """
+        Stores the batch's messages to digest-only users as DigestSection rows, dated for
+        the next digest run, and returns the rest. Once today's digest has gone out,
+        messages for today's daily period are sent on their own: the next digest is
+        tomorrow's, when they would be a day late.
+        """
+        now = timezone.localtime()
+        digest_date = next_digest_date(now)
+        today_period = daily_period(now.date()) if digest_date > now.date() else None
+        digestible = [len(email.to) == 1 and email.ledger_key[1] != today_period for email in batch]
+        addresses = {email.to[0] for email, ok in zip(batch, digestible) if ok}
+        profile_ids = dict(
+            UserProfile.objects.filter(digest_only=True, user__email__in=addresses).values_list('user__email', 'id')
+        )
+        if not profile_ids:
+            return batch
+        diverted, remaining = [], []
+        for email, ok in zip(batch, digestible):
+            (diverted if ok and email.to[0] in profile_ids else remaining).append(email)
+        DigestSection.objects.bulk_create([
+            DigestSection(user_id=profile_ids[email.to[0]], digest_date=digest_date, kind=self.kind or '', subject=email.subject, body=email.body)
+            for email in diverted
+        ])
+        self.digested += len(diverted)
+        return remaining
+
+    def release(self, batch):
+        """Removes the ledger entries of a batch that could not be delivered, so a re-run retries it."""
+        if not self.kind:
+            return
+        keys = {email.ledger_key for email in batch}
+        condition = reduce(operator.or_, (Q(recipient=recipient, period_key=period_key) for recipient, period_key in keys))
+        tokens = {email.claim_token for email in batch}
+        NotificationLog.objects.filter(condition, kind=self.kind, claim_token__in=tokens).delete()
+
+    def flush(self):
+        batch, self.pending = self.pending, []
+        if not batch:
+            return 0
+        # The claims commit together with the digest sections or queued emails written
+        # for them, so a failure in between cannot leave claimed messages nobody sends.
+        # No savepoint: the error propagates, so an enclosing transaction is lost anyway.
+        with transaction.atomic(savepoint=False):
+            batch = self.claim(batch)
+            if batch and self.digest:
+                batch = self.divert_to_digest(batch)
+            if batch and self.enqueue:
+                OutboundEmail.objects.bulk_create([OutboundEmail.from_message(email, self.kind) for email in batch])
+        if not batch:
+            return 0
+        if self.enqueue:
+            self.queued += len(batch)
+            record_emails(queued=len(batch))
+            return 0
+        # Messages go out one at a time over the open connection, so a failure part way
+        # through is retried from the first undelivered message, never from the start.
+        delivered = 0
+        for attempt in range(self.max_retries + 1):
+            try:
+                if self.broken:
+                    self.connection.open()
+                    self.broken = False
+                while delivered < len(batch):
+                    self.connection.send_messages([batch[delivered]])
+                    delivered += 1
+                break
+            except Exception as e:
+                logger.warning(f"Email batch of {len(batch)} failed after {delivered} sent (attempt {attempt + 1}): {e}")
+                # Drop the broken connection; the next attempt opens a fresh one.
+                self.connection.close()
+                self.broken = True
+        self.sent += delivered
+        record_emails(sent=delivered)
+        undelivered = batch[delivered:]
+        if undelivered:
+            logger.error(f"Giving up on {len(undelivered)} emails of a batch of {len(batch)} after {self.max_retries + 1} attempts")
+            self.failed += len(undelivered)
+            self.undelivered.extend(undelivered)
+            self.release(undelivered)
+        return delivered
+
+
+def send_bulk(messages, batch_size=None, max_retries=None):
+    """Sends (subject, message, recipient_list) tuples through one BulkMailer."""
+    with BulkMailer(batch_size=batch_size, max_retries=max_retries) as mailer:
+        for subject, message, recipient_list in messages:
+            mailer.add(subject, message, recipient_list)
+    return mailer.sent
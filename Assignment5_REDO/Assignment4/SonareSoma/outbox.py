@@ -0,0 +1,166 @@
+import logging
+import operator
+import time
+from functools import reduce
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import NotificationLog, OutboundEmail, RateLimitBucket
+from .notifications import BulkMailer
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter whose state lives in a RateLimitBucket row, so all
+    workers share one budget. Tokens refill at `rate` per second up to `capacity`.
+    """
+
+    def __init__(self, name, rate, capacity):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+
+    def acquire(self, requested, now=None):
+        """Takes up to `requested` whole tokens and returns how many were granted."""
+        now = now or timezone.now()
+        with transaction.atomic():
+            bucket, _ = RateLimitBucket.objects.select_for_update().get_or_create(
+                name=self.name, defaults={'tokens': self.capacity, 'updated_at': now}
+            )
+            elapsed = max((now - bucket.updated_at).total_seconds(), 0)
+            bucket.tokens = min(self.capacity, bucket.tokens + elapsed * self.rate)
+            granted = min(requested, int(bucket.tokens))
+            bucket.tokens -= granted
+            bucket.updated_at = now
+            bucket.save(update_fields=['tokens', 'updated_at'])
+        return granted
+
+    def seconds_until_available(self):
+        return 1 / self.rate if self.rate else float('inf')
+
+
+def get_mail_bucket():
+    return TokenBucket(
+        'outbound_email',
+        rate=getattr(settings, 'SONARESOMA_EMAIL_RATE_PER_SECOND', 10),
+        capacity=getattr(settings, 'SONARESOMA_EMAIL_BURST', 50),
+    )
+
+
+def get_max_attempts():
+    return getattr(settings, 'SONARESOMA_EMAIL_MAX_ATTEMPTS', 5)
+
+
+def pending_emails(now=None):
+    """Unsent emails with attempts left that no drain currently holds a lease on."""
+    return OutboundEmail.objects.filter(
+        Q(locked_until__isnull=True) | Q(locked_until__lt=now or timezone.now()),
+        sent_at__isnull=True, attempts__lt=get_max_attempts(),
+    )
+
+
+def lease_queued_batch(size, now=None):
+    """
+    Takes up to `size` pending emails for this drain. Rows are locked with
+    skip_locked so concurrent drains never pick the same email. The lease is
+    committed before anything is sent, so no row lock or transaction is held
+    during the SMTP conversation. A drain that dies mid-send leaves its lease to
+    expire, and the emails are sent again after that.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        emails = list(pending_emails(now).select_for_update(skip_locked=True).order_by('id')[:size])
+        if emails:
+            lease = timezone.timedelta(seconds=getattr(settings, 'SONARESOMA_EMAIL_LEASE_SECONDS', 300))
+            OutboundEmail.objects.filter(id__in=[email.id for email in emails]).update(locked_until=now + lease)
+    return emails
+
+
+def send_queued_batch(size):
+    """
+    Sends up to `size` queued emails over one connection and marks the delivered
+    ones sent. Undelivered emails go back to the queue with their attempt count
+    raised. When that reaches SONARESOMA_EMAIL_MAX_ATTEMPTS they are given up, and
+    their ledger claims are released so the task that queued them can queue them
+    again on a re-run.
+    """
+    emails = lease_queued_batch(size)
+    if not emails:
+        return 0
+    with BulkMailer(batch_size=len(emails)) as mailer:
+        messages = [email.to_message(mailer.connection) for email in emails]
+        for message in messages:
+            mailer.add_message(message)
+    undelivered = {id(message) for message in mailer.undelivered}
+    failed = [email for email, message in zip(emails, messages) if id(message) in undelivered]
+    delivered_ids = [email.id for email, message in zip(emails, messages) if id(message) not in undelivered]
+    if delivered_ids:
+        OutboundEmail.objects.filter(id__in=delivered_ids).update(sent_at=timezone.now(), locked_until=None)
+    if failed:
+        for email in failed:
+            email.attempts += 1
+            email.locked_until = None
+        OutboundEmail.objects.bulk_update(failed, ['attempts', 'locked_until'])
+        release_claims([email for email in failed if email.attempts >= get_max_attempts()])
+    return mailer.sent
+
+
+def release_claims(emails):
+    """Deletes the NotificationLog claims of emails that will never be sent."""
+    conditions = [
+        Q(kind=email.kind, recipient=email.ledger_recipient, period_key=email.period_key, claim_token=email.claim_token)
+        for email in emails if email.kind
+    ]
+    if conditions:
+        logger.warning(f"Giving up on {len(emails)} queued emails after {get_max_attempts()} attempts")
+        NotificationLog.objects.filter(reduce(operator.or_, conditions)).delete()
+
+
+def prune_outbox(now=None, batch_size=1000):
+    """
+    Deletes queued emails, with their bodies, once they are older than
+    SONARESOMA_EMAIL_RETENTION_DAYS: sent ones by when they were sent, given-up
+    ones by when they were queued. Deletes in primary-key batches and returns the
+    number of rows removed.
+    """
+    cutoff = (now or timezone.now()) - timezone.timedelta(days=getattr(settings, 'SONARESOMA_EMAIL_RETENTION_DAYS', 7))
+    expired = OutboundEmail.objects.filter(
+        Q(sent_at__lt=cutoff) | Q(sent_at__isnull=True, attempts__gte=get_max_attempts(), created_at__lt=cutoff)
+    )
+    deleted = 0
+    while True:
+        ids = list(expired.order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += OutboundEmail.objects.filter(id__in=ids).delete()[0]
+
+
+def drain_outbox(max_seconds=None, batch_size=None):
+    """
+    Sends queued emails as fast as the shared token bucket allows, for at most
+    `max_seconds`, and returns how many were sent. Meant to be run periodically by
+    beat, so a backlog is worked off at a steady rate instead of in one burst.
+    """
+    max_seconds = max_seconds if max_seconds is not None else getattr(settings, 'SONARESOMA_EMAIL_DRAIN_SECONDS', 55)
+    batch_size = batch_size or getattr(settings, 'SONARESOMA_EMAIL_BATCH_SIZE', 100)
+    bucket = get_mail_bucket()
+    deadline = time.monotonic() + max_seconds
+    sent = 0
+    while True:
+        if not pending_emails().exists():
+            break
+        granted = bucket.acquire(batch_size)
+        if granted:
+            batch_sent = send_queued_batch(granted)
+            sent += batch_sent
+            if not batch_sent or time.monotonic() >= deadline:
+                break  # Out of time, or the relay is failing; leave the rest for the next run
+            continue
+        wait = bucket.seconds_until_available()
+        if time.monotonic() + wait > deadline:
+            break
+        time.sleep(wait)
+    return sent
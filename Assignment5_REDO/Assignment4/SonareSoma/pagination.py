@@ -0,0 +1,116 @@
+import json
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination over a unique ordering on indexed columns, e.g. ('activitydate', 'id').
+
+    The cursor carries the full ordering key of the row it starts after, so every
+    page is a single `WHERE (activitydate, id) > (...)` range read of page_size + 1
+    rows, however deep it is. DRF's own CursorPagination keys on the first field
+    only and steps over ties with an OFFSET.
+
+    The page size defaults to SONARESOMA_API_PAGE_SIZE; clients can ask for another
+    one with ?page_size=, capped at max_page_size or SONARESOMA_API_MAX_PAGE_SIZE.
+    """
+    ordering = ('id',)
+    page_size = None
+    max_page_size = None
+    page_size_query_param = 'page_size'
+
+    def get_page_size(self, request):
+        page_size = self.page_size or getattr(settings, 'SONARESOMA_API_PAGE_SIZE', 100)
+        max_page_size = self.max_page_size or getattr(settings, 'SONARESOMA_API_MAX_PAGE_SIZE', 1000)
+        try:
+            requested = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return min(page_size, max_page_size)
+        return min(max(requested, 1), max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        self.key = self.decode_key(self.cursor, queryset.model)
+
+        reverse = self.cursor is not None and self.cursor.reverse
+        ordering = [invert(field) for field in self.ordering] if reverse else list(self.ordering)
+        queryset = queryset.order_by(*ordering)
+        if self.key is not None:
+            queryset = queryset.filter(after_key(ordering, self.key))
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_more = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.key is not None
+        return self.page
+
+    def decode_key(self, cursor, model):
+        """The cursor's ordering key, each value converted by its model field; 404 if any is invalid."""
+        if cursor is None or cursor.position is None:
+            return None
+        try:
+            key = json.loads(cursor.position)
+            if not isinstance(key, list) or len(key) != len(self.ordering):
+                raise ValueError
+            key = [model._meta.get_field(field.lstrip('-')).to_python(value) for field, value in zip(self.ordering, key)]
+        except (ValidationError, ValueError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+        if None in key:
+            raise NotFound(self.invalid_cursor_message)
+        return key
+
+    def key_of(self, instance):
+        return [str(getattr(instance, field.lstrip('-'))) for field in self.ordering]
+
+    def link(self, key, reverse):
+        return self.encode_cursor(Cursor(offset=0, reverse=reverse, position=json.dumps(key)))
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        # An empty page reached backwards continues from where it started
+        return self.link(self.key_of(self.page[-1]) if self.page else self.key, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.link(self.key_of(self.page[0]) if self.page else self.key, reverse=True)
+
+
+def invert(field):
+    return field[1:] if field.startswith('-') else f"-{field}"
+
+
+def beyond(field, value):
+    name = field.lstrip('-')
+    return Q(**{f"{name}__{'lt' if field.startswith('-') else 'gt'}": value})
+
+
+def after_key(ordering, key):
+    """Rows strictly after `key` in `ordering`: (a > x) | (a = x & ((b > y) | ...))."""
+    items = list(zip(ordering, key))
+    field, value = items[-1]
+    condition = beyond(field, value)
+    for field, value in reversed(items[:-1]):
+        condition = beyond(field, value) | (Q(**{field.lstrip('-'): value}) & condition)
+    return condition
+
+
+class GoalPagination(KeysetPagination):
+    ordering = ('startdate', 'id')
+
+
+class ActivityPagination(KeysetPagination):
+    ordering = ('activitydate', 'id')
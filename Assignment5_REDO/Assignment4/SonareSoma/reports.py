@@ -0,0 +1,40 @@
+from itertools import groupby
+from .emails import render_email
+
+
+def build_client_retention_report(professional):
+    """Builds the retention email for a professional annotated by ProfessionalRepository.get_client_report_stats()."""
+    total_clients = professional.total_clients
+    active_clients = professional.active_clients
+    retention_rate = (active_clients / total_clients) * 100 if total_clients > 0 else 0
+
+    subject = "Monthly Client Retention Report"
+    message = render_email(
+        'client_retention_report',
+        username=professional.PTUser.username,
+        total_clients=total_clients,
+        active_clients=active_clients,
+        retention_rate=retention_rate,
+        goals_set=professional.goals_set,
+        active_goals=professional.active_goals,
+    )
+    return subject, message
+
+
+def build_client_progress_report(professional, clients):
+    """Builds the progress email for one professional from clients with prefetched goals."""
+    subject = "Weekly Client Progress Report"
+    rows = []
+    for client in clients:
+        profile = getattr(client.user, 'user_profile', None)
+        goals = [goal for goal in profile.goals.all() if goal.professional_id == professional.id] if profile else []
+        rows.append((client.user.username, goals))
+    message = render_email('client_progress_report', username=professional.PTUser.username, clients=rows)
+    return subject, message
+
+
+def group_clients_by_professional(clients):
+    """Groups clients ordered by professional into (professional, [clients]) pairs in one streaming pass."""
+    for _, group in groupby(clients, key=lambda client: client.professional_id):
+        group = list(group)
+        yield group[0].professional, group
@@ -1,4 +1,12 @@
-from .models import Professional, UserProfile, Goal
+import operator
+from collections import defaultdict
+from functools import reduce
+from itertools import groupby
+from django.db import transaction
+from django.db.models import Count, Exists, F, Max, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import Professional, Client, UserProfile, Goal, GoalProgress, Activity, ActivityCompletion, Routine, MealFood, DailyNutritionTotals
 
 class ProfessionalRepository:
     @staticmethod
@@ -9,6 +17,66 @@ class ProfessionalRepository:
     def get_clients_for_professional(professional):
         return professional.clients.select_related('user').all()
 
+    @staticmethod
+    def get_client_report_stats(start_date, end_date):
+        """
+        Annotates every professional (with its user) in a single query with:
+        total_clients, active_clients (clients with a routine activity in the date
+        range), goals_set (goals starting in the range) and active_goals (goals
+        overlapping the range).
+        """
+        active_client_ids = Client.objects.filter(
+            user__user_profile__routine__activities__activitydate__range=(start_date, end_date)
+        ).values('pk')
+        goal_counts = Goal.objects.filter(professional=OuterRef('pk')).order_by().values('professional')
+
+        def count_goals(condition):
+            return Coalesce(Subquery(goal_counts.annotate(n=Count('pk', filter=condition)).values('n')), 0)
+
+        return (
+            Professional.objects.select_related('PTUser')
+            .annotate(
+                total_clients=Count('clients'),
+                active_clients=Count('clients', filter=Q(clients__in=active_client_ids)),
+                goals_set=count_goals(Q(startdate__range=(start_date, end_date))),
+                active_goals=count_goals(Q(startdate__lte=end_date, enddate__gte=start_date)),
+            )
+            .order_by('id')
+        )
+
+    @staticmethod
+    def get_clients_with_goals():
+        """
+        All clients ordered by professional, with their user, profile and professional
+        joined in, and their goals prefetched: two queries in total.
+        """
+        return (
+            Client.objects.select_related('user__user_profile', 'professional__PTUser')
+            .prefetch_related('user__user_profile__goals')
+            .order_by('professional_id', 'id')
+        )
+
+    @staticmethod
+    def get_weekly_goal_summaries(start_date, end_date):
+        """
+        Yields (professional, [(client username, [goals])]) for every professional who
+        set goals starting in the date range, streamed from one joined query over Goal.
+        """
+        goals = (
+            Goal.objects.filter(startdate__range=(start_date, end_date))
+            .select_related('client__user', 'professional__PTUser')
+            .order_by('professional_id', 'client_id', 'startdate', 'id')
+            .iterator(chunk_size=2000)
+        )
+        for _, professional_goals in groupby(goals, key=lambda goal: goal.professional_id):
+            professional = None
+            clients = []
+            for _, client_goals in groupby(professional_goals, key=lambda goal: goal.client_id):
+                client_goals = list(client_goals)
+                professional = client_goals[0].professional
+                clients.append((client_goals[0].client.user.username, client_goals))
+            yield professional, clients
+
 class UserProfileRepository:
     @staticmethod
     def get_user_profile_by_id(user_id):
@@ -18,6 +86,79 @@ class UserProfileRepository:
     def get_user_profile_by_user(user):
         return UserProfile.objects.filter(user=user).first()
 
+    @staticmethod
+    def get_profiles_with_routine():
+        """Profiles that follow a routine, with their user loaded in the same query."""
+        return (
+            UserProfile.objects.filter(routine__isnull=False)
+            .select_related('user')
+            .only('id', 'routine_id', 'user__username', 'user__email')
+            .order_by('id')
+        )
+
+    @staticmethod
+    def get_recipients(queryset=None):
+        """Streams (username, email) pairs for the given profiles without building model instances."""
+        queryset = UserProfile.objects.all() if queryset is None else queryset
+        return queryset.order_by('id').values_list('user__username', 'user__email').iterator(chunk_size=2000)
+
+    @staticmethod
+    def get_inactive_recipients(since):
+        """
+        Streams (username, email) for profiles with no routine activity on or after
+        `since`, including profiles without a routine or activities, in one grouped query.
+        """
+        return (
+            UserProfile.objects.annotate(last_activity=Max('routine__activities__activitydate'))
+            .filter(Q(last_activity__isnull=True) | Q(last_activity__lt=since))
+            .order_by('id')
+            .values_list('user__username', 'user__email')
+            .iterator(chunk_size=2000)
+        )
+
+class RoutineRepository:
+    @staticmethod
+    def get_activities_by_routine(activitydate, end_date=None):
+        """
+        Returns {routine_id: [activity, ...]} for every routine with activities on
+        the given date, or from it through end_date, fetched with a single joined query.
+        """
+        links = (
+            Routine.activities.through.objects.filter(activity__activitydate__range=(activitydate, end_date or activitydate))
+            .select_related('activity')
+            .order_by('activity__activitydate', 'activity__starttime', 'activity_id')
+        )
+        activities_by_routine = defaultdict(list)
+        for link in links:
+            activities_by_routine[link.routine_id].append(link.activity)
+        return activities_by_routine
+
+    @staticmethod
+    def get_missed_activities(activitydate, slot=None):
+        """
+        Yields (username, email, [activities]) for every profile whose routine had
+        activities on the given date with no ActivityCompletion for that profile.
+        One query: the scheduled (profile, activity) pairs anti-joined against the
+        completions, ordered so each profile's activities arrive together.
+        """
+        missed = (
+            Activity.objects.filter(activitydate=activitydate)
+            .annotate(
+                profile_id=F('routines__user_profiles__id'),
+                profile_slot=F('routines__user_profiles__delivery_slot'),
+                username=F('routines__user_profiles__user__username'),
+                email=F('routines__user_profiles__user__email'),
+            )
+            .filter(profile_id__isnull=False)
+            .filter(~Exists(ActivityCompletion.objects.filter(user=OuterRef('profile_id'), activity=OuterRef('pk'))))
+            .order_by('profile_id', 'starttime', 'id')
+        )
+        if slot is not None:
+            missed = missed.filter(profile_slot=slot)
+        for _, activities in groupby(missed.iterator(chunk_size=2000), key=lambda activity: activity.profile_id):
+            activities = list(activities)
+            yield activities[0].username, activities[0].email, activities
+
 class GoalRepository:
     @staticmethod
     def create_goal(goaltype, goalvalue, startdate, enddate, client, professional):
@@ -29,3 +170,122 @@ class GoalRepository:
             client=client,
             professional=professional,
         )
+
+    @staticmethod
+    def record_progress(goal, value, recorded_at=None):
+        return GoalProgress.objects.create(goal=goal, value=value, recorded_at=recorded_at or timezone.now())
+
+    @staticmethod
+    def apply_progress(goal_id, value, recorded_at):
+        """
+        Folds one new measurement into the goal's denormalized columns with two
+        conditional UPDATEs: latest_value only moves forward in time, and
+        achieved_at is set once, by the first value that reaches the target.
+        update() skips auto_now, so both bump updated_at for incremental backups.
+        """
+        now = timezone.now()
+        Goal.objects.filter(pk=goal_id).filter(Q(latest_recorded_at__isnull=True) | Q(latest_recorded_at__lte=recorded_at)).update(
+            latest_value=value, latest_recorded_at=recorded_at, updated_at=now,
+        )
+        Goal.objects.filter(pk=goal_id, achieved_at__isnull=True, goalvalue__lte=value).update(achieved_at=recorded_at, updated_at=now)
+
+    @staticmethod
+    def get_recently_achieved(since):
+        """Goals achieved at or after `since`, with their client's user joined in."""
+        return Goal.objects.filter(achieved_at__gte=since).select_related('client__user').order_by('achieved_at', 'id')
+
+    @staticmethod
+    def get_active_goals_by_client(start_date, end_date):
+        """Yields (client profile, [goals]) for goals overlapping the date range, from one joined query."""
+        goals = (
+            Goal.objects.filter(startdate__lte=end_date, enddate__gte=start_date)
+            .select_related('client__user')
+            .order_by('client_id', 'id')
+        )
+        for _, client_goals in groupby(goals, key=lambda goal: goal.client_id):
+            client_goals = list(client_goals)
+            yield client_goals[0].client, client_goals
+
+class NutritionRepository:
+    MACROS = ('calories', 'protein', 'carbohydrates', 'fat', 'sodium')
+
+    @staticmethod
+    def get_macro_totals(start_date, end_date):
+        """
+        Returns {user_profile_id: {'calories', 'protein', 'carbohydrates', 'fat', 'sodium', 'days'}}
+        for every profile with logged meals in the date range, summed in a single query
+        over the DailyNutritionTotals rollup (one row per user per day).
+        """
+        rows = (
+            DailyNutritionTotals.objects.filter(date__range=(start_date, end_date))
+            .values('user_id')
+            .annotate(days=Count('date'), **{macro: Sum(macro) for macro in NutritionRepository.MACROS})
+            .order_by()
+        )
+        return {row.pop('user_id'): row for row in rows}
+
+    @staticmethod
+    def get_daily_macro_rows(meal_filter=None):
+        """
+        Computes (user_id, date, macros...) rows from raw MealFood data, weighting every
+        food's macros by MealFood.quantity. Optionally restricted by a Q over MealFood.
+        """
+        queryset = MealFood.objects.filter(meal__nutrition_plans__user_profiles__isnull=False)
+        if meal_filter is not None:
+            queryset = queryset.filter(meal_filter)
+        return (
+            queryset.values(user_id=F('meal__nutrition_plans__user_profiles'), date=F('meal__mealdate'))
+            .annotate(**{macro: Sum(F('quantity') * F(f'food__{macro}')) for macro in NutritionRepository.MACROS})
+            .order_by()
+        )
+
+    @staticmethod
+    def get_keys_for_meals(meal_ids):
+        """Returns the (user_profile_id, date) rollup keys affected by the given meals."""
+        return set(
+            UserProfile.objects.filter(nutrition__meals__in=meal_ids)
+            .values_list('id', 'nutrition__meals__mealdate')
+        )
+
+    @staticmethod
+    def refresh_daily_totals(keys, batch_size=500):
+        """Recomputes the DailyNutritionTotals rows for the given (user_profile_id, date) keys."""
+        keys = list(keys)
+        for i in range(0, len(keys), batch_size):
+            chunk = keys[i:i + batch_size]
+            meal_filter = reduce(operator.or_, (
+                Q(meal__nutrition_plans__user_profiles=user_id, meal__mealdate=date) for user_id, date in chunk
+            ))
+            rows = [DailyNutritionTotals(**row) for row in NutritionRepository.get_daily_macro_rows(meal_filter)]
+            with transaction.atomic():
+                DailyNutritionTotals.objects.filter(reduce(operator.or_, (
+                    Q(user_id=user_id, date=date) for user_id, date in chunk
+                ))).delete()
+                DailyNutritionTotals.objects.bulk_create(rows)
+
+    @staticmethod
+    def refresh_profile_totals(user_id):
+        """Recomputes every DailyNutritionTotals row of one profile, e.g. after its plan changed."""
+        rows = [DailyNutritionTotals(**row) for row in NutritionRepository.get_daily_macro_rows(
+            Q(meal__nutrition_plans__user_profiles=user_id)
+        )]
+        with transaction.atomic():
+            DailyNutritionTotals.objects.filter(user_id=user_id).delete()
+            DailyNutritionTotals.objects.bulk_create(rows)
+
+    @staticmethod
+    def rebuild_daily_totals(batch_size=1000):
+        """Rebuilds the whole rollup from raw meal data, streaming rows in batches."""
+        created = 0
+        with transaction.atomic():
+            DailyNutritionTotals.objects.all().delete()
+            batch = []
+            for row in NutritionRepository.get_daily_macro_rows().iterator(chunk_size=batch_size):
+                batch.append(DailyNutritionTotals(**row))
+                if len(batch) >= batch_size:
+                    DailyNutritionTotals.objects.bulk_create(batch)
+                    created += len(batch)
+                    batch = []
+            DailyNutritionTotals.objects.bulk_create(batch)
+            created += len(batch)
+        return created
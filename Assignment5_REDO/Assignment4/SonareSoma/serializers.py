@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 from django.contrib.auth import get_user_model
 from .models import (
     Professional,
@@ -15,13 +16,61 @@ from .models import (
 
 User = get_user_model()
 
+
+def split_query_param(request, name):
+    return [value.strip() for value in request.query_params.get(name, '').split(',') if value.strip()]
+
+
+class DynamicFieldsMixin:
+    """
+    Lets API clients pick the fields of a read with ?fields=a,b or drop some with
+    ?omit=a,b; unknown names are rejected with a 400. Writes always use every field.
+    Only the top-level serializer of a request is pruned; nested serializers are
+    built without the request context.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return
+        selected = split_query_param(request, 'fields')
+        omitted = split_query_param(request, 'omit')
+        unknown = {param: [name for name in names if name not in self.fields]
+                   for param, names in (('fields', selected), ('omit', omitted))}
+        if any(unknown.values()):
+            raise serializers.ValidationError({
+                param: [f"Unknown field: {name}" for name in names] for param, names in unknown.items() if names
+            })
+        for name in list(self.fields):
+            if (selected and name not in selected) or name in omitted:
+                self.fields.pop(name)
+
+
+def selected_columns(serializer, prefix=''):
+    """
+    The .only() arguments for the model columns a ModelSerializer's fields read: the
+    primary key, every field backed by a concrete model field, and the columns of
+    nested serializers on forward foreign keys under their `<field>__` prefix.
+    """
+    opts = serializer.Meta.model._meta
+    concrete = {field.name for field in opts.concrete_fields}
+    columns = [f"{prefix}{opts.pk.name}"]
+    for field in serializer.fields.values():
+        if field.source not in concrete:
+            continue
+        columns.append(f"{prefix}{field.source}")
+        if isinstance(field, serializers.ModelSerializer):
+            columns.extend(selected_columns(field, f"{prefix}{field.source}__"))
+    return columns
+
 class UserSerializer(serializers.ModelSerializer):
     """Serializer for the User model."""
     class Meta:
         model = User
         fields = ('id', 'username', 'email', 'first_name', 'last_name')  # Include necessary fields
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Serializer for the UserProfile model."""
     user = UserSerializer()  # Nest the UserSerializer
     class Meta:
@@ -30,21 +79,22 @@ class UserProfileSerializer(serializers.ModelSerializer):
         #read_only_fields = ('user',)  # Prevent user field from being modified
 
 
-class ProfessionalSerializer(serializers.ModelSerializer):
+class ProfessionalSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Serializer for the Professional model."""
     class Meta:
         model = Professional
         fields = '__all__'
 
 
-class GoalSerializer(serializers.ModelSerializer):
+class GoalSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Serializer for the Goal model."""
     class Meta:
         model = Goal
         fields = '__all__'
+        read_only_fields = ('latest_value', 'latest_recorded_at', 'achieved_at')  # Maintained from GoalProgress
 
 
-class ActivitySerializer(serializers.ModelSerializer):
+class ActivitySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Serializer for the Activity model."""
     class Meta:
         model = Activity
@@ -61,7 +111,7 @@ class RoutineSerializer(serializers.ModelSerializer):
 
 
 
-class FoodSerializer(serializers.ModelSerializer):
+class FoodSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Serializer for the Food model."""
     class Meta:
         model = Food
@@ -78,15 +128,15 @@ class MealFoodSerializer(serializers.ModelSerializer):
 
 class MealSerializer(serializers.ModelSerializer):
     """Serializer for the Meal model."""
-    # foods = FoodSerializer(many=True)  # Use MealFoodSerializer
-    meals = MealFoodSerializer(many=True, read_only=True)
+    # The meal's MealFood rows with their foods, read from mealfood_set (prefetched by NutritionViewSet)
+    foods = MealFoodSerializer(source='mealfood_set', many=True, read_only=True)
     class Meta:
         model = Meal
         fields = '__all__'
 
 
 
-class NutritionSerializer(serializers.ModelSerializer):
+class NutritionSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Serializer for the Nutrition model."""
     meals = MealSerializer(many=True)
     class Meta:
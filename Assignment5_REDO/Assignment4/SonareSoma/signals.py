@@ -0,0 +1,160 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.db import transaction
+from django.dispatch import receiver
+from .catalog import bump_catalog_version
+from .models import (
+    Activity, ActivityCompletion, ChangedRecord, Client, DeletedRecord, Food, Goal, GoalProgress, Meal, MealFood,
+    Nutrition, NutritionMeal, Professional, Routine, RoutineActivity, UserProfile,
+)
+from .repositories import GoalRepository, NutritionRepository
+
+# Keep DailyNutritionTotals in step with the raw meal data. Each handler only
+# recomputes the (user profile, date) rows touched by the change. The keys are
+# collected in the pre_* signal because the links they come from may be gone by
+# the time the post_* signal fires.
+
+MACRO_FIELDS = NutritionRepository.MACROS
+
+
+@receiver(pre_save, sender=MealFood)
+def remember_previous_meal(sender, instance, **kwargs):
+    instance._nutrition_keys = set()
+    if instance.pk:
+        previous_meal_id = MealFood.objects.filter(pk=instance.pk).values_list('meal_id', flat=True).first()
+        if previous_meal_id and previous_meal_id != instance.meal_id:
+            instance._nutrition_keys = NutritionRepository.get_keys_for_meals([previous_meal_id])
+
+
+@receiver(post_save, sender=MealFood)
+def refresh_totals_for_meal_food(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    keys = getattr(instance, '_nutrition_keys', set()) | NutritionRepository.get_keys_for_meals([instance.meal_id])
+    NutritionRepository.refresh_daily_totals(keys)
+
+
+@receiver(pre_delete, sender=MealFood)
+def remember_meal_food_keys(sender, instance, **kwargs):
+    instance._nutrition_keys = NutritionRepository.get_keys_for_meals([instance.meal_id])
+
+
+@receiver(post_delete, sender=MealFood)
+def refresh_totals_after_meal_food_delete(sender, instance, **kwargs):
+    NutritionRepository.refresh_daily_totals(getattr(instance, '_nutrition_keys', set()))
+
+
+@receiver(pre_save, sender=Meal)
+def remember_previous_meal_date(sender, instance, **kwargs):
+    instance._nutrition_keys = set()
+    if instance.pk:
+        previous_date = Meal.objects.filter(pk=instance.pk).values_list('mealdate', flat=True).first()
+        if previous_date and previous_date != instance.mealdate:
+            instance._nutrition_keys = NutritionRepository.get_keys_for_meals([instance.pk])
+
+
+@receiver(post_save, sender=Meal)
+def refresh_totals_for_meal_date(sender, instance, raw=False, **kwargs):
+    keys = getattr(instance, '_nutrition_keys', set())
+    if keys and not raw:
+        NutritionRepository.refresh_daily_totals(keys | NutritionRepository.get_keys_for_meals([instance.pk]))
+
+
+@receiver(pre_save, sender=Food)
+def remember_previous_macros(sender, instance, **kwargs):
+    instance._macros_changed = False
+    if instance.pk:
+        previous = Food.objects.filter(pk=instance.pk).values(*MACRO_FIELDS).first()
+        instance._macros_changed = previous is not None and any(
+            previous[field] != getattr(instance, field) for field in MACRO_FIELDS
+        )
+
+
+@receiver(post_save, sender=Food)
+def refresh_totals_for_food(sender, instance, raw=False, **kwargs):
+    if getattr(instance, '_macros_changed', False) and not raw:
+        meal_ids = MealFood.objects.filter(food=instance).values('meal_id')
+        NutritionRepository.refresh_daily_totals(NutritionRepository.get_keys_for_meals(meal_ids))
+
+
+@receiver(post_save, sender=Food)
+@receiver(post_delete, sender=Food)
+def invalidate_food_catalog(sender, **kwargs):
+    # After commit, so no reader can cache the old rows under the new version
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(pre_save, sender=UserProfile)
+def remember_previous_nutrition_plan(sender, instance, **kwargs):
+    previous_nutrition_id = None
+    if instance.pk:
+        previous_nutrition_id = UserProfile.objects.filter(pk=instance.pk).values_list('nutrition_id', flat=True).first()
+    instance._nutrition_changed = previous_nutrition_id != instance.nutrition_id
+
+
+@receiver(post_save, sender=UserProfile)
+def refresh_totals_for_profile(sender, instance, raw=False, **kwargs):
+    if getattr(instance, '_nutrition_changed', False) and not raw:
+        NutritionRepository.refresh_profile_totals(instance.pk)
+
+
+@receiver(pre_delete, sender=Nutrition)
+def remember_plan_profiles(sender, instance, **kwargs):
+    instance._profile_ids = list(instance.user_profiles.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Nutrition)
+def refresh_totals_after_plan_delete(sender, instance, **kwargs):
+    # The profiles' plan was cleared by an UPDATE (SET_NULL), which sends no post_save
+    for profile_id in getattr(instance, '_profile_ids', []):
+        NutritionRepository.refresh_profile_totals(profile_id)
+
+
+@receiver(m2m_changed, sender=Nutrition.meals.through)
+def refresh_totals_for_plan_meals(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        meal_ids = [instance.pk]
+    elif action in ('pre_clear', 'post_clear'):
+        meal_ids = instance.meals.values('pk')
+    else:
+        meal_ids = pk_set or []
+
+    if action in ('pre_remove', 'pre_clear'):
+        instance._nutrition_keys = NutritionRepository.get_keys_for_meals(meal_ids)
+    elif action == 'post_add':
+        NutritionRepository.refresh_daily_totals(NutritionRepository.get_keys_for_meals(meal_ids))
+    elif action in ('post_remove', 'post_clear'):
+        NutritionRepository.refresh_daily_totals(getattr(instance, '_nutrition_keys', set()))
+
+
+@receiver(post_delete, sender=Activity)
+@receiver(post_delete, sender=ActivityCompletion)
+@receiver(post_delete, sender=Client)
+@receiver(post_delete, sender=Food)
+@receiver(post_delete, sender=Goal)
+@receiver(post_delete, sender=GoalProgress)
+@receiver(post_delete, sender=Meal)
+@receiver(post_delete, sender=MealFood)
+@receiver(post_delete, sender=Nutrition)
+@receiver(post_delete, sender=NutritionMeal)
+@receiver(post_delete, sender=Professional)
+@receiver(post_delete, sender=Routine)
+@receiver(post_delete, sender=RoutineActivity)
+@receiver(post_delete, sender=UserProfile)
+@receiver(post_delete, sender=get_user_model())
+def record_deletion(sender, instance, **kwargs):
+    # Tombstones let incremental backups replay deletions of change-tracked rows.
+    DeletedRecord.objects.create(model=sender._meta.label, object_id=instance.pk)
+
+
+@receiver(post_save, sender=get_user_model())
+def record_user_change(sender, instance, raw=False, **kwargs):
+    # auth.User has no updated_at column, so incremental backups find its changes here.
+    if not raw:
+        ChangedRecord.objects.create(model=sender._meta.label, object_id=instance.pk)
+
+
+@receiver(post_save, sender=GoalProgress)
+def update_goal_latest_progress(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        GoalRepository.apply_progress(instance.goal_id, instance.value, instance.recorded_at)
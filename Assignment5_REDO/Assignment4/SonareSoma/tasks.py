@@ -1,30 +1,78 @@
-from celery import shared_task
+from celery import shared_task, group
+from django.conf import settings
 from django.utils import timezone
-from .models import Routine, UserProfile, Professional
+from .models import UserProfile, Professional
+from .repositories import ProfessionalRepository, RoutineRepository, UserProfileRepository, NutritionRepository, GoalRepository
+from .reports import build_client_progress_report, build_client_retention_report, group_clients_by_professional
 from django.db import models
-from django.core.mail import send_mail
+from .notifications import BulkMailer, send_bulk, daily_period, weekly_period, monthly_period, claim_due_delivery_slots
+from .emails import render_email
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Chunk tasks retry on their own, so a failure only re-runs one primary-key range.
+CHUNK_TASK_OPTIONS = {'autoretry_for': (Exception,), 'retry_backoff': True, 'max_retries': 3}
+
+
+def get_pk_ranges(queryset, chunk_size=None):
+    """
+    Splits the queryset's rows into inclusive (start_pk, end_pk) ranges of chunk_size
+    rows each, paging through its own primary keys. A filtered queryset, such as one
+    delivery slot, whose rows are scattered over the table therefore still gets full
+    chunks instead of one mostly empty chunk per chunk_size keys of the whole span.
+    """
+    chunk_size = chunk_size or getattr(settings, 'SONARESOMA_FANOUT_CHUNK_SIZE', 1000)
+    pks = queryset.order_by('pk').values_list('pk', flat=True)
+    ranges = []
+    while True:
+        page = list((pks.filter(pk__gt=ranges[-1][1]) if ranges else pks)[:chunk_size])
+        if not page:
+            return ranges
+        ranges.append((page[0], page[-1]))
+
+
+def dispatch_in_chunks(chunk_task, queryset, chunk_size=None, **kwargs):
+    """Dispatches chunk_task(start_pk, end_pk, **kwargs) for every pk range of the queryset as a Celery group."""
+    ranges = get_pk_ranges(queryset, chunk_size)
+    if ranges:
+        group(chunk_task.s(start_pk, end_pk, **kwargs) for start_pk, end_pk in ranges).apply_async()
+    print(f"Dispatched {len(ranges)} chunks of {chunk_task.name}")
+    return len(ranges)
+
+
+def in_delivery_slot(queryset, slot):
+    """Narrows a UserProfile queryset to one delivery slot; slot=None keeps every profile."""
+    return queryset if slot is None else queryset.filter(delivery_slot=slot)
+
+@shared_task
+def send_daily_notifications_for_slot(slot=None):
+    """
+    Run by beat once per delivery slot (see CELERY_BEAT_SCHEDULE): sends the daily
+    reminders of the profiles in each slot that is due, so each profile is reached
+    at the same time every day and the load is spread evenly over the day. A run
+    delayed in the queue also dispatches the slots it missed (see
+    claim_due_delivery_slots). With an explicit slot only that slot is sent.
+    """
+    slots = claim_due_delivery_slots() if slot is None else [slot]
+    for slot in slots:
+        for task in (send_daily_routine_reminder, send_daily_meal_plan_reminder, send_missed_routine_notification):
+            task.delay(slot=slot)
+    print(f"Dispatched daily notifications for delivery slots {slots}")
+    return slots
+
 @shared_task
-def send_daily_routine_reminder():
+def send_daily_routine_reminder(slot=None):
     today = timezone.now().date()
-    for routine in Routine.objects.all():
-        users = routine.user_profiles.all()  # Assuming Routine is linked to UserProfile
-        for user in users:
+    # One query for today's activities of every routine, one streamed query for the users.
+    activities_by_routine = RoutineRepository.get_activities_by_routine(today)
+    users = in_delivery_slot(UserProfileRepository.get_profiles_with_routine(), slot)
+    with BulkMailer(kind='daily_routine_reminder', period_key=daily_period(today), digest=True) as mailer:
+        for user in users.iterator(chunk_size=2000):
             subject = "Today's Routine Reminder"
-            message = f"Hi {user.user.username},\n\nHere are your activities for today:\n"
-            activities = routine.activities.filter(activitydate=today)
-            if activities.exists():
-                activity_list = "\n".join([f"- {activity.activitytype} at {activity.starttime}" for activity in activities])
-                message += f"{activity_list}\n\nStay consistent and achieve your goals!"
-            else:
-                message += "No activities scheduled for today. Enjoy your rest day!"
-            from_email = 'your_email@example.com'
-            recipient_list = [user.user.email]
-            send_mail(subject, message, from_email, recipient_list)
-            print(f"Sent daily routine reminder to {user.user.email}")
+            message = render_email('daily_routine_reminder', username=user.user.username, activities=activities_by_routine.get(user.routine_id))
+            mailer.add(subject, message, [user.user.email])
+    print(f"Sent {mailer.sent} daily routine reminders")
 
 @shared_task
 def send_weekly_goal_summary():
@@ -32,134 +80,124 @@ def send_weekly_goal_summary():
     start_of_week = today - timezone.timedelta(days=today.weekday())
     end_of_week = start_of_week + timezone.timedelta(days=6)
 
-    for user in UserProfile.objects.all():
-        goals = user.goal_set.filter(startdate__lte=end_of_week, enddate__gte=start_of_week)
-        if goals.exists():
+    with BulkMailer(kind='weekly_goal_summary', period_key=weekly_period(today), enqueue=True, digest=True) as mailer:
+        for user, goals in GoalRepository.get_active_goals_by_client(start_of_week, end_of_week):
             subject = "Your Weekly Goal Progress Summary"
-            message = f"Hi {user.user.username},\n\nHere's your progress for this week:\n"
-            for goal in goals:
-                progress = f"- {goal.goaltype}: {goal.goalvalue} (Target: {goal.goalvalue})"
-                message += f"{progress}\n"
-            message += "\nKeep up the great work!"
-            from_email = 'your_email@example.com'
-            recipient_list = [user.user.email]
-            send_mail(subject, message, from_email, recipient_list)
-            print(f"Sent weekly goal summary to {user.user.email}")
+            message = render_email('weekly_goal_summary', username=user.user.username, goals=goals)
+            mailer.add(subject, message, [user.user.email])
+    print(f"Queued {mailer.queued} weekly goal summaries")
 
 @shared_task
-def send_missed_routine_notification():
+def send_missed_routine_notification(slot=None):
     yesterday = timezone.now().date() - timezone.timedelta(days=1)
-    for routine in Routine.objects.all():
-        users = routine.user_profiles.all()
-        for user in users:
-            missed_activities = routine.activities.filter(activitydate=yesterday, endtime__lt=timezone.now().time())
-            if missed_activities.exists():
-                subject = "Missed Routine Notification"
-                message = f"Hi {user.user.username},\n\nYou missed the following activities yesterday:\n"
-                activity_list = "\n".join([f"- {activity.activitytype} at {activity.starttime}" for activity in missed_activities])
-                message += f"{activity_list}\n\nDon't worry, you can get back on track today!"
-                from_email = 'your_email@example.com'
-                recipient_list = [user.user.email]
-                send_mail(subject, message, from_email, recipient_list)
-                print(f"Sent missed routine notification to {user.user.email}")
+    with BulkMailer(kind='missed_routine_notification', period_key=daily_period(yesterday)) as mailer:
+        for username, email, missed_activities in RoutineRepository.get_missed_activities(yesterday, slot):
+            subject = "Missed Routine Notification"
+            message = render_email('missed_routine_notification', username=username, activities=missed_activities)
+            mailer.add(subject, message, [email])
+    print(f"Sent {mailer.sent} missed routine notifications")
 
 @shared_task
-def send_daily_meal_plan_reminder():
-    today = timezone.now().date()
-    for user in UserProfile.objects.all():
-        if user.nutrition:
+def send_daily_meal_plan_reminder(slot=None):
+    users = in_delivery_slot(UserProfile.objects.filter(nutrition__isnull=False), slot)
+    return dispatch_in_chunks(send_daily_meal_plan_reminder_chunk, users, slot=slot)
+
+@shared_task(**CHUNK_TASK_OPTIONS)
+def send_daily_meal_plan_reminder_chunk(start_pk, end_pk, slot=None):
+    users = in_delivery_slot(UserProfile.objects.filter(pk__range=(start_pk, end_pk), nutrition__isnull=False), slot).select_related('user')
+    with BulkMailer(kind='daily_meal_plan_reminder', period_key=daily_period(timezone.now().date()), digest=True) as mailer:
+        for user in users:
             subject = "Daily Meal Plan Reminder"
-            message = f"Hi {user.user.username},\n\nDon't forget to log your meals for today!\n"
-            message += "Following your meal plan is key to achieving your nutrition goals.\n\n"
-            message += "Stay consistent and healthy!"
-            from_email = 'your_email@example.com'
-            recipient_list = [user.user.email]
-            send_mail(subject, message, from_email, recipient_list)
-            print(f"Sent daily meal plan reminder to {user.user.email}")
+            message = render_email('daily_meal_plan_reminder', username=user.user.username)
+            mailer.add(subject, message, [user.user.email])
+    print(f"Sent {mailer.sent} daily meal plan reminders")
+
+MOTIVATIONAL_QUOTES = [
+    "Believe in yourself and all that you are. Know that there is something inside you that is greater than any obstacle.",
+    "Success is the sum of small efforts, repeated day in and day out.",
+    "The difference between a successful person and others is not a lack of strength, but a lack of will.",
+    "Your body can stand almost anything. It’s your mind that you have to convince.",
+]
 
 @shared_task
 def send_motivational_message():
-    motivational_quotes = [
-        "Believe in yourself and all that you are. Know that there is something inside you that is greater than any obstacle.",
-        "Success is the sum of small efforts, repeated day in and day out.",
-        "The difference between a successful person and others is not a lack of strength, but a lack of will.",
-        "Your body can stand almost anything. It’s your mind that you have to convince.",
-    ]
+    return dispatch_in_chunks(send_motivational_message_chunk, UserProfile.objects.all())
+
+@shared_task(**CHUNK_TASK_OPTIONS)
+def send_motivational_message_chunk(start_pk, end_pk):
     today = timezone.now().date()
-    for user in UserProfile.objects.all():
-        subject = "Stay Motivated!"
-        message = f"Hi {user.user.username},\n\nHere's a motivational quote for you:\n\n"
-        message += f"\"{motivational_quotes[today.weekday() % len(motivational_quotes)]}\"\n\n"
-        message += "Keep pushing toward your goals!"
-        from_email = 'your_email@example.com'
-        recipient_list = [user.user.email]
-        send_mail(subject, message, from_email, recipient_list)
-        print(f"Sent motivational message to {user.user.email}")
+    subject = "Stay Motivated!"
+    message = render_email('motivational_message', quote=MOTIVATIONAL_QUOTES[today.weekday() % len(MOTIVATIONAL_QUOTES)])
+    with BulkMailer(kind='motivational_message', period_key=daily_period(today), digest=True) as mailer:
+        mailer.broadcast(subject, message, UserProfileRepository.get_recipients(UserProfile.objects.filter(pk__range=(start_pk, end_pk))))
+    print(f"Sent {mailer.sent} motivational messages")
 
 @shared_task
 def send_client_progress_report():
-    for professional in Professional.objects.all():
-        clients = professional.clients.all()
-        if clients.exists():
-            subject = "Weekly Client Progress Report"
-            message = f"Hi {professional.user.username},\n\nHere's the progress report for your clients this week:\n"
-            for client in clients:
-                message += f"- {client.user.username}: {client.goal.goaltype} (Target: {client.goal.goalvalue})\n"
-            message += "\nKeep supporting your clients to achieve their goals!"
-            from_email = 'your_email@example.com'
-            recipient_list = [professional.user.email]
-            send_mail(subject, message, from_email, recipient_list)
-            print(f"Sent client progress report to {professional.user.email}")
+    clients = ProfessionalRepository.get_clients_with_goals()
+    with BulkMailer(kind='client_progress_report', period_key=weekly_period(timezone.now().date())) as mailer:
+        for professional, professional_clients in group_clients_by_professional(clients):
+            subject, message = build_client_progress_report(professional, professional_clients)
+            mailer.add(subject, message, [professional.PTUser.email])
+    print(f"Sent {mailer.sent} client progress reports")
 
 @shared_task
 def send_weekly_professional_summary():
-    from django.utils.timezone import now
-    today = now().date()
+    today = timezone.now().date()
     start_of_week = today - timezone.timedelta(days=today.weekday())
     end_of_week = start_of_week + timezone.timedelta(days=6)
 
-    for professional in Professional.objects.all():
-        subject = "Weekly Summary of Goals Set for Clients"
-        message = f"Hi {professional.user.username},\n\nHere is a summary of the goals you have set for your clients this week:\n\n"
+    with BulkMailer(kind='weekly_professional_summary', period_key=weekly_period(today), enqueue=True) as mailer:
+        for professional, clients in ProfessionalRepository.get_weekly_goal_summaries(start_of_week, end_of_week):
+            subject = "Weekly Summary of Goals Set for Clients"
+            message = render_email('weekly_professional_summary', username=professional.PTUser.username, clients=clients)
+            mailer.add(subject, message, [professional.PTUser.email])
+    print(f"Queued {mailer.queued} weekly summaries to professionals")
 
-        for client in professional.clients.all():
-            goals = client.goals.filter(startdate__range=(start_of_week, end_of_week))
-            if goals.exists():
-                message += f"Client: {client.user.username}\n"
-                for goal in goals:
-                    message += f"- {goal.goaltype}: {goal.goalvalue} (Start: {goal.startdate}, End: {goal.enddate})\n"
-                message += "\n"
+@shared_task
+def backup_database(incremental=False):
+    from .backup import create_backup
+    backup_path = create_backup(incremental=incremental)
+    print(f"Database backup saved to {backup_path}")
+    return backup_path
 
-        message += "Keep supporting your clients to achieve their goals!"
-        from_email = 'your_email@example.com'
-        recipient_list = [professional.user.email]
-        send_mail(subject, message, from_email, recipient_list)
-        print(f"Sent weekly summary to professional {professional.user.email}")
+@shared_task
+def send_daily_digests():
+    from .digests import flush_digests
+    sent = flush_digests()
+    print(f"Sent {sent} daily digests")
+    return sent
 
 @shared_task
-def backup_database():
-    from django.core.management import call_command
-    import os
-    backup_dir = "/path/to/backup/directory"
-    os.makedirs(backup_dir, exist_ok=True)
-    backup_file = os.path.join(backup_dir, f"db_backup_{timezone.now().strftime('%Y%m%d%H%M%S')}.json")
-    with open(backup_file, 'w') as f:
-        call_command('dumpdata', stdout=f)
-    print(f"Database backup saved to {backup_file}")
+def drain_outbound_email():
+    from .outbox import drain_outbox
+    sent = drain_outbox()
+    print(f"Sent {sent} queued emails")
+    return sent
+
+@shared_task
+def prune_outbound_email():
+    from .outbox import prune_outbox
+    deleted = prune_outbox()
+    print(f"Pruned {deleted} queued emails")
+    return deleted
+
+@shared_task
+def prune_notification_ledger():
+    from .notifications import prune_notification_log
+    deleted = prune_notification_log()
+    print(f"Pruned {deleted} notification ledger rows")
+    return deleted
 
 @shared_task
 def send_inactivity_reminder():
     one_week_ago = timezone.now().date() - timezone.timedelta(days=7)
-    for user in UserProfile.objects.all():
-        last_activity = user.routine.activities.order_by('-activitydate').first()
-        if not last_activity or last_activity.activitydate < one_week_ago:
+    with BulkMailer(kind='inactivity_reminder', period_key=weekly_period(timezone.now().date())) as mailer:
+        for username, email in UserProfileRepository.get_inactive_recipients(one_week_ago):
             subject = "We Miss You!"
-            message = f"Hi {user.user.username},\n\nWe noticed you haven't logged any activities recently. "
-            message += "Remember, consistency is key to achieving your goals. Let's get back on track today!"
-            from_email = 'your_email@example.com'
-            recipient_list = [user.user.email]
-            send_mail(subject, message, from_email, recipient_list)
-            print(f"Sent inactivity reminder to {user.user.email}")
+            message = render_email('inactivity_reminder', username=username)
+            mailer.add(subject, message, [email])
+    print(f"Sent {mailer.sent} inactivity reminders")
 
 @shared_task
 def send_weekly_nutrition_summary():
@@ -167,33 +205,15 @@ def send_weekly_nutrition_summary():
     start_of_week = today - timezone.timedelta(days=today.weekday())
     end_of_week = start_of_week + timezone.timedelta(days=6)
 
-    for user in UserProfile.objects.all():
-        if user.nutrition:
-            meals = user.nutrition.meals.filter(mealdate__range=(start_of_week, end_of_week))
-            if meals.exists():
+    totals_by_profile = NutritionRepository.get_macro_totals(start_of_week, end_of_week)
+    with BulkMailer(kind='weekly_nutrition_summary', period_key=weekly_period(today), enqueue=True, digest=True) as mailer:
+        for user in UserProfile.objects.filter(nutrition__isnull=False).select_related('user'):
+            totals = totals_by_profile.get(user.id)
+            if totals:
                 subject = "Your Weekly Nutrition Summary"
-                message = f"Hi {user.user.username},\n\nHere's your nutrition summary for the week:\n"
-                total_calories = 0
-                total_protein = 0
-                total_carbs = 0
-                total_fat = 0
-
-                for meal in meals:
-                    for food in meal.foods.all():
-                        total_calories += food.calories
-                        total_protein += food.protein
-                        total_carbs += food.carbohydrates
-                        total_fat += food.fat
-
-                message += f"- Total Calories: {total_calories}\n"
-                message += f"- Total Protein: {total_protein}g\n"
-                message += f"- Total Carbohydrates: {total_carbs}g\n"
-                message += f"- Total Fat: {total_fat}g\n"
-                message += "\nKeep tracking your meals to stay on top of your nutrition goals!"
-                from_email = 'your_email@example.com'
-                recipient_list = [user.user.email]
-                send_mail(subject, message, from_email, recipient_list)
-                print(f"Sent weekly nutrition summary to {user.user.email}")
+                message = render_email('weekly_nutrition_summary', username=user.user.username, totals=totals)
+                mailer.add(subject, message, [user.user.email])
+    print(f"Queued {mailer.queued} weekly nutrition summaries")
 
 @shared_task
 def send_monthly_progress_report():
@@ -201,51 +221,35 @@ def send_monthly_progress_report():
     start_of_month = today.replace(day=1)
     end_of_month = (start_of_month + timezone.timedelta(days=32)).replace(day=1) - timezone.timedelta(days=1)
 
-    for user in UserProfile.objects.all():
-        subject = "Your Monthly Progress Report"
-        message = f"Hi {user.user.username},\n\nHere's your progress for the month:\n"
-
-        # Goals
-        goals = user.goal_set.filter(startdate__lte=end_of_month, enddate__gte=start_of_month)
-        if goals.exists():
-            message += "\nGoals:\n"
-            for goal in goals:
-                message += f"- {goal.goaltype}: {goal.goalvalue} (Target: {goal.goalvalue})\n"
-
-        # Routines
-        routines = user.routine.activities.filter(activitydate__range=(start_of_month, end_of_month))
-        if routines.exists():
-            message += "\nRoutines Completed:\n"
-            for routine in routines:
-                message += f"- {routine.activitytype} on {routine.activitydate}\n"
-
-        # Nutrition
-        if user.nutrition:
-            meals = user.nutrition.meals.filter(mealdate__range=(start_of_month, end_of_month))
-            if meals.exists():
-                total_calories = sum(food.calories for meal in meals for food in meal.foods.all())
-                message += f"\nTotal Calories Consumed: {total_calories}\n"
-
-        message += "\nKeep up the great work and stay consistent!"
-        from_email = 'your_email@example.com'
-        recipient_list = [user.user.email]
-        send_mail(subject, message, from_email, recipient_list)
-        print(f"Sent monthly progress report to {user.user.email}")
+    # One grouped query each for goals, activities and macro totals, one streamed query for the users.
+    goals_by_client = {client.id: goals for client, goals in GoalRepository.get_active_goals_by_client(start_of_month, end_of_month)}
+    activities_by_routine = RoutineRepository.get_activities_by_routine(start_of_month, end_of_month)
+    totals_by_profile = NutritionRepository.get_macro_totals(start_of_month, end_of_month)
+    with BulkMailer(kind='monthly_progress_report', period_key=monthly_period(today)) as mailer:
+        for user in UserProfile.objects.select_related('user').order_by('id').iterator(chunk_size=2000):
+            subject = "Your Monthly Progress Report"
+            message = render_email(
+                'monthly_progress_report',
+                username=user.user.username,
+                goals=goals_by_client.get(user.id),
+                activities=activities_by_routine.get(user.routine_id),  # None without a routine
+                totals=totals_by_profile.get(user.id),
+            )
+            mailer.add(subject, message, [user.user.email])
+    print(f"Sent {mailer.sent} monthly progress reports")
 
 @shared_task
-def notify_goal_achievement():
-    today = timezone.now().date()
-    for user in UserProfile.objects.all():
-        achieved_goals = user.goal_set.filter(enddate__lte=today, goalvalue__lte=100)  # Assuming goalvalue tracks progress
-        for goal in achieved_goals:
+def notify_goal_achievement(lookback_days=7):
+    # achieved_at is set from GoalProgress; the lookback only needs to cover missed runs.
+    since = timezone.now() - timezone.timedelta(days=lookback_days)
+    with BulkMailer(kind='goal_achievement') as mailer:
+        for goal in GoalRepository.get_recently_achieved(since):
+            user = goal.client
             subject = "Congratulations on Achieving Your Goal!"
-            message = f"Hi {user.user.username},\n\nCongratulations on achieving your goal:\n"
-            message += f"- {goal.goaltype}: {goal.goalvalue}\n"
-            message += "\nYour hard work and dedication have paid off. Keep setting new goals and pushing forward!"
-            from_email = 'your_email@example.com'
-            recipient_list = [user.user.email]
-            send_mail(subject, message, from_email, recipient_list)
-            print(f"Sent goal achievement notification to {user.user.email}")
+            message = render_email('goal_achievement', username=user.user.username, goal=goal)
+            # Keyed by goal, so each achievement is congratulated exactly once
+            mailer.add(subject, message, [user.user.email], period_key=f"goal-{goal.id}")
+    print(f"Sent {mailer.sent} goal achievement notifications")
 
 @shared_task
 def notify_client_of_message(professional_id, client_id, message_content):
@@ -256,12 +260,8 @@ def notify_client_of_message(professional_id, client_id, message_content):
         client = UserProfile.objects.get(id=client_id)
 
         subject = "New Message from Your Professional"
-        message = f"Hi {client.user.username},\n\nYou have received a new message from {professional.user.username}:\n\n"
-        message += f"\"{message_content}\"\n\n"
-        message += "Please log in to your account to respond or view more details."
-        from_email = 'your_email@example.com'
-        recipient_list = [client.user.email]
-        send_mail(subject, message, from_email, recipient_list)
+        message = render_email('new_message', username=client.user.username, sender=professional.user.username, message_content=message_content)
+        send_bulk([(subject, message, [client.user.email])])
         print(f"Sent message notification to client {client.user.email}")
     except Professional.DoesNotExist:
         print(f"Professional with ID {professional_id} does not exist.")
@@ -277,12 +277,8 @@ def notify_professional_of_message(client_id, professional_id, message_content):
         professional = Professional.objects.get(id=professional_id)
 
         subject = "New Message from Your Client"
-        message = f"Hi {professional.user.username},\n\nYou have received a new message from {client.user.username}:\n\n"
-        message += f"\"{message_content}\"\n\n"
-        message += "Please log in to your account to respond or view more details."
-        from_email = 'your_email@example.com'
-        recipient_list = [professional.user.email]
-        send_mail(subject, message, from_email, recipient_list)
+        message = render_email('new_message', username=professional.user.username, sender=client.user.username, message_content=message_content)
+        send_bulk([(subject, message, [professional.user.email])])
         print(f"Sent message notification to professional {professional.user.email}")
     except UserProfile.DoesNotExist:
         print(f"Client with ID {client_id} does not exist.")
@@ -296,19 +292,18 @@ def send_monthly_engagement_report():
     start_of_month = today.replace(day=1)
     end_of_month = (start_of_month + timezone.timedelta(days=32)).replace(day=1) - timezone.timedelta(days=1)
 
-    for professional in Professional.objects.all():
-        messages_sent = Message.objects.filter(sender=professional.user, timestamp__range=(start_of_month, end_of_month)).count()
-        messages_received = Message.objects.filter(recipient=professional.user, timestamp__range=(start_of_month, end_of_month)).count()
+    with BulkMailer(kind='monthly_engagement_report', period_key=monthly_period(today)) as mailer:
+        for professional in Professional.objects.all():
+            messages_sent = Message.objects.filter(sender=professional.user, timestamp__range=(start_of_month, end_of_month)).count()
+            messages_received = Message.objects.filter(recipient=professional.user, timestamp__range=(start_of_month, end_of_month)).count()
 
-        subject = "Monthly Engagement Report"
-        message = f"Hi {professional.user.username},\n\nHere is your engagement report for the month:\n"
-        message += f"- Messages Sent: {messages_sent}\n"
-        message += f"- Messages Received: {messages_received}\n"
-        message += "\nKeep engaging with your clients to help them achieve their goals!"
-        from_email = 'your_email@example.com'
-        recipient_list = [professional.user.email]
-        send_mail(subject, message, from_email, recipient_list)
-        print(f"Sent monthly engagement report to professional {professional.user.email}")
+            subject = "Monthly Engagement Report"
+            message = render_email(
+                'monthly_engagement_report',
+                username=professional.user.username, messages_sent=messages_sent, messages_received=messages_received,
+            )
+            mailer.add(subject, message, [professional.user.email])
+    print(f"Sent {mailer.sent} monthly engagement reports to professionals")
 
 @shared_task
 def send_monthly_nutrition_insights():
@@ -316,34 +311,28 @@ def send_monthly_nutrition_insights():
     start_of_month = today.replace(day=1)
     end_of_month = (start_of_month + timezone.timedelta(days=32)).replace(day=1) - timezone.timedelta(days=1)
 
-    for user in UserProfile.objects.all():
-        if user.nutrition:
-            meals = user.nutrition.meals.filter(mealdate__range=(start_of_month, end_of_month))
-            if meals.exists():
-                total_calories = sum(food.calories for meal in meals for food in meal.foods.all())
-                avg_calories = total_calories / meals.count()
+    totals_by_profile = NutritionRepository.get_macro_totals(start_of_month, end_of_month)
+    with BulkMailer(kind='monthly_nutrition_insights', period_key=monthly_period(today)) as mailer:
+        for user in UserProfile.objects.filter(nutrition__isnull=False).select_related('user'):
+            totals = totals_by_profile.get(user.id)
+            if totals:
                 subject = "Monthly Nutrition Insights"
-                message = f"Hi {user.user.username},\n\nHere are your nutrition insights for the month:\n"
-                message += f"- Total Calories Consumed: {total_calories}\n"
-                message += f"- Average Daily Calories: {avg_calories:.2f}\n"
-                message += "\nKeep tracking your meals to maintain a balanced diet!"
-                from_email = 'your_email@example.com'
-                recipient_list = [user.user.email]
-                send_mail(subject, message, from_email, recipient_list)
-                print(f"Sent monthly nutrition insights to {user.user.email}")
+                message = render_email(
+                    'monthly_nutrition_insights',
+                    username=user.user.username, totals=totals, avg_calories=totals['calories'] / totals['days'],
+                )
+                mailer.add(subject, message, [user.user.email])
+    print(f"Sent {mailer.sent} monthly nutrition insights")
 
 @shared_task
 def send_professional_feedback_request():
-    for professional in Professional.objects.all():
-        for client in professional.clients.all():
-            subject = "We Value Your Feedback!"
-            message = f"Hi {client.user.username},\n\nWe'd love to hear your thoughts about your experience with {professional.user.username}.\n"
-            message += "Your feedback helps us improve and provide the best support possible.\n\n"
-            message += "Please log in to your account to leave feedback."
-            from_email = 'your_email@example.com'
-            recipient_list = [client.user.email]
-            send_mail(subject, message, from_email, recipient_list)
-            print(f"Sent feedback request to client {client.user.email}")
+    with BulkMailer(kind='professional_feedback_request', period_key=monthly_period(timezone.now().date())) as mailer:
+        for professional in Professional.objects.all():
+            for client in professional.clients.all():
+                subject = "We Value Your Feedback!"
+                message = render_email('feedback_request', username=client.user.username, professional_username=professional.user.username)
+                mailer.add(subject, message, [client.user.email])
+    print(f"Sent {mailer.sent} feedback requests to clients")
 
 @shared_task
 def send_routine_completion_certificate(user_id, routine_id):
@@ -354,16 +343,8 @@ def send_routine_completion_certificate(user_id, routine_id):
         routine = Routine.objects.get(id=routine_id)
 
         subject = "Congratulations on Completing Your Routine!"
-        message = f"Hi {user.user.username},\n\nCongratulations on completing the routine \"{routine.name}\"!\n"
-        message += "Your dedication and hard work have paid off. Keep striving for greatness!\n\n"
-        message += "Attached is your certificate of completion."
-        from_email = 'your_email@example.com'
-        recipient_list = [user.user.email]
-
-        # Generate and attach a certificate (placeholder logic)
-        # You can use a library like ReportLab or WeasyPrint to generate a PDF certificate.
-        # For now, this is just a placeholder.
-        send_mail(subject, message, from_email, recipient_list)
+        message = render_email('routine_completion_certificate', username=user.user.username, routine_name=routine.name)
+        send_bulk([(subject, message, [user.user.email])])
         print(f"Sent routine completion certificate to {user.user.email}")
     except UserProfile.DoesNotExist:
         print(f"User with ID {user_id} does not exist.")
@@ -376,40 +357,25 @@ def send_monthly_client_retention_report():
     start_of_month = today.replace(day=1)
     end_of_month = (start_of_month + timezone.timedelta(days=32)).replace(day=1) - timezone.timedelta(days=1)
 
-    for professional in Professional.objects.all():
-        total_clients = professional.clients.count()
-        active_clients = professional.clients.filter(
-            routine__activities__activitydate__range=(start_of_month, end_of_month)
-        ).distinct().count()
-
-        retention_rate = (active_clients / total_clients) * 100 if total_clients > 0 else 0
-
-        subject = "Monthly Client Retention Report"
-        message = f"Hi {professional.user.username},\n\nHere's your client retention report for the month:\n"
-        message += f"- Total Clients: {total_clients}\n"
-        message += f"- Active Clients: {active_clients}\n"
-        message += f"- Retention Rate: {retention_rate:.2f}%\n\n"
-        message += "Keep engaging with your clients to maintain high retention rates!"
-        from_email = 'your_email@example.com'
-        recipient_list = [professional.user.email]
-        send_mail(subject, message, from_email, recipient_list)
-        print(f"Sent client retention report to {professional.user.email}")
+    with BulkMailer(kind='client_retention_report', period_key=monthly_period(today)) as mailer:
+        for professional in ProfessionalRepository.get_client_report_stats(start_of_month, end_of_month):
+            subject, message = build_client_retention_report(professional)
+            mailer.add(subject, message, [professional.PTUser.email])
+    print(f"Sent {mailer.sent} client retention reports")
 
 @shared_task
 def send_weekly_meal_plan_suggestions():
-    for user in UserProfile.objects.all():
-        if user.nutrition:
+    return dispatch_in_chunks(send_weekly_meal_plan_suggestions_chunk, UserProfile.objects.filter(nutrition__isnull=False))
+
+@shared_task(**CHUNK_TASK_OPTIONS)
+def send_weekly_meal_plan_suggestions_chunk(start_pk, end_pk):
+    users = UserProfile.objects.filter(pk__range=(start_pk, end_pk), nutrition__isnull=False).select_related('user')
+    with BulkMailer(kind='weekly_meal_plan_suggestions', period_key=weekly_period(timezone.now().date()), digest=True) as mailer:
+        for user in users:
             subject = "Weekly Meal Plan Suggestions"
-            message = f"Hi {user.user.username},\n\nHere are some meal suggestions for the week based on your nutrition goals:\n"
-            message += "- Breakfast: Oatmeal with fresh fruits and nuts.\n"
-            message += "- Lunch: Grilled chicken with quinoa and steamed vegetables.\n"
-            message += "- Dinner: Baked salmon with sweet potatoes and a side salad.\n"
-            message += "- Snacks: Greek yogurt, almonds, or a protein bar.\n\n"
-            message += "Log in to your account to customize your meal plan!"
-            from_email = 'your_email@example.com'
-            recipient_list = [user.user.email]
-            send_mail(subject, message, from_email, recipient_list)
-            print(f"Sent meal plan suggestions to {user.user.email}")
+            message = render_email('weekly_meal_plan_suggestions', username=user.user.username)
+            mailer.add(subject, message, [user.user.email])
+    print(f"Sent {mailer.sent} meal plan suggestions")
 
 @shared_task
 def validate_goal_input(goal_id):
@@ -431,18 +397,14 @@ def send_weekly_activity_leaderboard():
 
     leaderboard = UserProfile.objects.annotate(
         activity_count=models.Count('routine__activities', filter=models.Q(routine__activities__activitydate__range=(start_of_week, end_of_week)))
-    ).order_by('-activity_count')[:10]
-
-    for user in UserProfile.objects.all():
-        subject = "Weekly Activity Leaderboard"
-        message = f"Hi {user.user.username},\n\nHere are the top performers for this week:\n\n"
-        for rank, profile in enumerate(leaderboard, start=1):
-            message += f"{rank}. {profile.user.username} - {profile.activity_count} activities\n"
-        message += "\nKeep pushing yourself to climb the leaderboard next week!"
-        from_email = 'your_email@example.com'
-        recipient_list = [user.user.email]
-        send_mail(subject, message, from_email, recipient_list)
-        print(f"Sent weekly leaderboard to {user.user.email}")
+    ).order_by('-activity_count').values_list('user__username', 'activity_count')[:10]
+
+    # The leaderboard is the same for everyone, so it is rendered once and only the greeting varies.
+    subject = "Weekly Activity Leaderboard"
+    message = render_email('weekly_activity_leaderboard', leaderboard=leaderboard)
+    with BulkMailer(kind='weekly_activity_leaderboard', period_key=weekly_period(today), enqueue=True, digest=True) as mailer:
+        mailer.broadcast(subject, message, UserProfileRepository.get_recipients())
+    print(f"Queued {mailer.queued} weekly leaderboards")
 
 @shared_task
 def notify_client_about_new_goal(professional_id, client_id, goal_id):
@@ -462,55 +424,10 @@ def notify_professional_about_client_goal(client_id, goal_id):
         professional = client.professional  # Assuming a `professional` field links the client to their professional
 
         subject = "New Goal Submitted by Your Client"
-        message = f"Hi {professional.user.username},\n\nYour client, {client.user.username}, has submitted a new goal:\n\n"
-        message += f"- Goal Type: {goal.goaltype}\n"
-        message += f"- Target Value: {goal.goalvalue}\n"
-        message += f"- Start Date: {goal.startdate}\n"
-        message += f"- End Date: {goal.enddate}\n\n"
-        message += "Log in to your account to view more details."
-        from_email = 'your_email@example.com'
-        recipient_list = [professional.user.email]
-        send_mail(subject, message, from_email, recipient_list)
+        message = render_email('new_client_goal', username=professional.user.username, client_username=client.user.username, goal=goal)
+        send_bulk([(subject, message, [professional.user.email])])
         print(f"Sent new goal notification to professional {professional.user.email}")
     except UserProfile.DoesNotExist:
         print(f"Client with ID {client_id} does not exist.")
     except Goal.DoesNotExist:
         print(f"Goal with ID {goal_id} does not exist.")
-
-@shared_task
-def send_weekly_professional_goal_summary():
-    today = timezone.now().date()
-    start_of_week = today - timezone.timedelta(days=today.weekday())
-    end_of_week = start_of_week + timezone.timedelta(days=6)
-
-    for professional in Professional.objects.all():
-        subject = "Weekly Summary of Goals Set for Clients"
-        message = f"Hi {professional.user.username},\n\nHere is a summary of the goals you have set for your clients this week:\n\n"
-
-        for client in professional.clients.all():
-            goals = client.goals.filter(startdate__range=(start_of_week, end_of_week))
-            if goals.exists():
-                message += f"Client: {client.user.username}\n"
-                for goal in goals:
-                    message += f"- {goal.goaltype}: {goal.goalvalue} (Start: {goal.startdate}, End: {goal.enddate})\n"
-                message += "\n"
-
-        message += "Keep supporting your clients to achieve their goals!"
-        from_email = 'your_email@example.com'
-        recipient_list = [professional.user.email]
-        send_mail(subject, message, from_email, recipient_list)
-        print(f"Sent weekly goal summary to professional {professional.user.email}")
-
-
-import logging
-from celery import shared_task
-
-logger = logging.getLogger(__name__)
-
-@shared_task
-def notify_client_about_new_goal(professional_id, client_id, goal_id):
-    try:
-        # Task logic here
-        pass
-    except Exception as e:
-        logger.error(f"Error in notify_client_about_new_goal: {e}")
\ No newline at end of file
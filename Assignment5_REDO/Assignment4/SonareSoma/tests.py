@@ -1,11 +1,43 @@
-from django.test import TestCase
-from .tasks import notify_client_about_new_goal, send_weekly_professional_summary
-from .models import Professional, UserProfile, Goal
+from django.test import TestCase, TransactionTestCase, override_settings
+from .tasks import notify_client_about_new_goal, send_weekly_professional_summary, send_daily_routine_reminder
+from .tasks import get_pk_ranges, send_motivational_message, send_daily_meal_plan_reminder
+from .tasks import send_weekly_nutrition_summary, send_monthly_nutrition_insights, send_weekly_activity_leaderboard
+from .tasks import send_monthly_client_retention_report, send_client_progress_report, send_daily_notifications_for_slot, send_inactivity_reminder
+from .tasks import notify_goal_achievement, send_weekly_goal_summary, send_missed_routine_notification
+from .tasks import send_daily_meal_plan_reminder_chunk, send_weekly_meal_plan_suggestions_chunk, send_monthly_progress_report
+from .models import Professional, UserProfile, Goal, Activity, Routine, Nutrition, Food, Meal, MealFood, DailyNutritionTotals, Client, NotificationLog, OutboundEmail, ActivityCompletion, DigestSection, RateLimitBucket
+from django.core.management import call_command
+from io import StringIO
+import datetime
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from .backup import BackupError, create_backup, delete_missing, read_manifest, restore_backup
+from .repositories import GoalRepository, NutritionRepository
+from celery import current_app
 from django.contrib.auth.models import User
 from django.core import mail
-from .serializers import GoalSerializer
+from .serializers import GoalSerializer, UserProfileSerializer
+from .notifications import BulkMailer, claim_due_delivery_slots, current_delivery_slot, daily_period, prune_notification_log
+from .outbox import TokenBucket, drain_outbox, lease_queued_batch, prune_outbox
+from .emails import get_email_template, render_email
+from .metrics import metrics_app, record_queue_latency, registry, stamp_publish_time
+from Assignment4.celery import app as celery_app, configure_queue_worker
+from types import SimpleNamespace
+from unittest import mock
+from django.core.mail import EmailMessage
+from .digests import flush_digests
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
 from rest_framework.test import APIClient
+from rest_framework.pagination import Cursor
+from .pagination import ActivityPagination
 from django.urls import reverse
+from django.utils import timezone
+from django.db import connection
+from django.core.cache import cache
+from django.test.utils import CaptureQueriesContext
 
 class TaskTests(TestCase):
     def test_notify_client_about_new_goal(self):
@@ -202,4 +234,1297 @@ class ProfessionalViewSetTests(TestCase):
         url = reverse('professional-weekly-summary', args=[self.professional.id])
         response = self.client.get(url)
         self.assertEqual(response.status_code, 200)
-        self.assertIn("Weekly summary", response.data["message"])
\ No newline at end of file
+        self.assertIn("Weekly summary", response.data["message"])
+
+class DailyRoutineReminderTests(TestCase):
+    def create_dataset(self, users_per_routine):
+        today = timezone.now().date()
+        for r in range(3):
+            routine = Routine.objects.create()
+            routine.activities.add(
+                Activity.objects.create(activitydate=today, starttime="07:00", endtime="08:00", activitytype=f"Run {r}"),
+                Activity.objects.create(activitydate=today - timezone.timedelta(days=1), starttime="07:00", endtime="08:00", activitytype=f"Swim {r}"),
+            )
+            for u in range(users_per_routine):
+                username = f"user{r}_{u}_{users_per_routine}"
+                UserProfile.objects.create(user=User.objects.create(username=username, email=f"{username}@example.com"), routine=routine)
+        # A routine with nothing scheduled today
+        rest_routine = Routine.objects.create()
+        UserProfile.objects.create(user=User.objects.create(username=f"rest_{users_per_routine}", email=f"rest_{users_per_routine}@example.com"), routine=rest_routine)
+
+    def test_send_daily_routine_reminder_email_content(self):
+        self.create_dataset(users_per_routine=2)
+
+        send_daily_routine_reminder()
+
+        self.assertEqual(len(mail.outbox), 7)
+        bodies = {email.to[0]: email.body for email in mail.outbox}
+        self.assertIn("Run 0", bodies["user0_0_2@example.com"])
+        self.assertNotIn("Swim 0", bodies["user0_0_2@example.com"])
+        self.assertNotIn("Run 1", bodies["user0_0_2@example.com"])
+        self.assertIn("Enjoy your rest day!", bodies["rest_2@example.com"])
+
+    @override_settings(SONARESOMA_EMAIL_BATCH_SIZE=500)
+    def test_send_daily_routine_reminder_constant_query_count(self):
+        # Two queries for the data, plus the ledger lookup and insert and the digest lookup for the one mail batch
+        self.create_dataset(users_per_routine=1)
+        with self.assertNumQueries(5):
+            send_daily_routine_reminder()
+
+        mail.outbox = []
+        self.create_dataset(users_per_routine=50)
+        with self.assertNumQueries(5):
+            send_daily_routine_reminder()
+        # The 4 users from the first run were already reminded today
+        self.assertEqual(len(mail.outbox), 151)
+
+class RecordingEmailBackend(LocmemEmailBackend):
+    """
+    Locmem backend that records connection opens and can fail the first N sends, or
+    once each time it reaches one of the `fail_after` delivered counts (a relay
+    dropping the connection part way through a batch).
+    """
+    def __init__(self, failures=0, fail_after=(), **kwargs):
+        super().__init__(**kwargs)
+        self.failures = failures
+        self.fail_after = set(fail_after)
+        self.opens = 0
+        self.batches = []
+
+    def open(self):
+        self.opens += 1
+        return True
+
+    def send_messages(self, messages):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("relay unavailable")
+        if sum(self.batches) in self.fail_after:
+            self.fail_after.discard(sum(self.batches))
+            raise ConnectionError("connection dropped")
+        self.batches.append(len(messages))
+        return super().send_messages(messages)
+
+class RejectingEmailBackend(LocmemEmailBackend):
+    """Locmem backend whose relay refuses every address starting with 'bounce'."""
+    def send_messages(self, messages):
+        if any(address.startswith("bounce") for message in messages for address in message.to):
+            raise ConnectionError("recipient refused")
+        return super().send_messages(messages)
+
+class BulkMailerTests(TestCase):
+    def test_messages_are_sent_in_batches_over_one_connection(self):
+        connection = RecordingEmailBackend()
+        with BulkMailer(batch_size=10, connection=connection) as mailer:
+            for i in range(25):
+                mailer.add("Subject", "Body", [f"user{i}@example.com"])
+                if i == 8:
+                    self.assertEqual(len(mail.outbox), 0)
+                if i == 9:
+                    self.assertEqual(len(mail.outbox), 10)
+
+        self.assertEqual(connection.opens, 1)
+        self.assertEqual(mailer.sent, 25)
+        self.assertEqual(len(mail.outbox), 25)
+
+    def test_retry_only_sends_undelivered_messages(self):
+        connection = RecordingEmailBackend(fail_after=[3, 7])
+        with BulkMailer(batch_size=10, max_retries=2, connection=connection) as mailer:
+            for i in range(10):
+                mailer.add("Subject", "Body", [f"user{i}@example.com"])
+
+        self.assertEqual(connection.opens, 3)
+        self.assertEqual(mailer.sent, 10)
+        self.assertEqual([email.to[0] for email in mail.outbox], [f"user{i}@example.com" for i in range(10)])
+
+    def test_failed_batch_is_retried_on_a_new_connection(self):
+        connection = RecordingEmailBackend(failures=1)
+        with BulkMailer(batch_size=10, max_retries=2, connection=connection) as mailer:
+            for i in range(15):
+                mailer.add("Subject", "Body", [f"user{i}@example.com"])
+
+        self.assertEqual(connection.opens, 2)
+        self.assertEqual(len(mail.outbox), 15)
+        self.assertEqual(mailer.sent, 15)
+        self.assertEqual(mailer.failed, 0)
+
+    def test_batch_is_dropped_after_max_retries(self):
+        connection = RecordingEmailBackend(failures=3)
+        with self.assertLogs("SonareSoma.notifications", level="ERROR"):
+            with BulkMailer(batch_size=10, max_retries=2, connection=connection) as mailer:
+                for i in range(12):
+                    mailer.add("Subject", "Body", [f"user{i}@example.com"])
+
+        self.assertEqual(mailer.failed, 10)
+        self.assertEqual(mailer.sent, 2)
+        self.assertEqual(len(mailer.undelivered), 10)
+
+class ChunkedFanOutTests(TestCase):
+    def setUp(self):
+        # Run dispatched chunk tasks in-process
+        current_app.conf.task_always_eager = True
+        self.addCleanup(setattr, current_app.conf, 'task_always_eager', False)
+        nutrition = Nutrition.objects.create()
+        for i in range(7):
+            UserProfile.objects.create(
+                user=User.objects.create(username=f"user{i}", email=f"user{i}@example.com"),
+                nutrition=nutrition if i % 2 == 0 else None,
+            )
+
+    def test_get_pk_ranges_covers_every_profile(self):
+        ranges = get_pk_ranges(UserProfile.objects.all(), chunk_size=3)
+        first_pk = UserProfile.objects.order_by('pk').first().pk
+        self.assertEqual(ranges, [(first_pk, first_pk + 2), (first_pk + 3, first_pk + 5), (first_pk + 6, first_pk + 6)])
+        self.assertEqual(get_pk_ranges(UserProfile.objects.none()), [])
+
+    @override_settings(SONARESOMA_FANOUT_CHUNK_SIZE=2)
+    def test_send_motivational_message_dispatches_chunks(self):
+        self.assertEqual(send_motivational_message(), 4)
+        self.assertEqual(sorted(email.to[0] for email in mail.outbox), [f"user{i}@example.com" for i in range(7)])
+
+    @override_settings(SONARESOMA_FANOUT_CHUNK_SIZE=2)
+    def test_send_daily_meal_plan_reminder_only_reaches_profiles_with_nutrition(self):
+        self.assertEqual(send_daily_meal_plan_reminder(), 2)  # Chunks of the 4 matching profiles, not of the whole span
+        self.assertEqual(sorted(email.to[0] for email in mail.outbox), [f"user{i}@example.com" for i in (0, 2, 4, 6)])
+
+class NutritionAggregationTests(TestCase):
+    def setUp(self):
+        self.today = timezone.now().date()
+        oats = Food.objects.create(name="Oats", servingsize=40, servingunit="g", calories=150, protein=5, carbohydrates=27, fat=3, sodium=0)
+        eggs = Food.objects.create(name="Eggs", servingsize=1, servingunit="egg", calories=70, protein=6, carbohydrates=0, fat=5, sodium=70)
+        nutrition = Nutrition.objects.create()
+        for days_ago, quantity in ((0, 2), (0, 1), (40, 5)):
+            meal = Meal.objects.create(mealdate=self.today - timezone.timedelta(days=days_ago), mealtime="08:00", mealtype="breakfast")
+            MealFood.objects.create(meal=meal, food=oats, quantity=quantity)
+            MealFood.objects.create(meal=meal, food=eggs, quantity=1)
+            nutrition.meals.add(meal)
+        self.profile = UserProfile.objects.create(user=User.objects.create(username="eater", email="eater@example.com"), nutrition=nutrition)
+        UserProfile.objects.create(user=User.objects.create(username="fasting", email="fasting@example.com"), nutrition=Nutrition.objects.create())
+
+    def test_get_macro_totals_weights_by_quantity(self):
+        with self.assertNumQueries(1):
+            totals = NutritionRepository.get_macro_totals(self.today, self.today)
+        self.assertEqual(list(totals), [self.profile.id])
+        self.assertEqual(totals[self.profile.id]['calories'], 3 * 150 + 2 * 70)
+        self.assertEqual(totals[self.profile.id]['protein'], 3 * 5 + 2 * 6)
+        self.assertEqual(totals[self.profile.id]['fat'], 3 * 3 + 2 * 5)
+        self.assertEqual(totals[self.profile.id]['days'], 1)
+
+    def test_send_weekly_nutrition_summary(self):
+        send_weekly_nutrition_summary()
+        drain_outbox(max_seconds=0)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["eater@example.com"])
+        self.assertIn("Total Calories: 590", mail.outbox[0].body)
+
+    def test_send_monthly_nutrition_insights_query_count(self):
+        with self.assertNumQueries(4):
+            send_monthly_nutrition_insights()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn("Average Daily Calories: 590.00", mail.outbox[0].body)
+
+class DailyNutritionTotalsTests(TestCase):
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.oats = Food.objects.create(name="Oats", servingsize=40, servingunit="g", calories=150, protein=5, carbohydrates=27, fat=3, sodium=2)
+        self.nutrition = Nutrition.objects.create()
+        self.profile = UserProfile.objects.create(user=User.objects.create(username="eater"), nutrition=self.nutrition)
+        self.meal = Meal.objects.create(mealdate=self.today, mealtime="08:00", mealtype="breakfast")
+        self.nutrition.meals.add(self.meal)
+
+    def totals(self):
+        return DailyNutritionTotals.objects.get(user=self.profile, date=self.today)
+
+    def test_meal_food_changes_update_totals(self):
+        meal_food = MealFood.objects.create(meal=self.meal, food=self.oats, quantity=2)
+        self.assertEqual(self.totals().calories, 300)
+
+        meal_food.quantity = 3
+        meal_food.save()
+        self.assertEqual(self.totals().calories, 450)
+        self.assertEqual(self.totals().sodium, 6)
+
+        meal_food.delete()
+        self.assertFalse(DailyNutritionTotals.objects.exists())
+
+    def test_food_nutrient_change_updates_totals(self):
+        MealFood.objects.create(meal=self.meal, food=self.oats, quantity=2)
+        self.oats.calories = 100
+        self.oats.save()
+        self.assertEqual(self.totals().calories, 200)
+
+    def test_meal_added_to_plan_after_its_foods(self):
+        dinner = Meal.objects.create(mealdate=self.today, mealtime="19:00", mealtype="dinner")
+        MealFood.objects.create(meal=dinner, food=self.oats, quantity=1)
+        self.assertFalse(DailyNutritionTotals.objects.exists())
+
+        self.nutrition.meals.add(dinner)
+        self.assertEqual(self.totals().calories, 150)
+
+        self.nutrition.meals.remove(dinner)
+        self.assertFalse(DailyNutritionTotals.objects.exists())
+
+    def test_deleting_plan_clears_profile_totals(self):
+        MealFood.objects.create(meal=self.meal, food=self.oats, quantity=2)
+        self.assertEqual(self.totals().calories, 300)
+
+        self.nutrition.delete()
+        self.profile.refresh_from_db()
+        self.assertIsNone(self.profile.nutrition)
+        self.assertFalse(DailyNutritionTotals.objects.exists())
+
+    def test_rebuild_nutrition_totals_command(self):
+        MealFood.objects.create(meal=self.meal, food=self.oats, quantity=2)
+        DailyNutritionTotals.objects.all().delete()
+
+        out = StringIO()
+        call_command('rebuild_nutrition_totals', stdout=out)
+        self.assertIn("Rebuilt 1 daily nutrition totals", out.getvalue())
+        self.assertEqual(self.totals().calories, 300)
+
+class BroadcastTests(TestCase):
+    def test_send_weekly_activity_leaderboard_renders_once(self):
+        today = timezone.now().date()
+        routine = Routine.objects.create()
+        routine.activities.add(Activity.objects.create(activitydate=today, starttime="07:00", endtime="08:00", activitytype="Run"))
+        UserProfile.objects.create(user=User.objects.create(username="runner", email="runner@example.com"), routine=routine)
+        for i in range(30):
+            UserProfile.objects.create(user=User.objects.create(username=f"user{i}", email=f"user{i}@example.com"))
+
+        with self.assertNumQueries(6):  # Data, ledger lookup and insert, digest lookup, queue insert
+            send_weekly_activity_leaderboard()
+        drain_outbox(max_seconds=0)
+
+        self.assertEqual(len(mail.outbox), 31)
+        email = mail.outbox[-1]
+        self.assertEqual(email.to, ["user29@example.com"])
+        self.assertTrue(email.body.startswith("Hi user29,\n\n"))
+        self.assertIn("1. runner - 1 activities", email.body)
+
+class MonthlyProgressReportTests(TestCase):
+    def setUp(self):
+        today = timezone.now().date()
+        professional = Professional.objects.create(PTUser=User.objects.create(username="coach"))
+        routine = Routine.objects.create()
+        routine.activities.add(
+            Activity.objects.create(activitydate=today, starttime="07:00", endtime="08:00", activitytype="Run"),
+            Activity.objects.create(activitydate=today - timezone.timedelta(days=62), starttime="07:00", endtime="08:00", activitytype="Old Run"),
+        )
+        for i in range(4):
+            profile = UserProfile.objects.create(
+                user=User.objects.create(username=f"user{i}", email=f"user{i}@example.com"),
+                routine=routine if i % 2 == 0 else None,
+            )
+            Goal.objects.create(goaltype=f"Goal {i}", goalvalue=10, startdate=today, enddate=today, client=profile, professional=professional)
+
+    def test_report_uses_grouped_queries(self):
+        with self.assertNumQueries(6):  # Goals, activities, totals, users, ledger insert and lookup
+            send_monthly_progress_report()
+
+        self.assertEqual(len(mail.outbox), 4)
+        bodies = {email.to[0]: email.body for email in mail.outbox}
+        self.assertIn("- Goal 0: no progress yet (Target: 10.0)", bodies["user0@example.com"])
+        self.assertIn("- Run on", bodies["user0@example.com"])
+        self.assertNotIn("Old Run", bodies["user0@example.com"])
+        self.assertIn("- Goal 1:", bodies["user1@example.com"])
+        self.assertNotIn("Routines Completed", bodies["user1@example.com"])  # No routine
+
+class BackupTests(TestCase):
+    def setUp(self):
+        self.backup_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.backup_dir)
+        today = timezone.now().date()
+        self.routine = Routine.objects.create()
+        for i in range(5):
+            self.routine.activities.add(Activity.objects.create(activitydate=today, starttime="07:00", endtime="08:00", activitytype=f"Run {i}"))
+        UserProfile.objects.create(user=User.objects.create(username="runner", email="runner@example.com"), routine=self.routine, height=180.5)
+
+    def test_backup_writes_compressed_chunks_and_manifest(self):
+        path = create_backup(self.backup_dir, chunk_size=2)
+        manifest = read_manifest(path)
+        entries = {entry['model']: entry for entry in manifest['models']}
+
+        self.assertEqual(entries['SonareSoma.Activity']['rows'], 5)
+        self.assertEqual(entries['SonareSoma.RoutineActivity']['rows'], 5)
+        self.assertEqual(entries['auth.User']['rows'], 1)
+        with gzip.open(os.path.join(path, entries['SonareSoma.Activity']['file']), 'rt') as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual([row['activitytype'] for row in rows], [f"Run {i}" for i in range(5)])
+
+    def test_restore_round_trip(self):
+        path = create_backup(self.backup_dir, chunk_size=2)
+        User.objects.all().delete()
+        Routine.objects.all().delete()
+        Activity.objects.all().delete()
+
+        restored = restore_backup(path, batch_size=2)
+
+        self.assertEqual(restored['SonareSoma.Activity'], 5)
+        profile = UserProfile.objects.get(user__username="runner")
+        self.assertEqual(profile.height, 180.5)
+        self.assertEqual(profile.routine.activities.count(), 5)
+        self.assertEqual(str(profile.routine.activities.first().activitydate), str(timezone.now().date()))
+
+    def test_restore_rejects_corrupted_file(self):
+        path = create_backup(self.backup_dir)
+        entry = next(entry for entry in read_manifest(path)['models'] if entry['model'] == 'SonareSoma.Activity')
+        with gzip.open(os.path.join(path, entry['file']), 'wb') as f:
+            f.write(b'{}\n')
+        Activity.objects.all().delete()
+        User.objects.all().delete()
+        Routine.objects.all().delete()
+
+        with self.assertRaises(BackupError):
+            restore_backup(path)
+        self.assertFalse(User.objects.exists())
+
+    def test_incremental_backup_only_writes_changes(self):
+        full_path = create_backup(self.backup_dir)
+        changed, deleted = self.routine.activities.order_by('pk')[:2]
+        changed.activitytype = "Sprint"
+        changed.save()
+        deleted.delete()
+        self.routine.activities.add(Activity.objects.create(activitydate=timezone.now().date(), starttime="18:00", endtime="19:00", activitytype="Yoga"))
+
+        path = create_backup(self.backup_dir, incremental=True)
+        manifest = read_manifest(path)
+        entries = {entry['model']: entry for entry in manifest['models']}
+
+        self.assertEqual(manifest['kind'], 'incremental')
+        self.assertEqual(manifest['parent'], os.path.basename(full_path))
+        self.assertEqual(entries['SonareSoma.Activity']['rows'], 2)
+        self.assertTrue(entries['SonareSoma.Activity']['partial'])
+        self.assertEqual(entries['SonareSoma.Meal']['rows'], 0)
+        self.assertEqual(entries['SonareSoma.RoutineActivity']['rows'], 1)  # Only the new link
+        self.assertTrue(all(entry['partial'] for entry in manifest['models']))
+        self.assertEqual(manifest['tombstones']['rows'], 2)  # The activity and its routine link
+
+    def test_restore_replays_increments(self):
+        create_backup(self.backup_dir)
+        changed, deleted = self.routine.activities.order_by('pk')[:2]
+        changed.activitytype = "Sprint"
+        changed.save()
+        deleted.delete()
+        create_backup(self.backup_dir, incremental=True)
+        self.routine.activities.add(Activity.objects.create(activitydate=timezone.now().date(), starttime="18:00", endtime="19:00", activitytype="Yoga"))
+        path = create_backup(self.backup_dir, incremental=True)
+        expected = sorted(self.routine.activities.values_list('pk', 'activitytype'))
+
+        User.objects.all().delete()
+        Routine.objects.all().delete()
+        Activity.objects.all().delete()
+        restore_backup(path, batch_size=2)
+
+        profile = UserProfile.objects.get(user__username="runner")
+        self.assertEqual(sorted(profile.routine.activities.values_list('pk', 'activitytype')), expected)
+        self.assertEqual(Activity.objects.count(), 5)
+
+    def test_link_and_user_changes_reach_increment(self):
+        create_backup(self.backup_dir)
+        activity = self.routine.activities.order_by('pk').first()
+        self.routine.activities.remove(activity)
+        self.routine.activities.add(activity)  # Re-linked under a new key
+        user = User.objects.get(username="runner")
+        user.email = "new@example.com"
+        user.save()
+
+        path = create_backup(self.backup_dir, incremental=True)
+        entries = {entry['model']: entry for entry in read_manifest(path)['models']}
+        self.assertEqual(entries['SonareSoma.RoutineActivity']['rows'], 1)
+        self.assertEqual(entries['auth.User']['rows'], 1)
+        self.assertEqual(entries['SonareSoma.UserProfile']['rows'], 0)
+
+        User.objects.all().delete()
+        Routine.objects.all().delete()
+        Activity.objects.all().delete()
+        restore_backup(path, batch_size=2)
+        profile = UserProfile.objects.get(user__username="runner")
+        self.assertEqual(profile.user.email, "new@example.com")
+        self.assertEqual(profile.routine.activities.count(), 5)
+
+    def test_delete_missing_merges_ordered_keys(self):
+        pks = list(Activity.objects.order_by('pk').values_list('pk', flat=True))
+        delete_missing(Activity, [pks[1], pks[3], pks[-1] + 100], batch_size=2)
+        self.assertEqual(list(Activity.objects.order_by('pk').values_list('pk', flat=True)), [pks[1], pks[3]])
+
+    def test_queue_and_derived_tables_are_not_backed_up(self):
+        OutboundEmail.from_message(EmailMessage("Hi", "Body", to=["runner@example.com"])).save()
+        path = create_backup(self.backup_dir)
+        models = {entry['model'] for entry in read_manifest(path)['models']}
+
+        self.assertIn('SonareSoma.Goal', models)
+        for label in ('OutboundEmail', 'NotificationLog', 'DigestSection', 'RateLimitBucket', 'DailyNutritionTotals'):
+            self.assertNotIn(f'SonareSoma.{label}', models)
+
+    def test_goal_progress_reaches_increment(self):
+        today = timezone.now().date()
+        profile = UserProfile.objects.get(user__username="runner")
+        professional = Professional.objects.create(PTUser=User.objects.create(username="coach"))
+        goal = Goal.objects.create(goaltype="Steps", goalvalue=100, startdate=today, enddate=today, client=profile, professional=professional)
+        create_backup(self.backup_dir)
+        GoalRepository.record_progress(goal, 150)
+
+        path = create_backup(self.backup_dir, incremental=True)
+        entries = {entry['model']: entry for entry in read_manifest(path)['models']}
+        self.assertEqual(entries['SonareSoma.GoalProgress']['rows'], 1)
+        self.assertEqual(entries['SonareSoma.Goal']['rows'], 1)
+
+        User.objects.all().delete()
+        Routine.objects.all().delete()
+        Activity.objects.all().delete()
+        restore_backup(path)
+        goal = Goal.objects.get()
+        self.assertEqual(goal.latest_value, 150)
+        self.assertIsNotNone(goal.achieved_at)
+
+class ProfessionalReportTests(TestCase):
+    def setUp(self):
+        today = timezone.now().date()
+        active_routine = Routine.objects.create()
+        active_routine.activities.add(
+            Activity.objects.create(activitydate=today, starttime="07:00", endtime="08:00", activitytype="Run"),
+            Activity.objects.create(activitydate=today, starttime="18:00", endtime="19:00", activitytype="Lift"),
+        )
+        for p in range(3):
+            professional = Professional.objects.create(PTUser=User.objects.create(username=f"pro{p}", email=f"pro{p}@example.com"))
+            for c in range(4):
+                user = User.objects.create(username=f"client{p}_{c}")
+                Client.objects.create(user=user, professional=professional)
+                profile = UserProfile.objects.create(user=user, routine=active_routine if c < 3 else None, professional=professional)
+                Goal.objects.create(goaltype=f"Goal {p}_{c}", goalvalue=c, startdate=today, enddate=today, client=profile, professional=professional)
+
+    def test_send_monthly_client_retention_report(self):
+        with self.assertNumQueries(3):
+            send_monthly_client_retention_report()
+
+        self.assertEqual(len(mail.outbox), 3)
+        body = mail.outbox[0].body
+        self.assertIn("Hi pro0,", body)
+        self.assertIn("- Total Clients: 4", body)
+        self.assertIn("- Active Clients: 3", body)
+        self.assertIn("- Retention Rate: 75.00%", body)
+        self.assertIn("- Goals Set This Month: 4", body)
+
+    def test_send_client_progress_report(self):
+        with self.assertNumQueries(4):
+            send_client_progress_report()
+
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[1].to, ["pro1@example.com"])
+        self.assertIn("- client1_2: Goal 1_2 (Target: 2.0)", mail.outbox[1].body)
+        self.assertNotIn("client0_", mail.outbox[1].body)
+
+class NotificationLedgerTests(TestCase):
+    def test_rerun_only_sends_missing_notifications(self):
+        connection = RecordingEmailBackend()
+        with BulkMailer(batch_size=10, connection=connection, kind="reminder", period_key="2025-05-12") as mailer:
+            for i in range(5):
+                mailer.add("Subject", "Body", [f"user{i}@example.com"])
+
+        connection = RecordingEmailBackend()
+        with self.assertNumQueries(2):  # One ledger insert and one lookup of the claimed keys per batch
+            with BulkMailer(batch_size=10, connection=connection, kind="reminder", period_key="2025-05-12") as mailer:
+                for i in range(8):
+                    mailer.add("Subject", "Body", [f"user{i}@example.com"])
+
+        self.assertEqual(mailer.sent, 3)
+        self.assertEqual(mailer.skipped, 5)
+        self.assertEqual(NotificationLog.objects.count(), 8)
+
+    def test_new_period_is_sent_again(self):
+        for period_key in ("2025-05-12", "2025-05-13"):
+            with BulkMailer(kind="reminder", period_key=period_key) as mailer:
+                mailer.add("Subject", "Body", ["user@example.com"])
+        self.assertEqual(len(mail.outbox), 2)
+
+    @override_settings(SONARESOMA_NOTIFICATION_LOG_RETENTION_DAYS=62)
+    def test_prune_removes_old_ledger_rows(self):
+        now = timezone.now()
+        for recipient in ("old@example.com", "old2@example.com", "recent@example.com"):
+            NotificationLog.objects.create(recipient=recipient, kind="reminder", period_key="2025-05")
+        NotificationLog.objects.exclude(recipient="recent@example.com").update(sent_at=now - timezone.timedelta(days=63))
+
+        self.assertEqual(prune_notification_log(now=now, batch_size=1), 2)
+        self.assertEqual(list(NotificationLog.objects.values_list('recipient', flat=True)), ["recent@example.com"])
+
+    def test_undelivered_batch_is_released(self):
+        connection = RecordingEmailBackend(failures=2)
+        with self.assertLogs("SonareSoma.notifications", level="ERROR"):
+            with BulkMailer(max_retries=1, connection=connection, kind="reminder", period_key="2025-05-12") as mailer:
+                mailer.add("Subject", "Body", ["user@example.com"])
+        self.assertFalse(NotificationLog.objects.exists())
+
+    def test_concurrent_mailers_never_claim_the_same_message(self):
+        def batch():
+            return [EmailMessage("Subject", "Body", "from@example.com", [f"user{i}@example.com"]) for i in range(4)]
+
+        first = BulkMailer(kind="reminder", period_key="2025-05-12", connection=RecordingEmailBackend())
+        second = BulkMailer(kind="reminder", period_key="2025-05-12", connection=RecordingEmailBackend())
+        for mailer in (first, second):
+            for email in batch():
+                mailer.add_message(email)
+        first_batch, second_batch = first.pending, second.pending
+
+        # The first run inserts its claims between the second run's start and its own insert
+        insert = NotificationLog.objects.bulk_create
+        racing = []
+
+        def racing_insert(objs, **kwargs):
+            if not racing:
+                racing.append(None)
+                racing[0] = first.claim(first_batch)
+            return insert(objs, **kwargs)
+
+        with mock.patch.object(NotificationLog.objects, 'bulk_create', side_effect=racing_insert):
+            claimed_by_second = second.claim(second_batch)
+        self.assertEqual(len(racing[0]), 4)
+        self.assertEqual(claimed_by_second, [])
+        self.assertEqual(second.skipped, 4)
+        self.assertEqual(NotificationLog.objects.count(), 4)
+
+    def test_daily_routine_reminder_is_not_resent(self):
+        UserProfile.objects.create(user=User.objects.create(username="runner", email="runner@example.com"), routine=Routine.objects.create())
+        send_daily_routine_reminder()
+        send_daily_routine_reminder()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertTrue(NotificationLog.objects.filter(kind="daily_routine_reminder", period_key=daily_period(timezone.now().date())).exists())
+
+class OutboundQueueTests(TestCase):
+    def enqueue(self, count):
+        with BulkMailer(enqueue=True) as mailer:
+            for i in range(count):
+                mailer.add("Subject", "Body", [f"user{i}@example.com"])
+        return mailer
+
+    def test_token_bucket_refills_over_time(self):
+        bucket = TokenBucket("test", rate=2, capacity=5)
+        start = timezone.now()
+        self.assertEqual(bucket.acquire(10, now=start), 5)
+        self.assertEqual(bucket.acquire(10, now=start), 0)
+        self.assertEqual(bucket.acquire(10, now=start + timezone.timedelta(seconds=1.5)), 3)
+        self.assertEqual(bucket.acquire(10, now=start + timezone.timedelta(seconds=60)), 5)
+
+    def test_enqueue_does_not_send(self):
+        mailer = self.enqueue(3)
+        self.assertEqual(mailer.queued, 3)
+        self.assertEqual(OutboundEmail.objects.count(), 3)
+        self.assertEqual(len(mail.outbox), 0)
+
+    @override_settings(SONARESOMA_EMAIL_BURST=4, SONARESOMA_EMAIL_RATE_PER_SECOND=0.001)
+    def test_drain_respects_rate_limit(self):
+        self.enqueue(10)
+
+        self.assertEqual(drain_outbox(max_seconds=0), 4)
+        self.assertEqual(drain_outbox(max_seconds=0), 0)
+
+        self.assertEqual(len(mail.outbox), 4)
+        self.assertEqual(OutboundEmail.objects.filter(sent_at__isnull=True).count(), 6)
+        self.assertEqual(mail.outbox[0].to, ["user0@example.com"])
+
+    @override_settings(EMAIL_BACKEND='SonareSoma.tests.RejectingEmailBackend', SONARESOMA_EMAIL_MAX_ATTEMPTS=2, SONARESOMA_EMAIL_MAX_RETRIES=0,
+                       SONARESOMA_EMAIL_BURST=1000, SONARESOMA_EMAIL_RATE_PER_SECOND=0.001)
+    def test_only_delivered_emails_are_marked_sent(self):
+        with BulkMailer(enqueue=True, kind="summary", period_key="2025-W20") as mailer:
+            for address in ("user0@example.com", "user1@example.com", "bounce@example.com"):
+                mailer.add("Subject", "Body", [address])
+
+        self.assertEqual(drain_outbox(max_seconds=0), 2)
+        self.assertEqual(sorted(email.to[0] for email in mail.outbox), ["user0@example.com", "user1@example.com"])
+        bounced = OutboundEmail.objects.get(recipients="bounce@example.com")
+        self.assertEqual((bounced.sent_at, bounced.attempts, bounced.locked_until), (None, 1, None))
+        self.assertTrue(NotificationLog.objects.filter(recipient="bounce@example.com").exists())
+
+        # The last attempt gives up and releases the claim, so a re-run can queue it again
+        self.assertEqual(drain_outbox(max_seconds=0), 0)
+        self.assertFalse(NotificationLog.objects.filter(recipient="bounce@example.com").exists())
+        self.assertEqual(NotificationLog.objects.count(), 2)
+
+        tokens = RateLimitBucket.objects.get().tokens
+        self.assertEqual(drain_outbox(max_seconds=0), 0)
+        self.assertEqual(RateLimitBucket.objects.get().tokens, tokens)  # Given-up emails use no tokens
+
+    def test_leased_emails_are_not_taken_by_another_drain(self):
+        self.enqueue(3)
+        now = timezone.now()
+        self.assertEqual(len(lease_queued_batch(2, now=now)), 2)
+        self.assertEqual([email.recipients for email in lease_queued_batch(5, now=now)], ["user2@example.com"])
+        self.assertEqual(lease_queued_batch(5, now=now), [])
+        self.assertEqual(len(lease_queued_batch(5, now=now + timezone.timedelta(minutes=10))), 3)
+
+    @override_settings(SONARESOMA_EMAIL_RETENTION_DAYS=7, SONARESOMA_EMAIL_MAX_ATTEMPTS=5)
+    def test_prune_removes_old_sent_and_given_up_emails(self):
+        self.enqueue(4)
+        now = timezone.now()
+        old, recent, dead, waiting = OutboundEmail.objects.order_by('id')
+        OutboundEmail.objects.filter(pk=old.pk).update(sent_at=now - timezone.timedelta(days=8))
+        OutboundEmail.objects.filter(pk=recent.pk).update(sent_at=now - timezone.timedelta(days=1))
+        OutboundEmail.objects.filter(pk__in=[dead.pk, waiting.pk]).update(created_at=now - timezone.timedelta(days=8))
+        OutboundEmail.objects.filter(pk=dead.pk).update(attempts=5)
+
+        self.assertEqual(prune_outbox(now=now, batch_size=1), 2)
+        self.assertEqual(sorted(OutboundEmail.objects.values_list('pk', flat=True)), [recent.pk, waiting.pk])
+
+
+class NotificationClaimCommitTests(TransactionTestCase):
+    # Runs outside a test transaction, like a task, so claims really commit or roll back.
+    def test_failed_enqueue_keeps_no_claims(self):
+        with mock.patch.object(OutboundEmail.objects, 'bulk_create', side_effect=RuntimeError("database gone")):
+            with self.assertRaises(RuntimeError):
+                with BulkMailer(kind="reminder", period_key="2025-05-12", enqueue=True) as mailer:
+                    mailer.add("Subject", "Body", ["user@example.com"])
+        self.assertFalse(NotificationLog.objects.exists())
+
+        with BulkMailer(kind="reminder", period_key="2025-05-12", enqueue=True) as mailer:
+            mailer.add("Subject", "Body", ["user@example.com"])
+        self.assertEqual(mailer.queued, 1)
+
+
+class EmailTemplateTests(TestCase):
+    def test_template_is_compiled_once(self):
+        self.assertIs(get_email_template('daily_routine_reminder'), get_email_template('daily_routine_reminder'))
+
+    def test_plain_text_rendering(self):
+        activity = Activity(activitytype="Run & Lift", activitydate=timezone.now().date(), starttime=datetime.time(7), endtime="08:00:00")
+        message = render_email('daily_routine_reminder', username="o'neil", activities=[activity])
+        self.assertEqual(
+            message,
+            "Hi o'neil,\n\nHere are your activities for today:\n- Run & Lift at 07:00:00\n\nStay consistent and achieve your goals!",
+        )
+        self.assertEqual(
+            render_email('daily_routine_reminder', username="rest", activities=[]),
+            "Hi rest,\n\nHere are your activities for today:\nNo activities scheduled for today. Enjoy your rest day!",
+        )
+
+    def test_professional_summary_lists_each_client(self):
+        goal = Goal(goaltype="Strength", goalvalue=5.0, startdate=timezone.now().date(), enddate=timezone.now().date())
+        message = render_email('weekly_professional_summary', username="pro", clients=[("a", [goal]), ("b", [goal, goal])])
+        self.assertEqual(message.count("- Strength: 5.0 (Start: "), 3)
+        self.assertIn(f"Client: b\n- Strength: 5.0 (Start: {goal.startdate}, End: {goal.enddate})\n", message)
+        self.assertTrue(message.endswith("\n\nKeep supporting your clients to achieve their goals!"))
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_email_render', recipients=10, clients=5, stdout=out)
+        self.assertIn("ms per 10k recipients", out.getvalue())
+        self.assertIn("weekly_professional_summary: 5 clients", out.getvalue())
+
+
+class DeliverySlotTests(TestCase):
+    def setUp(self):
+        current_app.conf.task_always_eager = True
+        self.addCleanup(setattr, current_app.conf, 'task_always_eager', False)
+        today = timezone.now().date()
+        routine = Routine.objects.create()
+        routine.activities.add(Activity.objects.create(activitydate=today, starttime="07:00", endtime="08:00", activitytype="Run"))
+        nutrition = Nutrition.objects.create()
+        for i in range(6):
+            UserProfile.objects.create(
+                user=User.objects.create(username=f"user{i}", email=f"user{i}@example.com"),
+                routine=routine, nutrition=nutrition, delivery_slot=i % 3,
+            )
+
+    def test_new_profiles_get_a_valid_slot(self):
+        with override_settings(SONARESOMA_DELIVERY_SLOTS=4):
+            slots = {UserProfile.objects.create(user=User.objects.create(username=f"new{i}")).delivery_slot for i in range(20)}
+        self.assertTrue(slots <= {0, 1, 2, 3})
+
+    @override_settings(SONARESOMA_DELIVERY_SLOTS=96)
+    def test_current_delivery_slot(self):
+        day = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.assertEqual(current_delivery_slot(day), 0)
+        self.assertEqual(current_delivery_slot(day.replace(minute=14, second=59)), 0)
+        self.assertEqual(current_delivery_slot(day.replace(minute=15)), 1)
+        self.assertEqual(current_delivery_slot(day.replace(hour=12, minute=7)), 48)
+        self.assertEqual(current_delivery_slot(day.replace(hour=23, minute=59)), 95)
+
+    @override_settings(SONARESOMA_DELIVERY_SLOTS=96)
+    def test_late_dispatch_catches_up_on_missed_slots(self):
+        day = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.assertEqual(claim_due_delivery_slots(day.replace(minute=40)), [0, 1, 2])
+        self.assertEqual(claim_due_delivery_slots(day.replace(minute=50)), [3])
+        self.assertEqual(claim_due_delivery_slots(day.replace(minute=55)), [])
+        self.assertEqual(claim_due_delivery_slots(day.replace(hour=1, minute=20)), [4, 5])
+        self.assertEqual(claim_due_delivery_slots(day + datetime.timedelta(days=1)), [0])
+
+    def test_dispatcher_sends_every_due_slot(self):
+        with mock.patch('SonareSoma.tasks.claim_due_delivery_slots', return_value=[0, 1]):
+            self.assertEqual(send_daily_notifications_for_slot(), [0, 1])
+        self.assertEqual(
+            sorted(email.to[0] for email in mail.outbox if email.subject == "Today's Routine Reminder"),
+            [f"user{i}@example.com" for i in (0, 1, 3, 4)],
+        )
+
+    def test_slot_task_only_reaches_profiles_in_that_slot(self):
+        send_daily_notifications_for_slot(slot=1)
+        self.assertEqual(
+            sorted((email.subject, email.to[0]) for email in mail.outbox),
+            [(subject, f"user{i}@example.com") for subject in ("Daily Meal Plan Reminder", "Today's Routine Reminder") for i in (1, 4)],
+        )
+
+    def test_without_a_slot_every_profile_is_reached(self):
+        send_daily_routine_reminder()
+        self.assertEqual(len(mail.outbox), 6)
+
+
+class TaskMetricsTests(TestCase):
+    def setUp(self):
+        current_app.conf.task_always_eager = True
+        self.addCleanup(setattr, current_app.conf, 'task_always_eager', False)
+        registry.reset()
+        self.addCleanup(registry.reset)
+        routine = Routine.objects.create()
+        routine.activities.add(Activity.objects.create(activitydate=timezone.now().date(), starttime="07:00", endtime="08:00", activitytype="Run"))
+        for i in range(3):
+            UserProfile.objects.create(user=User.objects.create(username=f"user{i}", email=f"user{i}@example.com"), routine=routine)
+
+    def test_task_run_is_recorded(self):
+        with self.assertLogs('SonareSoma.metrics', level='INFO') as log:
+            send_daily_routine_reminder.apply()
+
+        [totals] = registry.snapshot()
+        self.assertEqual(totals['task'], 'SonareSoma.tasks.send_daily_routine_reminder')
+        self.assertEqual(totals['runs'], 1)
+        self.assertEqual(totals['failures'], 0)
+        self.assertEqual(totals['queries'], 5)
+        self.assertEqual(totals['rows'], 7)  # One activity, three profiles, three claimed ledger keys
+        self.assertEqual(totals['emails_sent'], 3)
+        self.assertGreater(totals['wall_time'], 0)
+        self.assertEqual(json.loads(log.records[-1].getMessage())['emails_sent'], 3)
+
+    def test_nested_tasks_count_towards_the_outer_run(self):
+        send_daily_notifications_for_slot.apply(kwargs={'slot': UserProfile.objects.first().delivery_slot})
+        totals = {entry['task']: entry for entry in registry.snapshot()}
+        outer = totals['SonareSoma.tasks.send_daily_notifications_for_slot']
+        inner = totals['SonareSoma.tasks.send_daily_routine_reminder']
+        self.assertGreaterEqual(outer['emails_sent'], inner['emails_sent'])
+        self.assertGreater(outer['queries'], inner['queries'])
+
+    def test_metrics_app_serves_snapshot(self):
+        send_daily_routine_reminder.apply()
+        statuses = []
+        body = b''.join(metrics_app({}, lambda status, headers: statuses.append(status)))
+        self.assertEqual(statuses, ['200 OK'])
+        self.assertEqual(json.loads(body)['tasks'][0]['emails_sent'], 3)
+
+
+class InactivityReminderTests(TestCase):
+    def setUp(self):
+        today = timezone.now().date()
+        for name, days_ago in (("active", 2), ("lapsed", 10)):
+            routine = Routine.objects.create()
+            routine.activities.add(
+                Activity.objects.create(activitydate=today - timezone.timedelta(days=days_ago), starttime="07:00", endtime="08:00", activitytype="Run"),
+                Activity.objects.create(activitydate=today - timezone.timedelta(days=30), starttime="07:00", endtime="08:00", activitytype="Run"),
+            )
+            UserProfile.objects.create(user=User.objects.create(username=name, email=f"{name}@example.com"), routine=routine)
+        UserProfile.objects.create(user=User.objects.create(username="empty", email="empty@example.com"), routine=Routine.objects.create())
+        UserProfile.objects.create(user=User.objects.create(username="none", email="none@example.com"))
+
+    @override_settings(SONARESOMA_EMAIL_BATCH_SIZE=500)
+    def test_only_inactive_profiles_are_reminded_in_one_query(self):
+        # One grouped query, plus the ledger lookup and insert for the mail batch
+        with self.assertNumQueries(3):
+            send_inactivity_reminder()
+        self.assertEqual(sorted(email.to[0] for email in mail.outbox), ["empty@example.com", "lapsed@example.com", "none@example.com"])
+        self.assertTrue(mail.outbox[0].body.startswith("Hi "))
+
+
+class GoalProgressTests(TestCase):
+    def setUp(self):
+        professional = Professional.objects.create(PTUser=User.objects.create(username="pro"))
+        today = timezone.now().date()
+        self.goals = []
+        for i in range(3):
+            client = UserProfile.objects.create(user=User.objects.create(username=f"client{i}", email=f"client{i}@example.com"))
+            self.goals.append(Goal.objects.create(
+                goaltype=f"Goal {i}", goalvalue=10, startdate=today, enddate=today + timezone.timedelta(days=30),
+                client=client, professional=professional,
+            ))
+
+    def test_latest_value_and_achievement_are_denormalized(self):
+        goal = self.goals[0]
+        now = timezone.now()
+        GoalRepository.record_progress(goal, 4, recorded_at=now - timezone.timedelta(days=2))
+        GoalRepository.record_progress(goal, 11, recorded_at=now - timezone.timedelta(days=1))
+        GoalRepository.record_progress(goal, 12, recorded_at=now)
+        # A late measurement does not replace the newer one
+        GoalRepository.record_progress(goal, 6, recorded_at=now - timezone.timedelta(days=3))
+
+        goal.refresh_from_db()
+        self.assertEqual(goal.latest_value, 12)
+        self.assertEqual(goal.latest_recorded_at, now)
+        self.assertEqual(goal.achieved_at, now - timezone.timedelta(days=1))
+
+    def test_achievement_is_notified_once(self):
+        GoalRepository.record_progress(self.goals[1], 10)
+        GoalRepository.record_progress(self.goals[2], 9)
+
+        notify_goal_achievement()
+        notify_goal_achievement()
+
+        self.assertEqual([email.to for email in mail.outbox], [["client1@example.com"]])
+
+    @override_settings(SONARESOMA_EMAIL_BATCH_SIZE=500)
+    def test_weekly_goal_summary_reads_latest_values(self):
+        GoalRepository.record_progress(self.goals[0], 7)
+        # One joined goal query, the ledger lookup and insert, the digest lookup and the queue insert
+        with self.assertNumQueries(5):
+            send_weekly_goal_summary()
+        drain_outbox(max_seconds=0)
+
+        bodies = {email.to[0]: email.body for email in mail.outbox}
+        self.assertEqual(len(bodies), 3)
+        self.assertIn("- Goal 0: 7.0 (Target: 10.0)", bodies["client0@example.com"])
+        self.assertIn("- Goal 1: no progress yet (Target: 10.0)", bodies["client1@example.com"])
+
+
+class MissedRoutineTests(TestCase):
+    def create_dataset(self, users_per_routine):
+        yesterday = timezone.now().date() - timezone.timedelta(days=1)
+        routine = Routine.objects.create()
+        late = Activity.objects.create(activitydate=yesterday, starttime="18:00", endtime="19:00", activitytype="Swim")
+        early = Activity.objects.create(activitydate=yesterday, starttime="07:00", endtime="08:00", activitytype="Run")
+        routine.activities.add(late, early, Activity.objects.create(activitydate=yesterday + timezone.timedelta(days=1), starttime="07:00", endtime="08:00", activitytype="Yoga"))
+        profiles = [
+            UserProfile.objects.create(user=User.objects.create(username=f"user{users_per_routine}_{i}", email=f"user{users_per_routine}_{i}@example.com"), routine=routine)
+            for i in range(users_per_routine)
+        ]
+        # The first user did everything, the second skipped the run only
+        ActivityCompletion.objects.create(user=profiles[0], activity=late)
+        ActivityCompletion.objects.create(user=profiles[0], activity=early)
+        ActivityCompletion.objects.create(user=profiles[1], activity=late)
+        return profiles
+
+    def test_only_uncompleted_activities_are_reported(self):
+        self.create_dataset(users_per_routine=3)
+
+        send_missed_routine_notification()
+
+        bodies = {email.to[0]: email.body for email in mail.outbox}
+        self.assertEqual(sorted(bodies), ["user3_1@example.com", "user3_2@example.com"])
+        self.assertIn("- Run at 07:00:00\n", bodies["user3_1@example.com"])
+        self.assertNotIn("Swim", bodies["user3_1@example.com"])
+        self.assertIn("- Run at 07:00:00\n- Swim at 18:00:00\n", bodies["user3_2@example.com"])
+        self.assertNotIn("Yoga", bodies["user3_2@example.com"])
+
+    @override_settings(SONARESOMA_EMAIL_BATCH_SIZE=500)
+    def test_constant_query_count(self):
+        # One anti-join query, plus the ledger lookup and insert for the mail batch
+        self.create_dataset(users_per_routine=2)
+        with self.assertNumQueries(3):
+            send_missed_routine_notification()
+        self.create_dataset(users_per_routine=40)
+        with self.assertNumQueries(3):
+            send_missed_routine_notification()
+
+    def test_delivery_slot_filter(self):
+        profiles = self.create_dataset(users_per_routine=3)
+        UserProfile.objects.filter(pk=profiles[2].pk).update(delivery_slot=7)
+        UserProfile.objects.filter(pk=profiles[1].pk).update(delivery_slot=8)
+        send_missed_routine_notification(slot=7)
+        self.assertEqual([email.to for email in mail.outbox], [["user3_2@example.com"]])
+
+
+class ProfessionalWeeklySummaryTests(TestCase):
+    def create_dataset(self, clients_per_professional):
+        monday = timezone.now().date() - timezone.timedelta(days=timezone.now().date().weekday())
+        for p in range(2):
+            professional = Professional.objects.create(
+                PTUser=User.objects.create(username=f"pro{clients_per_professional}_{p}", email=f"pro{clients_per_professional}_{p}@example.com")
+            )
+            for c in range(clients_per_professional):
+                client = UserProfile.objects.create(user=User.objects.create(username=f"client{clients_per_professional}_{p}_{c}"))
+                for goaltype, startdate in (("Strength", monday), ("Endurance", monday + timezone.timedelta(days=2)), ("Old", monday - timezone.timedelta(days=7))):
+                    Goal.objects.create(
+                        goaltype=goaltype, goalvalue=5, startdate=startdate, enddate=startdate + timezone.timedelta(days=30),
+                        client=client, professional=professional,
+                    )
+        # A professional with nothing new this week gets no summary
+        Professional.objects.create(PTUser=User.objects.create(username=f"idle{clients_per_professional}", email=f"idle{clients_per_professional}@example.com"))
+
+    def test_summary_groups_goals_by_client(self):
+        self.create_dataset(clients_per_professional=2)
+        send_weekly_professional_summary()
+        drain_outbox(max_seconds=0)
+
+        bodies = {email.to[0]: email.body for email in mail.outbox}
+        self.assertEqual(sorted(bodies), ["pro2_0@example.com", "pro2_1@example.com"])
+        body = bodies["pro2_1@example.com"]
+        self.assertTrue(body.startswith("Hi pro2_1,\n\n"))
+        self.assertIn("Client: client2_1_0\n- Strength: 5.0", body)
+        self.assertEqual(body.count("Client: "), 2)
+        self.assertEqual(body.count("- Endurance: "), 2)
+        self.assertNotIn("client2_0_", body)
+        self.assertNotIn("Old", body)
+
+    @override_settings(SONARESOMA_EMAIL_BATCH_SIZE=500)
+    def test_constant_query_count(self):
+        # One goal query, the ledger lookup and insert, and the queue insert
+        self.create_dataset(clients_per_professional=1)
+        with self.assertNumQueries(4):
+            send_weekly_professional_summary()
+        self.create_dataset(clients_per_professional=30)
+        with self.assertNumQueries(4):
+            send_weekly_professional_summary()
+
+
+class DigestTests(TestCase):
+    def setUp(self):
+        self.set_time(9)  # Before the 18:00 digest
+        nutrition = Nutrition.objects.create()
+        self.profiles = [
+            UserProfile.objects.create(
+                user=User.objects.create(username=f"user{i}", email=f"user{i}@example.com"),
+                nutrition=nutrition, digest_only=i < 2,
+            )
+            for i in range(4)
+        ]
+
+    def send_reminders(self):
+        send_daily_meal_plan_reminder_chunk(self.profiles[0].pk, self.profiles[-1].pk)
+        send_weekly_meal_plan_suggestions_chunk(self.profiles[0].pk, self.profiles[-1].pk)
+
+    def set_time(self, hour):
+        patcher = mock.patch('django.utils.timezone.now', return_value=timezone.make_aware(datetime.datetime(2025, 5, 12, hour, 30)))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @override_settings(SONARESOMA_DIGEST_HOUR=18)
+    def test_daily_reminder_after_the_digest_is_sent_on_its_own(self):
+        self.set_time(19)
+        self.send_reminders()
+
+        self.assertEqual(sorted(email.to[0] for email in mail.outbox if email.subject == "Daily Meal Plan Reminder"),
+                         [f"user{i}@example.com" for i in range(4)])
+        section = DigestSection.objects.filter(user=self.profiles[0]).get()
+        self.assertEqual(section.subject, "Weekly Meal Plan Suggestions")
+        self.assertEqual(section.digest_date, datetime.date(2025, 5, 13))
+        self.assertEqual(flush_digests(), 0)  # Still today's run
+
+    def test_digest_users_get_one_combined_email(self):
+        self.send_reminders()
+        self.assertEqual(sorted(email.to[0] for email in mail.outbox), ["user2@example.com", "user2@example.com", "user3@example.com", "user3@example.com"])
+        self.assertEqual(DigestSection.objects.count(), 4)
+
+        mail.outbox = []
+        self.assertEqual(flush_digests(), 2)
+
+        self.assertEqual(sorted(email.to[0] for email in mail.outbox), ["user0@example.com", "user1@example.com"])
+        body = mail.outbox[0].body
+        self.assertEqual(mail.outbox[0].subject, "Your Daily Digest")
+        self.assertEqual(body.count("Hi user"), 1)
+        self.assertIn("== Daily Meal Plan Reminder ==\n\nDon't forget to log your meals for today!", body)
+        self.assertIn("== Weekly Meal Plan Suggestions ==", body)
+        self.assertFalse(DigestSection.objects.exists())
+        self.assertEqual(flush_digests(), 0)
+
+    @override_settings(SONARESOMA_EMAIL_MAX_RETRIES=0)
+    def test_failed_digest_batch_is_kept_for_the_next_run(self):
+        self.send_reminders()
+        self.assertEqual(flush_digests(connection=RecordingEmailBackend(failures=1)), 0)
+        self.assertEqual(DigestSection.objects.count(), 4)
+        self.assertEqual(flush_digests(), 2)
+        self.assertFalse(DigestSection.objects.exists())
+
+    @override_settings(SONARESOMA_EMAIL_MAX_RETRIES=0)
+    def test_partly_delivered_batch_keeps_only_undelivered_sections(self):
+        self.send_reminders()
+        mail.outbox = []
+        self.assertEqual(flush_digests(connection=RecordingEmailBackend(fail_after=[1])), 1)
+        self.assertEqual(DigestSection.objects.count(), 2)
+        self.assertEqual(flush_digests(), 1)
+        self.assertEqual(sorted(email.to[0] for email in mail.outbox), ["user0@example.com", "user1@example.com"])
+
+
+class QueueRoutingTests(TestCase):
+    def setUp(self):
+        registry.reset()
+        self.addCleanup(registry.reset)
+
+    def route(self, name):
+        return celery_app.amqp.router.route({}, name)['queue'].name
+
+    def test_tasks_are_routed_by_traffic_class(self):
+        self.assertEqual(self.route('SonareSoma.tasks.notify_client_of_message'), 'transactional')
+        self.assertEqual(self.route('SonareSoma.tasks.notify_professional_of_message'), 'transactional')
+        self.assertEqual(self.route('SonareSoma.tasks.notify_client_about_new_goal'), 'transactional')
+        self.assertEqual(self.route('SonareSoma.tasks.backup_database'), 'maintenance')
+        self.assertEqual(self.route('SonareSoma.tasks.prune_outbound_email'), 'maintenance')
+        self.assertEqual(self.route('SonareSoma.tasks.prune_notification_ledger'), 'maintenance')
+        self.assertEqual(self.route('SonareSoma.tasks.drain_outbound_email'), 'scheduling')
+        self.assertEqual(self.route('SonareSoma.tasks.send_daily_notifications_for_slot'), 'scheduling')
+        self.assertEqual(self.route('SonareSoma.tasks.send_daily_routine_reminder'), 'bulk')
+        self.assertEqual(self.route('SonareSoma.tasks.send_weekly_activity_leaderboard'), 'bulk')
+        self.assertEqual(self.route('SonareSoma.tasks.send_motivational_message_chunk'), 'bulk')
+
+    def test_single_queue_worker_takes_its_settings(self):
+        conf = SimpleNamespace(worker_prefetch_multiplier=4, worker_concurrency=None)
+        configure_queue_worker(conf=conf, options={'queues': 'bulk', 'concurrency': None})
+        self.assertEqual((conf.worker_prefetch_multiplier, conf.worker_concurrency), (1, 2))
+
+        conf = SimpleNamespace(worker_prefetch_multiplier=4, worker_concurrency=None)
+        configure_queue_worker(conf=conf, options={'queues': ['transactional'], 'concurrency': 16})
+        self.assertEqual((conf.worker_prefetch_multiplier, conf.worker_concurrency), (4, None))
+
+        conf = SimpleNamespace(worker_prefetch_multiplier=4, worker_concurrency=None)
+        configure_queue_worker(conf=conf, options={'queues': 'bulk,maintenance'})
+        self.assertEqual((conf.worker_prefetch_multiplier, conf.worker_concurrency), (4, None))
+
+    def test_queue_latency_percentiles(self):
+        headers = {}
+        stamp_publish_time(headers=headers)
+        for delay in range(1, 101):
+            record_queue_latency(SimpleNamespace(
+                headers={'published_at': headers['published_at'] - delay / 100},
+                delivery_info={'routing_key': 'transactional'},
+            ))
+        record_queue_latency(SimpleNamespace(headers=None, delivery_info=None))  # Eager run, never queued
+
+        latency = registry.queue_snapshot()['transactional']
+        self.assertEqual(latency['samples'], 100)
+        self.assertGreaterEqual(latency['p50'], 0.5)
+        self.assertGreaterEqual(latency['p99'], 0.99)
+        self.assertLessEqual(latency['p99'], latency['max'])
+        self.assertEqual(list(registry.queue_snapshot()), ['transactional'])
+
+
+class UserProfileViewSetTests(TestCase):
+    def create_profiles(self, count, start=0):
+        users = User.objects.bulk_create([User(username=f"user{i}", email=f"user{i}@example.com") for i in range(start, start + count)])
+        routine, nutrition = Routine.objects.create(), Nutrition.objects.create()
+        professional = Professional.objects.create(PTUser=User.objects.create(username=f"pro{start}"))
+        UserProfile.objects.bulk_create([
+            UserProfile(user=user, routine=routine, nutrition=nutrition, professional=professional) for user in users
+        ])
+
+    @override_settings(SONARESOMA_API_MAX_PAGE_SIZE=1000)
+    def test_list_uses_one_query_for_any_number_of_profiles(self):
+        client = APIClient()
+        self.create_profiles(1)
+        with self.assertNumQueries(1):
+            response = client.get('/api/userprofiles/', {'page_size': 1000})
+        self.assertEqual(len(response.data['results']), 1)
+
+        self.create_profiles(999, start=1)
+        with self.assertNumQueries(1):
+            response = client.get('/api/userprofiles/', {'page_size': 1000})
+        self.assertEqual(len(response.data['results']), 1000)
+
+    def test_payload_matches_serializer(self):
+        self.create_profiles(1)
+        profile = UserProfile.objects.get()
+        with self.assertNumQueries(1):
+            response = APIClient().get(f'/api/userprofiles/{profile.id}/')
+        self.assertEqual(response.data, UserProfileSerializer(UserProfile.objects.get()).data)
+        self.assertEqual(response.data['user']['username'], "user0")
+        self.assertEqual(response.data['routine'], profile.routine_id)
+
+
+@override_settings(SONARESOMA_API_PAGE_SIZE=10, SONARESOMA_API_MAX_PAGE_SIZE=50)
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        today = timezone.localdate()
+        # Several activities per day, created out of order, so pages split inside a date
+        Activity.objects.bulk_create([
+            Activity(activitydate=today - datetime.timedelta(days=(i * 7) % 5), starttime=datetime.time(8), endtime=datetime.time(9), activitytype=f"Activity {i}")
+            for i in range(35)
+        ])
+        self.expected = list(Activity.objects.order_by('activitydate', 'id').values_list('id', flat=True))
+        self.client = APIClient()
+
+    def walk(self, url, params=None, link='next'):
+        ids, response = [], self.client.get(url, params)
+        while True:
+            ids.extend(row['id'] for row in response.data['results'])
+            if not response.data[link]:
+                return ids, response
+            response = self.client.get(response.data[link])
+
+    def test_pages_follow_activitydate_then_id_without_gaps(self):
+        ids, last = self.walk('/api/activities/')
+        self.assertEqual(ids, self.expected)
+        self.assertEqual(len(last.data['results']), 5)
+        self.assertIsNotNone(last.data['previous'])
+
+    def test_previous_links_walk_back_to_the_first_page(self):
+        _, last = self.walk('/api/activities/')
+        pages = []
+        response = last
+        while response.data['previous']:
+            response = self.client.get(response.data['previous'])
+            pages.insert(0, [row['id'] for row in response.data['results']])
+        self.assertEqual(sum(pages, []), self.expected[:30])
+        self.assertIsNone(response.data['previous'])
+
+    def test_deep_page_is_one_range_query_without_offset(self):
+        first = self.client.get('/api/activities/', {'page_size': 30})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(first.data['next'])
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('OFFSET', queries[0]['sql'].upper())
+        self.assertEqual([row['id'] for row in response.data['results']], self.expected[30:])
+
+    def test_page_size_is_capped(self):
+        response = self.client.get('/api/activities/', {'page_size': 500})
+        self.assertEqual(len(response.data['results']), 35)
+        Activity.objects.bulk_create([
+            Activity(activitydate=timezone.localdate(), starttime=datetime.time(8), endtime=datetime.time(9), activitytype="Extra")
+            for _ in range(20)
+        ])
+        response = self.client.get('/api/activities/', {'page_size': 500})
+        self.assertEqual(len(response.data['results']), 50)
+
+    def test_invalid_cursor_is_not_found(self):
+        response = self.client.get('/api/activities/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursor_values_of_the_wrong_type_are_not_found(self):
+        pagination = ActivityPagination()
+        pagination.base_url = 'http://testserver/api/activities/'
+        for key in (["abc", "1"], ["2025-01-01", "x"], [None, None], ["2025-01-01"], {"id": 1}, "[1, 2"):
+            position = key if isinstance(key, str) else json.dumps(key)
+            url = pagination.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+            self.assertEqual(self.client.get(url).status_code, 404, key)
+
+
+class NutritionViewSetTests(TestCase):
+    def create_plan(self, meals):
+        foods = Food.objects.bulk_create([
+            Food(name=f"Food {i}", servingsize=100, servingunit="g", calories=100 + i, protein=10, carbohydrates=10, fat=5, sodium=1)
+            for i in range(3)
+        ])
+        nutrition = Nutrition.objects.create()
+        created = Meal.objects.bulk_create([
+            Meal(mealdate=datetime.date(2026, 10, 1) + datetime.timedelta(days=i // 3), mealtime=datetime.time(8 + i % 3 * 5), mealtype="lunch")
+            for i in range(meals)
+        ])
+        MealFood.objects.bulk_create([MealFood(meal=meal, food=food, quantity=2) for meal in created for food in foods])
+        nutrition.meals.add(*created)
+        return nutrition
+
+    def test_detail_runs_three_queries_for_ninety_meals(self):
+        nutrition = self.create_plan(90)
+        with self.assertNumQueries(3):
+            response = APIClient().get(f'/api/nutrition/{nutrition.id}/')
+        meals = response.data['meals']
+        self.assertEqual(len(meals), 90)
+        self.assertEqual(len(meals[0]['foods']), 3)
+        self.assertEqual(meals[0]['foods'][0]['quantity'], 2)
+        self.assertEqual(meals[0]['foods'][0]['food']['name'], "Food 0")
+        self.assertEqual(meals[0]['mealtime'], "08:00:00")
+
+    def test_list_query_count_does_not_grow_with_plans(self):
+        self.create_plan(2)
+        with self.assertNumQueries(3):
+            APIClient().get('/api/nutrition/')
+        self.create_plan(5)
+        self.create_plan(1)
+        with self.assertNumQueries(3):
+            response = APIClient().get('/api/nutrition/')
+        self.assertEqual([len(plan['meals']) for plan in response.data['results']], [2, 5, 1])
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        pro_user = User.objects.create(username="coach", email="coach@example.com")
+        self.professional = Professional.objects.create(PTUser=pro_user)
+        client = UserProfile.objects.create(user=User.objects.create(username="client", email="client@example.com"))
+        today = timezone.localdate()
+        for i in range(3):
+            Goal.objects.create(goaltype=f"Goal {i}", goalvalue=i, startdate=today, enddate=today + datetime.timedelta(days=30),
+                                client=client, professional=self.professional)
+        self.client = APIClient()
+        self.client.force_authenticate(pro_user)
+
+    def test_fields_limit_payload_and_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/goals/', {'fields': 'id,goaltype,enddate'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([set(goal) for goal in response.data['results']], [{'id', 'goaltype', 'enddate'}] * 3)
+        goal_queries = [query['sql'] for query in queries if 'FROM "SonareSoma_goal"' in query['sql']]
+        self.assertEqual(len(goal_queries), 1)
+        select = goal_queries[0].split(' FROM ')[0]
+        self.assertIn('"startdate"', select)  # Pagination key
+        self.assertNotIn('"goalvalue"', select)
+        self.assertNotIn('"client_id"', select)
+
+    def test_omit_drops_fields(self):
+        response = self.client.get('/api/goals/', {'omit': 'latest_value,latest_recorded_at,achieved_at'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'goaltype', 'goalvalue', 'startdate', 'enddate', 'updated_at', 'client', 'professional'})
+
+    def test_detail_and_unknown_fields(self):
+        goal = Goal.objects.first()
+        response = self.client.get(f'/api/goals/{goal.id}/', {'fields': 'goaltype'})
+        self.assertEqual(response.data, {'goaltype': goal.goaltype})
+        response = self.client.get('/api/goals/', {'fields': 'goaltype,nonsense', 'omit': 'bogus'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'fields': ["Unknown field: nonsense"], 'omit': ["Unknown field: bogus"]})
+
+    def test_omitting_a_joined_relation(self):
+        with self.assertNumQueries(1):
+            response = APIClient().get('/api/userprofiles/', {'omit': 'user'})
+        self.assertNotIn('user', response.data['results'][0])
+        response = APIClient().get('/api/userprofiles/', {'fields': 'user'})
+        self.assertEqual(response.data['results'][0], {'user': UserProfileSerializer(UserProfile.objects.get()).data['user']})
+
+    def test_writes_use_every_field(self):
+        goal = Goal.objects.first()
+        response = self.client.patch(f'/api/goals/{goal.id}/?fields=id', {'goalvalue': 42, 'goaltype': "Sprint"}, format='json')
+        self.assertEqual((response.data['goalvalue'], response.data['goaltype']), (42, "Sprint"))
+        goal.refresh_from_db()
+        self.assertEqual((goal.goalvalue, goal.goaltype), (42, "Sprint"))
+
+
+# One test process, so a local-memory cache stands in for the shared one
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class FoodCatalogTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.oats = Food.objects.create(name="Oats", servingsize=40, servingunit="g", calories=150, protein=5, carbohydrates=27, fat=3, sodium=0)
+        Food.objects.create(name="Eggs", servingsize=1, servingunit="egg", calories=70, protein=6, carbohydrates=0, fat=5, sodium=70)
+        self.client = APIClient()
+
+    def test_if_none_match_is_answered_without_queries(self):
+        response = self.client.get('/api/foods/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([food['name'] for food in response.data['results']], ["Oats", "Eggs"])
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/foods/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get('/api/foods/', HTTP_IF_NONE_MATCH=f"W/{etag}").status_code, 304)
+
+    def test_repeated_reads_are_served_from_cache(self):
+        first = self.client.get(f'/api/foods/{self.oats.id}/')
+        with self.assertNumQueries(0):
+            second = self.client.get(f'/api/foods/{self.oats.id}/')
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertNotEqual(self.client.get('/api/foods/', {'fields': 'id,name'})['ETag'], self.client.get('/api/foods/')['ETag'])
+
+    def test_food_changes_bump_the_version(self):
+        etag = self.client.get('/api/foods/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.oats.calories = 160
+            self.oats.save()
+        response = self.client.get('/api/foods/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['calories'], 160)
+
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.oats.delete()
+        response = self.client.get('/api/foods/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual([food['name'] for food in response.data['results']], ["Eggs"])
+
+    @override_settings(ALLOWED_HOSTS=['testserver', 'api.example.com'])
+    def test_cache_is_kept_per_host(self):
+        self.client.get('/api/foods/', {'page_size': 1})
+        response = self.client.get('/api/foods/', {'page_size': 1}, HTTP_HOST='api.example.com')
+        self.assertTrue(response.data['next'].startswith('http://api.example.com/api/foods/'))
+
+    def test_missing_food_is_not_cached(self):
+        self.assertEqual(self.client.get('/api/foods/999999/').status_code, 404)
+        Food.objects.filter(pk=self.oats.pk).update(id=999999)  # Bypasses the signals
+        self.assertEqual(self.client.get('/api/foods/999999/').status_code, 200)
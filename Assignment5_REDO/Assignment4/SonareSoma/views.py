@@ -2,33 +2,82 @@ from django.shortcuts import render, redirect
 from django.http import Http404
 from django.contrib import messages
 from rest_framework import viewsets
-from rest_framework.permissions import IsAuthenticated, BasePermission
-from .models import Professional, Goal, Activity, UserProfile
-from .serializers import ProfessionalSerializer, GoalSerializer, ActivitySerializer, UserProfileSerializer
+from rest_framework.permissions import SAFE_METHODS, IsAuthenticated, BasePermission
+from django.db.models import Prefetch
+from .models import Professional, Goal, Activity, UserProfile, Nutrition, Meal, MealFood, Food
+from .serializers import ProfessionalSerializer, GoalSerializer, ActivitySerializer, UserProfileSerializer, NutritionSerializer, FoodSerializer, selected_columns
 from .forms import GoalForm, ClientGoalForm
 from .tasks import notify_client_about_new_goal
 from .repositories import ProfessionalRepository, UserProfileRepository, GoalRepository
+from .pagination import KeysetPagination, GoalPagination, ActivityPagination
+from .catalog import catalog_response
 
 class IsProfessional(BasePermission):
     def has_permission(self, request, view):
         return hasattr(request.user, 'professional_profile')  # Check if the user is a professional
 
-class ProfessionalViewSet(viewsets.ModelViewSet):
+class SparseFieldsetMixin:
+    """
+    On reads, loads only the columns the response contains: the serializer's fields
+    left after ?fields= / ?omit=, plus the columns the paginator orders on.
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method not in SAFE_METHODS:
+            return queryset
+        ordering = [field.lstrip('-') for field in getattr(self.pagination_class, 'ordering', ())]
+        # A select_related() foreign key cannot be deferred, even when its field is omitted
+        joined = list(queryset.query.select_related) if isinstance(queryset.query.select_related, dict) else []
+        return queryset.only(*selected_columns(self.get_serializer()), *ordering, *joined)
+
+class ProfessionalViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = Professional.objects.all()
     serializer_class = ProfessionalSerializer
+    pagination_class = KeysetPagination
 
-class GoalViewSet(viewsets.ModelViewSet):
+class GoalViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = Goal.objects.all()
     serializer_class = GoalSerializer
+    pagination_class = GoalPagination
     permission_classes = [IsAuthenticated, IsProfessional]
 
-class ActivityViewSet(viewsets.ModelViewSet):
+class ActivityViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = Activity.objects.all()
     serializer_class = ActivitySerializer
+    pagination_class = ActivityPagination
 
-class UserProfileViewSet(viewsets.ModelViewSet):
-    queryset = UserProfile.objects.all()
+class UserProfileViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
+    # One query for list and detail: the nested user is joined in, and SparseFieldsetMixin
+    # loads only the columns the serializer emits. routine, nutrition and professional are
+    # emitted as primary keys, which come from the profile's own *_id columns without a join.
+    queryset = UserProfile.objects.select_related('user')
     serializer_class = UserProfileSerializer
+    pagination_class = KeysetPagination
+
+class NutritionViewSet(SparseFieldsetMixin, viewsets.ReadOnlyModelViewSet):
+    # Three queries per page however many meals a plan has: the plans, their meals, and
+    # the meals' MealFood rows joined to their foods. The serializers only read these caches.
+    queryset = Nutrition.objects.prefetch_related(
+        Prefetch('meals', queryset=Meal.objects.order_by('mealdate', 'mealtime', 'id').prefetch_related(
+            Prefetch('mealfood_set', queryset=MealFood.objects.select_related('food').order_by('id')),
+        )),
+    )
+    serializer_class = NutritionSerializer
+    pagination_class = KeysetPagination
+
+class FoodViewSet(SparseFieldsetMixin, viewsets.ReadOnlyModelViewSet):
+    # The catalog changes rarely: responses are cached per catalog version and
+    # revalidated with ETags (see catalog.py).
+    queryset = Food.objects.all()
+    serializer_class = FoodSerializer
+    pagination_class = KeysetPagination
+
+    def list(self, request, *args, **kwargs):
+        return catalog_response(request, lambda: super(FoodViewSet, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return catalog_response(request, lambda: super(FoodViewSet, self).retrieve(request, *args, **kwargs))
 
 def set_goal_for_client(request):
     try: